@@ -2,30 +2,48 @@
 
 from __future__ import annotations
 
+import codecs
+import json
+import os
 import pprint
+import re
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+from array import array
+from bisect import bisect_right
 from collections import Counter
-from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import MISSING, dataclass, field, fields, replace
 from enum import Enum
-from itertools import batched, chain, pairwise
-from typing import Iterator, List
+from functools import cache, lru_cache, partial
+from itertools import chain, groupby, islice, pairwise
+from typing import Any, BinaryIO, Callable, ClassVar, Generator, Iterable, Iterator, List, Self
 
 from laser_prynter import pp
 
-from ansi_art_convert.encoding import SupportedEncoding, detect_encoding
+from ansi_art_convert import log
+from ansi_art_convert.encoding import SupportedEncoding, detect, detect_sampled
 from ansi_art_convert.font_data import FONT_ALIASES, FONT_OFFSETS, UNICODE_TO_CP437
-from ansi_art_convert.log import DEBUG, dprint
+from ansi_art_convert.log import dprint
+from ansi_art_convert.optimise import SGROptimiser
 from ansi_art_convert.sauce import SauceRecord, SauceRecordExtended
 from ansi_art_convert.terminals.alacritty import AlacrittyClient
 
 
-@dataclass
+@dataclass(slots=True)
 class ANSIToken:
+    # tokens are slotted to keep large token streams small, so subclasses must call their parent's
+    # __post_init__ explicitly (zero-arg super() doesn't work in slotted dataclasses before python 3.14).
+    # Tokens must never be mutated once constructed: the ones from .shared() and parse_escape_sequence are
+    # flyweights used by every caller (see TestSharedTokens). They aren't frozen dataclasses, as frozen would have
+    # to cover every token class and makes constructing the (unshared) text tokens 2-3x slower.
+    value_map: ClassVar[dict] = {}
     value: str
     value_name: str = field(default='')
-    value_map: dict = field(repr=False, default_factory=dict)
     original_value: str = field(init=False)
+    # terminal cells taken by the rendered token, set once at construction for the line-wrapping in gen_lines
+    cell_width: int = field(init=False, default=0, repr=False, compare=False)
 
     def __post_init__(self) -> None:
         self.original_value = self.value
@@ -51,23 +69,75 @@ def get_glyph_offset(font_name: str) -> int:
         raise ValueError(f'Unknown font_name: {font_name!r}')
 
 
-@dataclass
+@cache
+def glyph_translation_table(offset: int, cp437: bool = False) -> dict[int, str]:
+    'str.translate table moving chars 0x00-0xFF to the glyph offset, with UNICODE_TO_CP437 folded in for CP437 text.'
+    table = {n: chr(n + offset) for n in range(256)}
+    if cp437:
+        for codepoint, n in UNICODE_TO_CP437.items():
+            table[codepoint] = chr(n + offset) if n <= 255 else chr(codepoint)
+    return table
+
+
+# build the tables for every known font up-front, so tokenising never pays for them
+for _offset in sorted(set(FONT_OFFSETS.values())):
+    glyph_translation_table(_offset)
+    glyph_translation_table(_offset, cp437=True)
+
+
+# the fields of text and CP437 tokens that _from_parts sets from its arguments
+GLYPH_TOKEN_PARTS = frozenset({'value', 'value_name', 'original_value', 'cell_width', 'offset'})
+_other_field_defaults_cache: dict[type, tuple[tuple[str, Callable[[], Any]], ...]] = {}
+
+
+def other_field_defaults(cls: type[ANSIToken]) -> tuple[tuple[str, Callable[[], Any]], ...]:
+    '(name, default factory) of each field of a glyph token class that _from_parts has no argument for.'
+    try:
+        return _other_field_defaults_cache[cls]
+    except KeyError:
+        pass
+    defaults = []
+    for f in fields(cls):
+        if f.name in GLYPH_TOKEN_PARTS:
+            continue
+        if f.default_factory is not MISSING:
+            defaults.append((f.name, f.default_factory))
+        elif f.default is not MISSING:
+            defaults.append((f.name, lambda default=f.default: default))
+        else:
+            raise TypeError(f'{cls.__name__}.{f.name} has no default, so it can\'t be built from parts')
+    _other_field_defaults_cache[cls] = tuple(defaults)
+    return _other_field_defaults_cache[cls]
+
+
+@dataclass(slots=True)
 class TextToken(ANSIToken):
     offset: int = 0xE100
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        ANSIToken.__post_init__(self)
         self.value = TextToken._translate_chars(self.value, self.offset)
+        self.cell_width = len(self.value)
+
+    @classmethod
+    def _from_parts(cls, value: str, original_value: str, offset: int, value_name: str = '') -> Self:
+        '''
+        A token of already translated text, built without __post_init__ translating it again. Every field is set:
+        the parts given, cell_width from the value, and any field a subclass adds to its default.
+        '''
+        t = object.__new__(cls)
+        t.value = value
+        t.original_value = original_value
+        t.value_name = value_name
+        t.offset = offset
+        t.cell_width = len(value)
+        for name, default in other_field_defaults(cls):
+            setattr(t, name, default())
+        return t
 
     @staticmethod
     def _translate_chars(s: str, offset: int) -> str:
-        new_values = []
-        for v in s:
-            if ord(v) <= 255:  # and not (0x21 <= ord(v) <= 0x7e):
-                new_values.append(chr(ord(v) + offset))
-            else:
-                new_values.append(v)
-        return ''.join(new_values)
+        return s.translate(glyph_translation_table(offset))
 
     def repr(self) -> str:
         return '\n'.join([
@@ -114,15 +184,16 @@ C0_TOKEN_NAMES = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class C0Token(TextToken):
-    value_map: dict = field(repr=False, default_factory=lambda: C0_TOKEN_NAMES)
+    value_map: ClassVar[dict] = C0_TOKEN_NAMES
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        TextToken.__post_init__(self)
         self.value_name = self.value_map.get(ord(self.original_value), '')
         if self.value_name == 'CR':
             self.value = ''
+            self.cell_width = 0
 
     def repr(self) -> str:
         return '\n'.join([
@@ -169,20 +240,31 @@ CP_437_MAP = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class CP437Token(ANSIToken):
     offset: int = 0xE100
 
-    def _translate_char(self, ch: str) -> str:
-        n = UNICODE_TO_CP437.get(ord(ch), ord(ch))
-        if n <= 255:
-            return chr(n + self.offset)
-        else:
-            return ch
-
     def __post_init__(self) -> None:
-        super().__post_init__()
-        self.value = ''.join([self._translate_char(v) for v in self.original_value])
+        ANSIToken.__post_init__(self)
+        self.value = CP437Token._translate_chars(self.original_value, self.offset)
+        self.cell_width = len(self.value)
+
+    @classmethod
+    def _from_parts(cls, value: str, original_value: str, offset: int, value_name: str = '') -> Self:
+        'A token of already translated text, built without __post_init__ (see TextToken._from_parts).'
+        t = object.__new__(cls)
+        t.value = value
+        t.original_value = original_value
+        t.value_name = value_name
+        t.offset = offset
+        t.cell_width = len(value)
+        for name, default in other_field_defaults(cls):
+            setattr(t, name, default())
+        return t
+
+    @staticmethod
+    def _translate_chars(s: str, offset: int) -> str:
+        return s.translate(glyph_translation_table(offset, cp437=True))
 
     def repr(self) -> str:
         return '\n'.join([
@@ -212,9 +294,34 @@ ANSI_CONTROL_CODES = {
 }
 
 
-@dataclass
+def text_span(t: TextToken | CP437Token, start: int, end: int) -> TextToken | CP437Token:
+    '''
+    A token for t.value[start:end], built with _from_parts: the slice of already translated text is reused as-is
+    (translation is char for char, so original_value is sliced the same way). Fields a subclass adds are copied.
+    '''
+    span = t._from_parts(t.value[start:end], t.original_value[start:end], t.offset, t.value_name)
+    for name, _ in other_field_defaults(type(t)):
+        setattr(span, name, getattr(t, name))
+    return span
+
+
+def glyph_token_factory(cls: type[TextToken | CP437Token], offset: int) -> Callable[[str], ANSIToken]:
+    '''
+    A constructor of cls tokens from their original value, built with _from_parts (the same token as
+    cls(value=value, offset=offset), as text and CP437 tokens have no value names).
+    '''
+    table = glyph_translation_table(offset, cp437=cls is CP437Token)
+    from_parts = cls._from_parts
+
+    def token(original: str) -> ANSIToken:
+        return from_parts(original.translate(table), original, offset)
+
+    return token
+
+
+@dataclass(slots=True)
 class ControlToken(ANSIToken):
-    value_map: dict = field(repr=False, default_factory=lambda: ANSI_CONTROL_CODES)
+    value_map: ClassVar[dict] = ANSI_CONTROL_CODES
     subtype: str = field(init=False)
 
     def __post_init__(self) -> None:
@@ -222,6 +329,13 @@ class ControlToken(ANSIToken):
         self.subtype = self.value[-1]
         self.value_name = ANSI_CONTROL_CODES.get(self.subtype, '')
         self.value = self.value[2:]
+        if self.subtype == 'C':
+            try:
+                self.cell_width = max(int(self.value[:-1] or '1'), 0)
+            except ValueError:
+                pass  # not a plain count, str() raises when the token is rendered
+        elif self.subtype == 'H':
+            self.cell_width = 1
 
     def repr(self) -> str:
         lines = (
@@ -248,17 +362,17 @@ class ColourType(Enum):
     BG = 'bg'
 
 
-@dataclass
+@dataclass(slots=True)
 class ColorFGToken(ANSIToken):
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class ColorBGToken(ANSIToken):
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class TrueColorFGToken(ColorFGToken):
     colour_type: ColourType = field(repr=False, default=ColourType.FG)
 
@@ -274,7 +388,7 @@ class TrueColorFGToken(ColorFGToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class TrueColorBGToken(ColorBGToken):
     colour_type: ColourType = field(repr=False, default=ColourType.BG)
 
@@ -290,7 +404,7 @@ class TrueColorBGToken(ColorBGToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class Color256FGToken(ColorFGToken):
     colour_type: ColourType = field(repr=False, default=ColourType.FG)
 
@@ -306,7 +420,7 @@ class Color256FGToken(ColorFGToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class Color256BGToken(ColorBGToken):
     colour_type: ColourType = field(repr=False, default=ColourType.BG)
 
@@ -367,19 +481,22 @@ COLOUR_8_BG_VALUES = COLOUR_8_BG_VALUES | COLOUR_8_BG_BRIGHT_VALUES
 COLOUR_8_VALUES = COLOUR_8_FG_VALUES | COLOUR_8_BG_VALUES
 
 
-@dataclass
+@dataclass(slots=True)
 class Color8Token(ANSIToken):
     params: list[str] = field(default_factory=list)
     ice_colours: bool = field(repr=False, default=False)
     bright_bg: bool = field(init=False, default=False)
     bright_fg: bool = field(init=False, default=False)
-    sgr_tokens: list[SGRToken] = field(init=False, default_factory=list)
+    sgr_tokens: tuple[SGRToken, ...] = field(init=False, default=())
     fg_token: Color8FGToken | None = field(init=False, default=None)
     bg_token: Color8BGToken | None = field(init=False, default=None)
-    tokens: list[ANSIToken] = field(init=False, default_factory=list)
+    tokens: tuple[ANSIToken, ...] = field(init=False, default=())
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        ANSIToken.__post_init__(self)
+        # built up locally and stored as tuples, as these tokens are shared by parse_escape_sequence
+        sgr_tokens: list[SGRToken] = []
+        tokens: list[ANSIToken] = []
         for param in self.params:
             if param in SGR_CODES:
                 if self.ice_colours and param == '5':
@@ -387,30 +504,31 @@ class Color8Token(ANSIToken):
                     continue
                 elif param == '1':
                     self.bright_fg = True
-                t = SGRToken(value=param)
-                self.sgr_tokens.append(t)
-                self.tokens.append(t)
+                t = SGRToken.shared(param)
+                sgr_tokens.append(t)
+                tokens.append(t)
             elif param in COLOUR_8_FG_VALUES:
-                self.fg_token = Color8FGToken(value=param, bright=self.bright_fg)
-                self.tokens.append(self.fg_token)
+                self.fg_token = Color8FGToken.shared(param, self.bright_fg)
+                tokens.append(self.fg_token)
             elif param in COLOUR_8_BG_VALUES:
                 ice_colours = self.ice_colours and self.bright_bg
-                self.bg_token = Color8BGToken(value=param, ice_colours=ice_colours)
-                self.tokens.append(self.bg_token)
+                self.bg_token = Color8BGToken.shared(param, ice_colours)
+                tokens.append(self.bg_token)
+        self.sgr_tokens, self.tokens = tuple(sgr_tokens), tuple(tokens)
 
     def generate_tokens(self, curr_fg: ColorFGToken | None, curr_bg: ColorBGToken | None) -> Iterator[ANSIToken]:
         if self.sgr_tokens:
-            if SGRToken(value='0') in self.sgr_tokens:
-                curr_fg = Color8FGToken(value='37', bright=self.bright_fg)
-                curr_bg = Color8BGToken(value='40', ice_colours=self.bright_bg)
+            if SGRToken.shared('0') in self.sgr_tokens:
+                curr_fg = Color8FGToken.shared('37', self.bright_fg)
+                curr_bg = Color8BGToken.shared('40', self.bright_bg)
             yield from self.sgr_tokens
         if self.fg_token:
             yield self.fg_token
         else:
             if curr_fg is None:
-                yield Color8FGToken(value='37', bright=self.bright_fg)
+                yield Color8FGToken.shared('37', self.bright_fg)
             elif isinstance(curr_fg, Color8FGToken):
-                yield Color8FGToken(value=curr_fg.original_value, bright=self.bright_fg)
+                yield Color8FGToken.shared(curr_fg.original_value, self.bright_fg)
 
         bright_bg = False
         if self.bg_token and isinstance(self.bg_token, Color8BGToken) and self.bg_token.ice_colours:
@@ -421,12 +539,12 @@ class Color8Token(ANSIToken):
             bright_bg = True
 
         if self.bg_token:
-            yield Color8BGToken(value=self.bg_token.original_value, ice_colours=bright_bg)
+            yield Color8BGToken.shared(self.bg_token.original_value, bright_bg)
         else:
             if curr_bg is None:
-                yield Color8BGToken(value='40', ice_colours=bright_bg)
+                yield Color8BGToken.shared('40', bright_bg)
             elif isinstance(curr_bg, Color8BGToken):
-                yield Color8BGToken(value=curr_bg.original_value, ice_colours=bright_bg)
+                yield Color8BGToken.shared(curr_bg.original_value, bright_bg)
 
     def __str__(self) -> str:
         return f'\x1b[{self.value}m'
@@ -443,19 +561,25 @@ class Color8Token(ANSIToken):
         return '\n'.join(lines)
 
 
-@dataclass
+@dataclass(slots=True)
 class Color8FGToken(ColorFGToken):
-    value_map: dict = field(repr=False, default_factory=lambda: COLOUR_8_FG_VALUES)
+    value_map: ClassVar[dict] = COLOUR_8_FG_VALUES
     colour_type: ColourType = field(repr=False, default=ColourType.FG)
     bright: bool = False
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        ColorFGToken.__post_init__(self)
         if self.bright:
             base_value = int(self.value)
             if base_value < 90:
                 self.value = str(base_value + 60)
 
+    @staticmethod
+    @cache
+    def shared(value: str, bright: bool = False) -> Color8FGToken:
+        'Shared (flyweight) token instance, which must not be mutated.'
+        return Color8FGToken(value=value, bright=bright)
+
     def repr(self) -> str:
         return '\n'.join([
             f'\x1b[96m{self.__class__.__name__:<20}\x1b[0m'
@@ -468,18 +592,24 @@ class Color8FGToken(ColorFGToken):
         return f'\x1b[{self.value}m'
 
 
-@dataclass
+@dataclass(slots=True)
 class Color8BGToken(ColorBGToken):
-    value_map: dict = field(repr=False, default_factory=lambda: COLOUR_8_BG_VALUES)
+    value_map: ClassVar[dict] = COLOUR_8_BG_VALUES
     colour_type: ColourType = field(repr=False, default=ColourType.BG)
     ice_colours: bool = field(default=False)
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        ColorBGToken.__post_init__(self)
         self.original_value = self.value
         if self.ice_colours:
             self.value = str(int(self.value) + 60)
 
+    @staticmethod
+    @cache
+    def shared(value: str, ice_colours: bool = False) -> Color8BGToken:
+        'Shared (flyweight) token instance, which must not be mutated.'
+        return Color8BGToken(value=value, ice_colours=ice_colours)
+
     def repr(self) -> str:
         return '\n'.join([
             f'\x1b[94m{self.__class__.__name__:<20}\x1b[0m'
@@ -507,9 +637,15 @@ SGR_CODES = {
 }
 
 
-@dataclass
+@dataclass(slots=True)
 class SGRToken(ANSIToken):
-    value_map: dict = field(repr=False, default_factory=lambda: SGR_CODES)
+    value_map: ClassVar[dict] = SGR_CODES
+
+    @staticmethod
+    @cache
+    def shared(value: str) -> SGRToken:
+        'Shared (flyweight) token instance, which must not be mutated.'
+        return SGRToken(value=value)
 
     def __str__(self) -> str:
         return f'\x1b[{self.value}m'
@@ -522,8 +658,11 @@ class SGRToken(ANSIToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class NewLineToken(ANSIToken):
+    # index of the newline in the tokenised data (-1 when unknown), where rendering can resume from a checkpoint
+    position: int = field(default=-1, repr=False, compare=False)
+
     def __str__(self) -> str:
         return '\n'
 
@@ -534,7 +673,7 @@ class NewLineToken(ANSIToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class EOFToken(ANSIToken):
     def __str__(self) -> str:
         return ''
@@ -546,7 +685,7 @@ class EOFToken(ANSIToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class UnknownToken(ANSIToken):
     def repr(self) -> str:
         return '\n'.join([
@@ -555,18 +694,137 @@ class UnknownToken(ANSIToken):
         ])
 
 
-@dataclass
+@dataclass(slots=True)
 class EndOfFile(ANSIToken):
     value: str = ''
 
 
+class ScannerEngine(Enum):
+    CHAR = 'char'
+    REGEX = 'regex'
+    BYTES = 'bytes'
+
+
+# Char classes for the tokeniser state machines, ordered so that `kind <= CHAR_ALPHA` is plain text
+# (an alpha char only ends an escape sequence):
+CHAR_TEXT, CHAR_ALPHA, CHAR_ESC, CHAR_LF, CHAR_CR, CHAR_C0, CHAR_MULTIBYTE = range(7)
+
+
+def char_class(ch: str) -> int:
+    'Class of a single decoded char.'
+    if ch == '\x1b':
+        return CHAR_ESC
+    elif ch == '\n':
+        return CHAR_LF
+    elif ch == '\r':
+        return CHAR_CR
+    elif ord(ch) in C0_TOKEN_NAMES:
+        return CHAR_C0
+    elif ch.isalpha():
+        return CHAR_ALPHA
+    return CHAR_TEXT
+
+
+@cache
+def char_class_table(encoding: SupportedEncoding | None = None) -> bytes:
+    '''
+    256-entry char class table, indexed by code point (for decoded data) or, given an encoding, by byte value.
+    UTF-8 bytes >= 0x80 are only part of a multi-byte char, so are CHAR_MULTIBYTE.
+    '''
+    if encoding is None:
+        return bytes(char_class(chr(n)) for n in range(256))
+    elif encoding == SupportedEncoding.UTF_8:
+        return bytes(char_class(chr(n)) if n < 0x80 else CHAR_MULTIBYTE for n in range(256))
+    return bytes(char_class(bytes([n]).decode(encoding.value, errors='replace')) for n in range(256))
+
+
+# Searches for tokenise_chars: a char of any class above CHAR_ALPHA (ESC, LF, CR or another C0 char) ends a text
+# run, and an escape sequence runs over ASCII non-alpha chars to the next alpha char
+TEXT_END_PATTERN = re.compile(
+    '[' + ''.join(chr(n) for n, kind in enumerate(char_class_table()) if kind > CHAR_ALPHA) + ']'
+)
+ESCAPE_BODY_PATTERN = re.compile(r'[\x00-@\[-`{-\x7f]*')
+
+
+# One alternative per token kind, tried in order at each position:
+# - code:    ESC, then any non-alpha ASCII chars, then an optional ASCII alpha terminator
+#            (a missing terminator means EOF or a non-ASCII char, which tokenise_regex finishes by hand)
+# - newline: LF
+# - c0:      any other C0 control char
+# - text:    a run of everything else
+TOKEN_PATTERN = re.compile(
+    r'(?P<code>\x1b[\x00-@\[-`{-\x7f]*[A-Za-z]?)'
+    r'|(?P<newline>\n)'
+    r'|(?P<c0>[\x00-\x1f])'
+    r'|(?P<text>[^\x00-\x1f]+)'
+)
+
+
+def _byte_class(values: set[int]) -> bytes:
+    return b''.join(re.escape(bytes([b])) for b in sorted(values))
+
+
+@cache
+def bytes_token_pattern(encoding: SupportedEncoding) -> re.Pattern[bytes]:
+    'TOKEN_PATTERN for undecoded data, escape sequences end at any byte that decodes to an alpha char.'
+    # multi-byte UTF-8 chars can't be classified byte-by-byte, tokenise_bytes finishes those sequences by hand
+    classes = char_class_table(encoding)
+    final = {b for b in range(256) if classes[b] == CHAR_ALPHA}
+    body = {b for b in range(256) if classes[b] != CHAR_ALPHA and classes[b] != CHAR_MULTIBYTE}
+    return re.compile(
+        b'(?P<code>\x1b[' + _byte_class(body) + b']*[' + _byte_class(final) + b']?)'
+        b'|(?P<newline>\n)'
+        b'|(?P<c0>[\x00-\x1f])'
+        b'|(?P<text>[^\x00-\x1f]+)'
+    )
+
+
+ESCAPE_SEQUENCE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=ESCAPE_SEQUENCE_CACHE_SIZE)
+def parse_escape_sequence(code: str, ice_colours: bool) -> tuple[ANSIToken, ...]:
+    '''
+    Parse a complete ANSI escape sequence into tokens.
+    Art reuses the same few hundred sequences over and over, so the tokens are cached and shared (and must not be
+    mutated), see parse_escape_sequence.cache_info() for the hit rate.
+    '''
+    if len(code) < 3:
+        return (UnknownToken(value=code),)
+
+    # Handle custom true color format: \x1b[0;R;G;Bt (FG) or \x1b[1;R;G;Bt (BG)
+    if code.startswith('\x1b[') and code[-1] == 't':
+        params = code[2:-1].split(';')
+        if len(params) == 4 and params[0] in ['0', '1']:
+            mode, r, g, b = params
+            rgb_value = f'{int(r)},{int(g)},{int(b)}'
+            if mode == '0':
+                return (TrueColorBGToken(value=rgb_value),)
+            elif mode == '1':
+                return (TrueColorFGToken(value=rgb_value),)
+
+    if code.startswith('\x1b[') and code[-1] == 'm':
+        params = code[2:-1].split(';')
+        return (Color8Token(value=';'.join(params), params=params, ice_colours=ice_colours),)
+
+    elif code[-1] in ANSI_CONTROL_CODES:
+        return (ControlToken(value=code),)
+
+    return (UnknownToken(value=code),)
+
+
+# stands in for every text run when tokenising without text, see Tokeniser.tokenise_structure
+SKIPPED_TEXT = TextToken(value='')
+
+
 @dataclass
 class Tokeniser:
     fpath: str
     sauce: SauceRecordExtended
-    data: str
+    data: str | bytes | memoryview | Iterable[bytes]
     font_name: str
     encoding: SupportedEncoding = SupportedEncoding.CP437
+    scanner: ScannerEngine = ScannerEngine.CHAR
     tokens: list[ANSIToken] = field(default_factory=list, init=False)
     glyph_offset: int = field(init=False, default=0)
     ice_colours: bool = field(default=False)
@@ -595,70 +853,685 @@ class Tokeniser:
         else:
             self._textTokenType = TextToken
 
-        dprint(f'Using extended sauce: {self.sauce!r}')
-        dprint(f'Width: {self.width}, Glyph offset: {hex(self.glyph_offset)}, Ice colours: {self.ice_colours}')
+        dprint(lambda: f'Using extended sauce: {self.sauce!r}')
+        dprint(lambda: f'Width: {self.width}, Glyph offset: {hex(self.glyph_offset)}, Ice colours: {self.ice_colours}')
 
-    def create_tokens(self, code_chars: list[str]) -> list[ANSIToken]:
+    def create_tokens(self, code_chars: list[str] | str) -> list[ANSIToken]:
         'Create a token from a complete ANSI escape sequence.'
-        if len(code_chars) < 3:
-            return [UnknownToken(value=''.join(code_chars))]
-
-        # Handle custom true color format: \x1b[0;R;G;Bt (FG) or \x1b[1;R;G;Bt (BG)
-        if code_chars[0:2] == ['\x1b', '['] and code_chars[-1] == 't':
-            params = ''.join(code_chars[2:-1]).split(';')
-            if len(params) == 4 and params[0] in ['0', '1']:
-                mode, r, g, b = params
-                rgb_value = f'{int(r)},{int(g)},{int(b)}'
-                if mode == '0':
-                    return [TrueColorBGToken(value=rgb_value)]
-                elif mode == '1':
-                    return [TrueColorFGToken(value=rgb_value)]
-
-        if code_chars[0:2] == ['\x1b', '['] and code_chars[-1] == 'm':
-            params = ''.join(code_chars[2:-1]).split(';')
-            return [Color8Token(value=';'.join(params), params=params, ice_colours=self.ice_colours)]
-
-        elif code_chars[-1] in ANSI_CONTROL_CODES:
-            t = ControlToken(value=''.join(code_chars))
-            return [t]
-
-        return [UnknownToken(value=''.join(code_chars))]
-
-    def tokenise(self) -> Iterator[ANSIToken]:
-        'Tokenise ANSI escape sequences and text.'
-        isCode, currCode = False, []
-        currText: list[str] = []
-        for ch in self.data:
-            if ch == '\x1b':
-                isCode = True
-                currCode.append(ch)
-                if currText:
-                    yield self._textTokenType(value=''.join(currText), offset=self.glyph_offset)
-                    currText = []
-
-            elif isCode:
-                currCode.append(ch)
-                if ch.isalpha():
-                    isCode = False
-                    yield from self.create_tokens(currCode)
-                    currCode = []
+        code = code_chars if isinstance(code_chars, str) else ''.join(code_chars)
+        return list(parse_escape_sequence(code, self.ice_colours))
+
+    def tokenise_buffer(self) -> TokenBuffer:
+        'Tokenise the whole file into a compact, columnar TokenBuffer.'
+        return TokenBuffer.from_tokens(self.tokenise(), offset=self.glyph_offset, ice_colours=self.ice_colours)
+
+    def tokenise(self, start: int = 0) -> Iterator[ANSIToken]:
+        '''
+        Tokenise ANSI escape sequences and text, from the start index of the data (which must be at a token boundary,
+        e.g. just after a NewLineToken position).
+        Raw bytes data is always tokenised with tokenise_bytes, and an iterable of byte chunks with tokenise_stream
+        (which can only start at the beginning).
+        '''
+        if isinstance(self.data, str):
+            if self.scanner == ScannerEngine.CHAR:
+                return self.tokenise_chars(self.data, start)
+            return self.tokenise_regex(self.data, start)
+        elif isinstance(self.data, (bytes, bytearray, memoryview)):
+            return self.tokenise_bytes(self.data, start)
+        if start:
+            raise ValueError('Cannot tokenise a stream of chunks from a start offset')
+        return self.tokenise_stream(self.data)
+
+    def tokenise_structure(self, start: int = 0) -> Iterator[ANSIToken]:
+        '''
+        Tokenise without building text tokens (each text run is the shared SKIPPED_TEXT), for cheap passes that only
+        need the escape sequences, control chars and newlines.
+        '''
+        if isinstance(self.data, str):
+            return self.tokenise_regex(self.data, start, text=False)
+        elif isinstance(self.data, (bytes, bytearray, memoryview)):
+            return self._scan_bytes(self.data, final=True, pos=start, text=False)
+        raise ValueError('Cannot scan the structure of a stream of chunks')
+
+    def tokenise_bytes(self, data: bytes | memoryview, start: int = 0) -> Iterator[ANSIToken]:
+        'Tokenise undecoded data, only decoding each text run or escape sequence as it is yielded.'
+        yield from self._scan_bytes(data, final=True, pos=start)
+
+    def tokenise_stream(self, chunks: Iterable[bytes]) -> Iterator[ANSIToken]:
+        '''
+        Tokenise undecoded data as it arrives in chunks (e.g. file reads or a pipe), yielding the same tokens as
+        tokenise_bytes would for the whole data.
+        Any token cut off by the end of a chunk (an escape sequence, text run or multi-byte char) is carried over
+        to the next chunk, so memory is bounded by the chunk size plus the longest text run.
+        '''
+        pending, base = b'', 0
+        for chunk in chunks:
+            data = pending + chunk
+            pending = yield from self._scan_bytes(data, final=False, base=base)
+            base += len(data) - len(pending)
+        yield from self._scan_bytes(pending, final=True, base=base)
+
+    def _scan_bytes(
+        self, data: bytes | memoryview, final: bool, pos: int = 0, base: int = 0, text: bool = True
+    ) -> Generator[ANSIToken, None, bytes]:
+        '''
+        Scan undecoded data from pos, returning the unscanned tail, which is only non-empty when not final:
+        a trailing text run or unterminated escape sequence might continue in the next chunk.
+        base is the position of data in the whole stream, for NewLineToken positions.
+        Without text, text runs aren't decoded and are all yielded as SKIPPED_TEXT.
+        '''
+        encoding, end = self.encoding.value, len(data)
+        match = bytes_token_pattern(self.encoding).match
+        textTokenType, offset, debug = self._textTokenType, self.glyph_offset, log.DEBUG
+
+        while pos < end:
+            m = match(data, pos)
+            if m is None:  # unreachable, every byte matches one of the alternatives
+                break
+            start, kind, value, pos = pos, m.lastgroup, m.group(), m.end()
+            if kind == 'text':
+                if pos == end and not final:
+                    return bytes(data[start:])
+                if not text:
+                    yield SKIPPED_TEXT
+                    continue
+                run = value.decode(encoding)
+                if debug:
+                    self.counts.update((ch, hex(ord(ch))) for ch in run)
+                yield textTokenType(value=run, offset=offset)
+            elif kind == 'code':
+                code = value.decode(encoding)
+                if not code[-1].isalpha():
+                    # stopped at EOF or a multi-byte char, decode one byte at a time until any alpha char
+                    decoder = codecs.getincrementaldecoder(encoding)()
+                    while pos < end:
+                        ch = decoder.decode(data[pos : pos + 1])
+                        code, pos = code + ch, pos + 1
+                        if ch.isalpha():
+                            break
+                    else:
+                        return b'' if final else bytes(data[start:])
+                yield from self.create_tokens(code)
             else:
-                if DEBUG:
+                ch = chr(value[0])
+                if debug:
                     self.counts[(ch, hex(ord(ch)))] += 1
-                if ch == '\n':
-                    if currText:
-                        yield self._textTokenType(value=''.join(currText), offset=self.glyph_offset)
-                        currText = []
-                    yield NewLineToken(value=ch)
-                elif ord(ch) in C0_TOKEN_NAMES:
-                    if currText:
-                        yield self._textTokenType(value=''.join(currText), offset=self.glyph_offset)
-                        currText = []
-                    yield C0Token(value=ch, offset=self.glyph_offset)
+                if kind == 'newline':
+                    yield NewLineToken(value=ch, position=base + start)
                 else:
-                    currText.append(ch)
-        if currText:
-            yield self._textTokenType(value=''.join(currText), offset=self.glyph_offset)
+                    yield C0Token(value=ch, offset=offset)
+        return b''
+
+    def tokenise_regex(self, data: str, start: int = 0, text: bool = True) -> Iterator[ANSIToken]:
+        '''
+        Tokenise by matching whole spans with TOKEN_PATTERN, yields the same tokens as tokenise_chars.
+        Without text, text runs are all yielded as SKIPPED_TEXT.
+        '''
+        pos, end = start, len(data)
+        match = TOKEN_PATTERN.match
+        textTokenType, offset, debug = self._textTokenType, self.glyph_offset, log.DEBUG
+
+        while pos < end:
+            m = match(data, pos)
+            if m is None:  # unreachable, every char matches one of the alternatives
+                break
+            kind, value, pos = m.lastgroup, m.group(), m.end()
+            if kind == 'text':
+                if not text:
+                    yield SKIPPED_TEXT
+                    continue
+                if debug:
+                    self.counts.update((ch, hex(ord(ch))) for ch in value)
+                yield textTokenType(value=value, offset=offset)
+            elif kind == 'code':
+                if not value[-1].isalpha():
+                    # the ASCII-only pattern stopped early, keep going until any (unicode) alpha char
+                    start = pos
+                    while pos < end and not data[pos].isalpha():
+                        pos += 1
+                    if pos == end:
+                        return
+                    pos += 1
+                    value += data[start:pos]
+                yield from self.create_tokens(value)
+            else:
+                if debug:
+                    self.counts[(value, hex(ord(value)))] += 1
+                if kind == 'newline':
+                    yield NewLineToken(value=value, position=pos - 1)
+                else:
+                    yield C0Token(value=value, offset=offset)
+
+    def tokenise_chars(self, data: str, start: int = 0) -> Iterator[ANSIToken]:
+        '''
+        Tokenise ANSI escape sequences and text, driven by the class of each character.
+        Text runs and escape sequences are searched for in runs of chars (see TEXT_END_PATTERN), sliced out of data,
+        and only the char ending each run is classified, by char_class_table().
+        '''
+        offset, debug, end = self.glyph_offset, log.DEBUG, len(data)
+        classes = char_class_table()
+        text_end, escape_body = TEXT_END_PATTERN.search, ESCAPE_BODY_PATTERN.match
+
+        while start < end:
+            m = text_end(data, start)
+            i = end if m is None else m.start()
+            if start < i:
+                yield self._text_token(data[start:i])
+            if m is None:
+                break
+
+            ch = data[i]
+            kind = classes[ord(ch)]
+            if kind == CHAR_ESC:
+                body = escape_body(data, i + 1)  # always matches, if only an empty body
+                start = body.end() if body else i + 1
+                # the ASCII-only pattern stops early at a non-ASCII char, keep going until any (unicode) alpha char
+                while start < end and not data[start].isalpha():
+                    start += 1
+                if start == end:
+                    break  # unterminated at EOF
+                start += 1
+                yield from self.create_tokens(data[i:start])
+                continue
+
+            start = i + 1
+            if debug:
+                self.counts[(ch, hex(ord(ch)))] += 1
+            if kind == CHAR_LF:
+                yield NewLineToken(value=ch, position=i)
+            else:
+                yield C0Token(value=ch, offset=offset)
+
+    def _text_token(self, text: str) -> ANSIToken:
+        if log.DEBUG:
+            self.counts.update((ch, hex(ord(ch))) for ch in text)
+        return self._textTokenType(value=text, offset=self.glyph_offset)  # type: ignore[no-any-return]
+
+
+# token classes that a TokenBuffer can hold, the index of each class is its kind code
+TOKEN_KINDS: tuple[type[ANSIToken], ...] = (
+    TextToken,
+    CP437Token,
+    C0Token,
+    NewLineToken,
+    ControlToken,
+    Color8Token,
+    TrueColorFGToken,
+    TrueColorBGToken,
+    UnknownToken,
+)
+TOKEN_KIND_CODES = {cls: kind for kind, cls in enumerate(TOKEN_KINDS)}
+
+
+@dataclass
+class TokenBuffer:
+    '''
+    A whole token stream stored as columns rather than token objects:
+    - kinds:   the TOKEN_KINDS index of each token
+    - offsets: the span of each token's original value in text, token i is text[offsets[i]:offsets[i + 1]]
+    Iterating rebuilds each token from its span (only the columns are held). Art repeats the same few hundred
+    escape sequences and control chars, so those tokens are cached and shared (and must not be mutated, see
+    ANSIToken), while text tokens are built afresh by glyph_token_factory.
+    '''
+
+    offset: int = 0
+    ice_colours: bool = False
+    kinds: array[int] = field(default_factory=lambda: array('B'), repr=False)
+    offsets: array[int] = field(default_factory=lambda: array('I', [0]), repr=False)
+    text: str = field(default='', repr=False)
+    # one constructor per kind code taking the original value, built once from offset and ice_colours
+    factories: tuple[Callable[[str], ANSIToken], ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.factories = self._token_factories()
+
+    @staticmethod
+    def from_tokens(tokens: Iterable[ANSIToken], offset: int = 0, ice_colours: bool = False) -> TokenBuffer:
+        buf = TokenBuffer(offset=offset, ice_colours=ice_colours)
+        kinds, offsets, end = buf.kinds, buf.offsets, 0
+        parts: list[str] = []
+        for t in tokens:
+            kinds.append(TOKEN_KIND_CODES[type(t)])
+            parts.append(t.original_value)
+            end += len(t.original_value)
+            offsets.append(end)
+        buf.text = ''.join(parts)
+        return buf
+
+    def _token_factories(self) -> tuple[Callable[[str], ANSIToken], ...]:
+        'One constructor per kind code, taking the original value.'
+        ice_colours = self.ice_colours
+
+        def color8(value: str) -> ANSIToken:
+            return parse_escape_sequence(f'\x1b[{value}m', ice_colours)[0]
+
+        factories: list[Callable[[str], ANSIToken]] = []
+        for cls in TOKEN_KINDS:
+            if cls is Color8Token:
+                factories.append(lru_cache(maxsize=ESCAPE_SEQUENCE_CACHE_SIZE)(color8))
+            elif cls in (TextToken, CP437Token):
+                factories.append(glyph_token_factory(cls, self.offset))
+            elif cls is C0Token:
+                factories.append(lru_cache(maxsize=ESCAPE_SEQUENCE_CACHE_SIZE)(partial(cls, offset=self.offset)))
+            else:
+                factories.append(lru_cache(maxsize=ESCAPE_SEQUENCE_CACHE_SIZE)(cls))
+        return tuple(factories)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, i: int) -> ANSIToken:
+        i = range(len(self.kinds))[i]
+        return self.factories[self.kinds[i]](self.text[self.offsets[i] : self.offsets[i + 1]])
+
+    def __iter__(self) -> Iterator[ANSIToken]:
+        factories, text, offsets = self.factories, self.text, self.offsets
+        for kind, start, end in zip(self.kinds, offsets, islice(offsets, 1, None)):
+            yield factories[kind](text[start:end])
+
+    @property
+    def nbytes(self) -> int:
+        'Approximate memory held by the columns.'
+        return (
+            sys.getsizeof(self.text)
+            + self.kinds.buffer_info()[1] * self.kinds.itemsize
+            + self.offsets.buffer_info()[1] * self.offsets.itemsize
+        )
+
+
+class RenderEngine(Enum):
+    LINES = 'lines'
+    SCREEN = 'screen'
+
+
+SCREEN_ROW_BLOCK = 64
+# SGR attribute params (all but reset) -> their bit in the Screen attribute plane
+SCREEN_ATTRIBUTE_BITS = {param: 1 << i for i, param in enumerate(p for p in SGR_CODES if p != '0')}
+
+
+@dataclass
+class Screen:
+    '''
+    A virtual terminal: tokens are drawn into a grid of cells at the cursor, which every code in ANSI_CONTROL_CODES
+    moves (or erases/scrolls with), and the grid is then serialised row by row.
+    Cells live in flat array planes (glyph code point, fg/bg palette index and attribute bits), allocated
+    SCREEN_ROW_BLOCK rows at a time as the cursor reaches them.
+    The grid is the whole canvas rather than a terminal-sized window: ScrollUp/ScrollDown move the canvas contents,
+    and erased cells go back to unwritten (a default coloured space). Unknown escape sequences are dropped.
+    '''
+
+    width: int
+    glyphs: array[int] = field(default_factory=lambda: array('I'), repr=False)
+    fgs: array[int] = field(default_factory=lambda: array('H'), repr=False)
+    bgs: array[int] = field(default_factory=lambda: array('H'), repr=False)
+    attributes: array[int] = field(default_factory=lambda: array('H'), repr=False)
+    # colour escape sequences, indexed by the fg/bg planes (0 is the default colour)
+    palette: list[str] = field(default_factory=lambda: [''], repr=False)
+    # rows up to the last one holding a written cell
+    n_rows: int = 0
+    row: int = 0
+    col: int = 0
+    saved: tuple[int, int] = (0, 0)
+    _currFG: ColorFGToken | None = field(default=None, repr=False)
+    _currBG: ColorBGToken | None = field(default=None, repr=False)
+    _fg: int = field(default=0, repr=False)
+    _bg: int = field(default=0, repr=False)
+    _attributes: int = field(default=0, repr=False)
+    _paletteIndex: dict[str, int] = field(default_factory=dict, repr=False)
+    _handlers: dict[type, Callable[..., None]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.width < 1:
+            raise ValueError(f'Screen width must be positive, got {self.width}')
+        self._handlers = {
+            C0Token: self._draw_c0,
+            TextToken: self._draw_text,
+            CP437Token: self._draw_text,
+            NewLineToken: self._draw_newline,
+            ControlToken: self._draw_control,
+            Color8Token: self._draw_color8,
+            TrueColorFGToken: self._draw_truecolor,
+            TrueColorBGToken: self._draw_truecolor,
+        }
+
+    @property
+    def rows_allocated(self) -> int:
+        return len(self.attributes) // self.width
+
+    def feed(self, tokens: Iterable[ANSIToken]) -> None:
+        'Draw tokens onto the screen.'
+        handlers = self._handlers
+        for t in tokens:
+            handler = handlers.get(type(t))
+            if handler is None:
+                handler = next((handlers[base] for base in type(t).__mro__ if base in handlers), self._draw_nothing)
+                handlers[type(t)] = handler
+            handler(t)
+
+    def _ensure_rows(self, n: int) -> None:
+        'Allocate (blank) rows, in whole blocks, until there are at least n.'
+        if n <= self.rows_allocated:
+            return
+        blocks = -(-(n - self.rows_allocated) // SCREEN_ROW_BLOCK)
+        cells = blocks * SCREEN_ROW_BLOCK * self.width
+        self.glyphs.frombytes(bytes(cells * self.glyphs.itemsize))
+        self.fgs.frombytes(bytes(cells * self.fgs.itemsize))
+        self.bgs.frombytes(bytes(cells * self.bgs.itemsize))
+        self.attributes.frombytes(bytes(cells * self.attributes.itemsize))
+
+    def _colour_index(self, t: ANSIToken | None) -> int:
+        if t is None:
+            return 0
+        code = str(t)
+        if code not in self._paletteIndex:
+            self._paletteIndex[code] = len(self.palette)
+            self.palette.append(code)
+        return self._paletteIndex[code]
+
+    def _set_colours(self, fg: ColorFGToken | None, bg: ColorBGToken | None) -> None:
+        self._currFG, self._currBG = fg, bg
+        self._fg, self._bg = self._colour_index(fg), self._colour_index(bg)
+
+    def write(self, text: str) -> None:
+        'Write text at the cursor with the current colours, wrapping at the screen width.'
+        while text:
+            n = min(len(text), self.width - self.col)
+            self._ensure_rows(self.row + 1)
+            i = self.row * self.width + self.col
+            self.glyphs[i : i + n] = array('I', text[:n].encode('utf-32-le'))
+            self.fgs[i : i + n] = array('H', [self._fg]) * n
+            self.bgs[i : i + n] = array('H', [self._bg]) * n
+            self.attributes[i : i + n] = array('H', [self._attributes]) * n
+            self.n_rows = max(self.n_rows, self.row + 1)
+            text = text[n:]
+            self.col += n
+            if self.col == self.width:
+                self.row, self.col = self.row + 1, 0
+
+    def erase(self, start: int, end: int) -> None:
+        'Clear the cells between two (row * width + col) positions back to unwritten.'
+        end = min(end, len(self.attributes))
+        if end <= start:
+            return
+        n = end - start
+        self.glyphs[start:end] = array('I', bytes(n * self.glyphs.itemsize))
+        self.fgs[start:end] = array('H', bytes(n * self.fgs.itemsize))
+        self.bgs[start:end] = array('H', bytes(n * self.bgs.itemsize))
+        self.attributes[start:end] = array('H', bytes(n * self.attributes.itemsize))
+
+    def scroll(self, n: int) -> None:
+        'Move the canvas contents up n rows (or down, for negative n), blank rows fill in.'
+        if n > 0:
+            n = min(n, self.rows_allocated)
+            cells = n * self.width
+            for plane in (self.glyphs, self.fgs, self.bgs, self.attributes):
+                del plane[:cells]
+            self._ensure_rows(self.rows_allocated + n)
+            self.n_rows = max(self.n_rows - n, 0)
+        elif n < 0 and self.n_rows:
+            cells = -n * self.width
+            self.glyphs[0:0] = array('I', bytes(cells * self.glyphs.itemsize))
+            self.fgs[0:0] = array('H', bytes(cells * self.fgs.itemsize))
+            self.bgs[0:0] = array('H', bytes(cells * self.bgs.itemsize))
+            self.attributes[0:0] = array('H', bytes(cells * self.attributes.itemsize))
+            self.n_rows -= n
+
+    def _draw_nothing(self, t: ANSIToken) -> None:
+        pass
+
+    def _draw_text(self, t: TextToken | CP437Token) -> None:
+        self.write(t.value)
+
+    def _draw_c0(self, t: C0Token) -> None:
+        if t.value_name == 'CR':
+            self.col = 0
+        else:
+            self.write(t.value)
+
+    def _draw_newline(self, t: NewLineToken) -> None:
+        self.row, self.col = self.row + 1, 0
+
+    def _draw_color8(self, t: Color8Token) -> None:
+        fg, bg = self._currFG, self._currBG
+        for tok in t.generate_tokens(fg, bg):
+            if isinstance(tok, SGRToken):
+                if tok.value_name == 'Reset':
+                    fg, bg, self._attributes = None, None, 0
+                else:
+                    self._attributes |= SCREEN_ATTRIBUTE_BITS[tok.value]
+            elif isinstance(tok, ColorFGToken):
+                fg = tok
+            elif isinstance(tok, ColorBGToken):
+                bg = tok
+        self._set_colours(fg, bg)
+
+    def _draw_truecolor(self, t: TrueColorFGToken | TrueColorBGToken) -> None:
+        if isinstance(t, TrueColorFGToken):
+            self._set_colours(t, self._currBG)
+        else:
+            self._set_colours(self._currFG, t)
+
+    def _draw_control(self, t: ControlToken) -> None:
+        params = []
+        for p in t.value[:-1].split(';'):
+            try:
+                params.append(int(p) if p else 0)
+            except ValueError:
+                return  # not plain numbers, e.g. a private mode sequence
+        n = max(params[0], 1)  # a missing/zero count means 1
+        width = self.width
+        match t.subtype:
+            case 'A':
+                self.row = max(self.row - n, 0)
+            case 'B':
+                self.row += n
+            case 'C':
+                self.col = min(self.col + n, width - 1)
+            case 'D':
+                self.col = max(self.col - n, 0)
+            case 'E':
+                self.row, self.col = self.row + n, 0
+            case 'F':
+                self.row, self.col = max(self.row - n, 0), 0
+            case 'G':
+                self.col = min(n, width) - 1
+            case 'H' | 'f':
+                self.row = max(params[0], 1) - 1
+                self.col = min(max(params[1] if len(params) > 1 else 1, 1), width) - 1
+            case 'J':
+                cursor = self.row * width + self.col
+                if params[0] == 0:
+                    self.erase(cursor, len(self.attributes))
+                elif params[0] == 1:
+                    self.erase(0, cursor + 1)
+                elif params[0] == 2:
+                    self.erase(0, len(self.attributes))
+                    self.n_rows, self.row, self.col = 0, 0, 0
+            case 'K':
+                start, cursor = self.row * width, self.row * width + self.col
+                if params[0] == 0:
+                    self.erase(cursor, start + width)
+                elif params[0] == 1:
+                    self.erase(start, cursor + 1)
+                elif params[0] == 2:
+                    self.erase(start, start + width)
+            case 'S':
+                self.scroll(n)
+            case 'T':
+                self.scroll(-n)
+            case 's':
+                self.saved = (self.row, self.col)
+            case 'u':
+                self.row, self.col = self.saved
+
+    def _style(self, attributes: int, fg: int, bg: int) -> str:
+        'Escape sequences setting a cell style from scratch.'
+        codes = [f'\x1b[{param}m' for param, bit in SCREEN_ATTRIBUTE_BITS.items() if attributes & bit]
+        return ''.join(['\x1b[0m', *codes, self.palette[fg], self.palette[bg]])
+
+    def iter_lines(self) -> Iterator[str]:
+        'Serialise each row, up to its last written cell, re-styling only where the style changes.'
+        styles: dict[tuple[int, int, int], str] = {}
+        width = self.width
+        for row in range(self.n_rows):
+            start = row * width
+            glyphs = self.glyphs[start : start + width]
+            end = width
+            while end and not glyphs[end - 1]:
+                end -= 1
+            # unwritten cells are NUL, drawn as spaces
+            text = glyphs[:end].tobytes().decode('utf-32-le').replace('\0', ' ')
+            parts = []
+            pos = 0
+            cells = zip(
+                self.attributes[start : start + end], self.fgs[start : start + end], self.bgs[start : start + end]
+            )
+            for style, run in groupby(cells):
+                if style not in styles:
+                    styles[style] = self._style(*style)
+                n = len(list(run))
+                if pos or style != (0, 0, 0):  # each row starts with the default style
+                    parts.append(styles[style])
+                parts.append(text[pos : pos + n])
+                pos += n
+            parts.append('\x1b[0m\n')
+            yield ''.join(parts)
+
+    def render(self) -> str:
+        return ''.join(self.iter_lines())
+
+
+COALESCE_FG_TYPES = frozenset({Color8FGToken, Color256FGToken, TrueColorFGToken})
+COALESCE_BG_TYPES = frozenset({Color8BGToken, Color256BGToken, TrueColorBGToken})
+
+
+def coalesce_line(line: Iterable[ANSIToken]) -> str:
+    '''
+    Serialise a rendered line as runs: colour/SGR tokens only update the pending attributes, which are emitted once,
+    and only if they changed, before the next printable token. Changes that only add attributes/colours are emitted
+    as just those, anything that removes one is emitted as a reset followed by the full set.
+    Lines from gen_lines always end with a reset, so each line starts (and ends) with the default attributes.
+    (UnknownTokens are never SGR sequences, those always parse as a Color8Token, so they pass through as text.)
+    '''
+    parts: list[str] = []
+    attributes: frozenset[str] = frozenset()
+    fg: ANSIToken | None = None
+    bg: ANSIToken | None = None
+    # what has been emitted, colours are compared by identity (colour tokens are shared), at worst re-emitting one
+    e_attributes, e_fg, e_bg = attributes, fg, bg
+    for t in line:
+        cls = type(t)
+        if cls is SGRToken:
+            if t.value == '0':
+                attributes, fg, bg = frozenset(), None, None
+            else:
+                attributes |= {t.value}
+        elif cls in COALESCE_FG_TYPES:
+            fg = t
+        elif cls in COALESCE_BG_TYPES:
+            bg = t
+        else:
+            s = str(t)
+            if not s:
+                continue
+            if fg is not e_fg or bg is not e_bg or attributes != e_attributes:
+                if e_attributes <= attributes and (fg or not e_fg) and (bg or not e_bg):
+                    parts.extend(f'\x1b[{a}m' for a in sorted(attributes - e_attributes, key=int))
+                    if fg is not e_fg:
+                        parts.append(str(fg))
+                    if bg is not e_bg:
+                        parts.append(str(bg))
+                else:
+                    parts.append('\x1b[0m')
+                    parts.extend(f'\x1b[{a}m' for a in sorted(attributes, key=int))
+                    parts.extend(str(c) for c in (fg, bg) if c)
+                e_attributes, e_fg, e_bg = attributes, fg, bg
+            parts.append(s)
+    if (e_attributes or e_fg or e_bg) and not (attributes or fg or bg):
+        parts.append('\x1b[0m')  # leave the terminal reset
+    return ''.join(parts)
+
+
+CHECKPOINT_EVERY = 1000
+CHECKPOINT_SUFFIX = '.lines.json'
+CHECKPOINT_VERSION = 1
+
+
+def _checkpoint_token(t: ANSIToken | None) -> list | None:
+    'A JSON-able [type name, value(, flag)] for a current colour/SGR token.'
+    if isinstance(t, Color8FGToken):
+        return ['Color8FGToken', t.original_value, t.bright]
+    if isinstance(t, Color8BGToken):
+        return ['Color8BGToken', t.original_value, t.ice_colours]
+    return None if t is None else [type(t).__name__, t.value]
+
+
+def _checkpoint_token_from(state: list | None) -> ANSIToken | None:
+    if state is None:
+        return None
+    name, value, *flag = state
+    if name == 'Color8FGToken':
+        return Color8FGToken.shared(value, *flag)
+    if name == 'Color8BGToken':
+        return Color8BGToken.shared(value, *flag)
+    if name == 'SGRToken':
+        return SGRToken.shared(value)
+    cls = {c.__name__: c for c in (TrueColorFGToken, TrueColorBGToken, Color256FGToken, Color256BGToken)}[name]
+    return cls(value=value)  # type: ignore[no-any-return]
+
+
+@dataclass
+class RenderCheckpoint:
+    'Renderer state at the start of an output line that begins right after a newline in the data.'
+
+    line: int
+    # index into the tokenised data just after the newline
+    offset: int
+    fg: ColorFGToken | None = None
+    bg: ColorBGToken | None = None
+    sgr: ANSIToken | None = None
+    new_line: bool = True
+
+    def asdict(self) -> list:
+        return [
+            self.line,
+            self.offset,
+            _checkpoint_token(self.fg),
+            _checkpoint_token(self.bg),
+            _checkpoint_token(self.sgr),
+            self.new_line,
+        ]
+
+    @staticmethod
+    def from_dict(state: list) -> RenderCheckpoint:
+        line, offset, fg, bg, sgr, new_line = state
+        return RenderCheckpoint(
+            line,
+            offset,
+            _checkpoint_token_from(fg),  # type: ignore[arg-type]
+            _checkpoint_token_from(bg),  # type: ignore[arg-type]
+            _checkpoint_token_from(sgr),
+            new_line,
+        )
+
+
+def parse_line_range(value: str) -> tuple[int, int | None]:
+    'Parse a python slice-like "A:B" (or "A:", ":B") line range, for --lines.'
+    start, sep, stop = value.partition(':')
+    try:
+        if not sep:
+            raise ValueError
+        line_range = int(start or 0), int(stop) if stop else None
+    except ValueError:
+        raise ArgumentTypeError(f'Line range must look like A:B, got {value!r}') from None
+    if line_range[0] < 0 or (line_range[1] is not None and line_range[1] < line_range[0]):
+        raise ArgumentTypeError(f'Line range must be 0 <= A <= B, got {value!r}')
+    return line_range
+
+
+WRITE_FLUSH_BYTES = 64 * 1024
+# a Renderer method handling one token (and the token after it), returning any finished lines
+TokenHandler = Callable[..., list[list[ANSIToken]] | None]
 
 
 @dataclass
@@ -670,15 +1543,46 @@ class Renderer:
     _currFG: ColorFGToken | None = field(default=None, repr=False)
     _currBG: ColorBGToken | None = field(default=None, repr=False)
     _currSGR: ANSIToken | None = field(default=None, repr=False)
+    # an alternative token source to tokeniser.tokenise(), e.g. a TokenBuffer
+    tokens: Iterable[ANSIToken] | None = field(default=None, repr=False)
+    optimiser: SGROptimiser | None = field(default=None, repr=False)
+    engine: RenderEngine = RenderEngine.LINES
+    # serialise lines with coalesce_line, emitting each attribute change once per run
+    coalesce: bool = False
     width: int = field(init=False)
+    # gen_lines state: the newline ending each line (none after cursor positioning), and tokens left to skip
+    _newLine: list[ANSIToken] = field(init=False, default_factory=list, repr=False)
+    _skips: int = field(init=False, default=0, repr=False)
+    # token class -> bound handler method, subclasses are added as they are seen
+    _handlers: dict[type, TokenHandler] = field(init=False, repr=False)
+    # record a checkpoint roughly every this many output lines (0 to disable), see iter_line_range
+    checkpoint_every: int = 0
+    checkpoints: list[RenderCheckpoint] = field(default_factory=list, repr=False)
+    # only render output lines start:stop (from the nearest checkpoint)
+    line_range: tuple[int, int | None] | None = None
+    _lineNo: int = field(init=False, default=0, repr=False)
+    _nextCheckpoint: int = field(init=False, default=0, repr=False)
+    _resume: RenderCheckpoint | None = field(init=False, default=None, repr=False)
+    # render segments of the data in this many worker processes, see iter_parallel
+    jobs: int = 1
 
     def __post_init__(self) -> None:
         self.width = self.tokeniser.width
+        self._handlers = {
+            Color8Token: self._render_color8,
+            TrueColorFGToken: self._render_truecolor_fg,
+            TrueColorBGToken: self._render_truecolor_bg,
+            ControlToken: self._render_control,
+            TextToken: self._render_text,
+            CP437Token: self._render_text,
+            NewLineToken: self._render_newline,
+        }
 
     def split_text_token(self, t: TextToken | CP437Token, remainder: int) -> Iterator[ANSIToken]:
-        s = str(t)
-        for chunk in [s[:remainder]] + list(map(''.join, batched(s[remainder:], self.width))):
-            yield t.__class__(value=chunk, offset=t.offset)
+        'Split at remainder chars, then every width chars, into spans of the token.'
+        yield text_span(t, 0, remainder)
+        for start in range(remainder, len(t.value), self.width):
+            yield text_span(t, start, start + self.width)
 
     def _add_current_colors(self) -> None:
         'Re-add current FG/BG colors to the current line.'
@@ -689,125 +1593,530 @@ class Renderer:
         if self._currBG:
             self._currLine.append(self._currBG)
 
+    def _resolve_handler(self, cls: type) -> TokenHandler:
+        'Find the handler for a token class via its nearest handled base class, and cache it.'
+        handler = next((self._handlers[base] for base in cls.__mro__ if base in self._handlers), self._render_other)
+        self._handlers[cls] = handler
+        return handler
+
     def gen_lines(self) -> Iterator[list[ANSIToken]]:
         'Split tokens into lines at width, or each newline char'
 
-        newLine: list[ANSIToken] = [NewLineToken(value='\n')]
-        skips = 0
-
-        for t, tNext in pairwise(chain(self.tokeniser.tokenise(), [EndOfFile()])):
-            if skips > 0:
-                skips -= 1
+        self._skips, start = 0, 0
+        if self._resume is None:
+            self._newLine, self._lineNo = [NewLineToken(value='\n')], 0
+        else:
+            c = self._resume
+            self._currFG, self._currBG, self._currSGR = c.fg, c.bg, c.sgr
+            self._newLine = [NewLineToken(value='\n')] if c.new_line else []
+            self._lineNo, start = c.line, c.offset
+            self._currLine, self._currLength = [], 0
+            self._add_current_colors()
+        self._nextCheckpoint = self._lineNo + self.checkpoint_every
+        handlers = self._handlers
+        resolve = self._resolve_handler
+
+        source = self.tokeniser.tokenise(start) if self.tokens is None else self.tokens
+        for t, tNext in pairwise(chain(source, [EndOfFile()])):
+            if self._skips > 0:
+                self._skips -= 1
                 continue
-            dprint(
-                f'Processing token: {t}\x1b[0m, current line length: {self._currLength}, width: {self.width} token type: {type(t).__name__}, token len: {len(str(t))}'
+            if log.DEBUG:
+                dprint(
+                    f'Processing token: {t}\x1b[0m, current line length: {self._currLength}, width: {self.width} token type: {type(t).__name__}, token len: {t.cell_width}'
+                )
+            handler = handlers.get(type(t)) or resolve(type(t))
+            lines = handler(t, tNext)
+            if lines:
+                yield from lines
+                self._lineNo += len(lines)
+                if self.checkpoint_every and self._lineNo >= self._nextCheckpoint and type(t) is NewLineToken:
+                    self._checkpoint(t, tNext)
+        if self._currLine:
+            yield self._currLine + [SGRToken.shared('0'), EOFToken(value='')]
+
+    def _checkpoint(self, t: NewLineToken, tNext: ANSIToken) -> None:
+        'Record the state after a line ended by newline token t, where rendering can resume from.'
+        if t.position < 0 or type(tNext) is EndOfFile:
+            # the line ending depends on the next token, which isn't known yet at the end of (partial) data
+            return
+        self._nextCheckpoint = self._lineNo + self.checkpoint_every
+        if self.checkpoints and self.checkpoints[-1].line >= self._lineNo:
+            return  # already known, e.g. when resumed from an earlier checkpoint
+        self.checkpoints.append(
+            RenderCheckpoint(
+                self._lineNo, t.position + 1, self._currFG, self._currBG, self._currSGR, bool(self._newLine)
             )
-            if isinstance(t, ControlToken) and t.subtype in ('H', 's'):
-                newLine = []
-
-            if isinstance(t, Color8Token):
-                tokens = list(t.generate_tokens(self._currFG, self._currBG))
-                self._currLine.extend(tokens)
-
-                for tok in tokens:
-                    if isinstance(tok, SGRToken):
-                        if tok.value_name == 'Reset':
-                            self._currFG, self._currBG, self._currSGR = None, None, None
-                        else:
-                            self._currSGR = tok
-                    elif isinstance(tok, Color8FGToken):
-                        self._currFG = tok
-                    elif isinstance(tok, Color8BGToken):
-                        self._currBG = tok
-
-            elif isinstance(t, TrueColorFGToken):
-                self._currLine.append(t)
-                self._currFG = t
-
-            elif isinstance(t, TrueColorBGToken):
-                self._currLine.append(t)
-                self._currBG = t
-
-            elif isinstance(t, ControlToken) and t.subtype == 'A':
-                if isinstance(tNext, C0Token) and tNext.value_name == 'CR':
-                    skips = 2
-                elif isinstance(tNext, ControlToken) and tNext.value_name == 'CursorForward':
-                    skips = 1
-
-            elif isinstance(t, (TextToken, CP437Token, ControlToken)):
-                dprint(f'Text/Control token: {t!r}, current line length: {self._currLength}, width: {self.width}')
-                if self._currLength + len(str(t)) == self.width:
-                    dprint(f'Exact fit for token: {t!r}, yielding line with reset and newline')
-                    yield self._currLine + [t, SGRToken(value='0')] + newLine
-                    self._currLine, self._currLength = [], 0
-                    self._add_current_colors()
-                    continue
-
-                if self._currLength + len(str(t)) < self.width:
-                    dprint(
-                        f'Adding token to current line: {t!r}, new line length would be: {self._currLength + len(str(t))}'
-                    )
-                    self._currLine.append(t)
-                    self._currLength += len(str(t))
-                    continue
+        )
 
+    def scan_splits(self, n: int) -> list[RenderCheckpoint]:
+        '''
+        Find newlines splitting the data into about n equal segments, with the renderer state at each (the line numbers
+        are unknown, so are -1). Only newlines that always end a line are used, see is_split_newline.
+        The state is found by a cheap pass (no text tokens or line wrapping, only the colour state) over a window of
+        data before the split, grown until it starts with a full reset (or the previous split), so the pass doesn't
+        have to cover the whole data.
+        Must be called on a new renderer.
+        '''
+        t = self.tokeniser
+        assert isinstance(t.data, (str, bytes, bytearray, memoryview))
+        data = t.data if isinstance(t.data, (str, bytes)) else bytes(t.data)
+        nl: Any = '\n' if isinstance(data, str) else b'\n'
+
+        def next_split(start: int, end: int) -> int:
+            'Position of the first newline in data[start:end] that the data can be split at, or -1.'
+            p = data.find(nl, start, end)
+            while p != -1 and not is_split_newline(data, p, t.encoding.value):
+                p = data.find(nl, p + 1, end)
+            return p
+
+        m = CURSOR_SAVE_PATTERN.search(data) if isinstance(data, str) else CURSOR_SAVE_BYTES_PATTERN.search(data)
+        first_save = m.start() if m else len(data)
+        prev = RenderCheckpoint(0, 0)
+        splits: list[RenderCheckpoint] = []
+        for target in (len(data) * i // n for i in range(1, n)):
+            p = next_split(max(target, prev.offset), len(data))
+            if p == -1:
+                break
+            window, state = SPLIT_SCAN_WINDOW, None
+            while state is None:
+                # the colour state is only tracked by a window when it can't start after a cursor position/save
+                start = next_split(p - window, p) if p - window > prev.offset and first_save > p else -1
+                if start == -1:
+                    state = self._scan_state(prev, prev.offset, p)
+                else:
+                    state = self._scan_state(None, start + 1, p)
+                window *= 4
+            splits.append(prev := state)
+        return splits
+
+    def _scan_state(self, start: RenderCheckpoint | None, offset: int, position: int) -> RenderCheckpoint | None:
+        '''
+        The state after the newline at position, from scanning the data from offset (just after another newline) with
+        the start state, or when that is unknown (None), from the first full reset on.
+        Returns None if the state is still unknown.
+        '''
+        known = start is not None
+        c = start or RenderCheckpoint(0, 0)
+        self._currFG, self._currBG, self._currSGR = c.fg, c.bg, c.sgr
+        self._newLine, self._skips = [NewLineToken(value='\n')] if c.new_line else [], 0
+        handlers: dict[type, TokenHandler] = {
+            Color8Token: self._render_color8,
+            TrueColorFGToken: self._render_truecolor_fg,
+            TrueColorBGToken: self._render_truecolor_bg,
+            TextToken: lambda t, tNext: None,
+        }
+
+        def resolve(cls: type) -> TokenHandler:
+            handler = next((handlers[base] for base in cls.__mro__ if base in handlers), self._render_other)
+            handlers[cls] = handler
+            return handler
+
+        reset = SGRToken.shared('0')
+        for t, tNext in pairwise(chain(self.tokeniser.tokenise_structure(offset), [EndOfFile()])):
+            if self._skips > 0:
+                self._skips -= 1
+            elif type(t) is NewLineToken:
+                self._currLine.clear()
+                if t.position == position:
+                    break
+            elif isinstance(t, ControlToken):
+                if t.subtype in ('H', 's'):
+                    self._newLine = []
+                elif t.subtype == 'A':
+                    self._render_control(t, tNext)
+            else:
+                if isinstance(t, Color8Token) and reset in t.sgr_tokens or t is reset:
+                    known = True  # the state after a reset doesn't depend on the state before it
+                (handlers.get(type(t)) or resolve(type(t)))(t, tNext)
+        else:
+            raise ValueError(f'No newline at {position} when scanning from {offset}')
+        if not known:
+            return None
+        return RenderCheckpoint(-1, position + 1, self._currFG, self._currBG, self._currSGR, bool(self._newLine))
+
+    def nearest_checkpoint(self, line: int) -> RenderCheckpoint | None:
+        'The last checkpoint at or before an output line.'
+        i = bisect_right([c.line for c in self.checkpoints], line)
+        return self.checkpoints[i - 1] if i else None
+
+    def _end_line(self, *tokens: ANSIToken) -> list[ANSIToken]:
+        'The finished current line (ending with tokens, a reset and newline), starting a new line in its place.'
+        line = self._currLine + [*tokens, SGRToken.shared('0')] + self._newLine
+        self._currLine, self._currLength = [], 0
+        self._add_current_colors()
+        return line
+
+    def _render_color8(self, t: Color8Token, tNext: ANSIToken) -> None:
+        tokens = list(t.generate_tokens(self._currFG, self._currBG))
+        self._currLine.extend(tokens)
+
+        for tok in tokens:
+            if isinstance(tok, SGRToken):
+                if tok.value_name == 'Reset':
+                    self._currFG, self._currBG, self._currSGR = None, None, None
+                else:
+                    self._currSGR = tok
+            elif isinstance(tok, Color8FGToken):
+                self._currFG = tok
+            elif isinstance(tok, Color8BGToken):
+                self._currBG = tok
+
+    def _render_truecolor_fg(self, t: TrueColorFGToken, tNext: ANSIToken) -> None:
+        self._currLine.append(t)
+        self._currFG = t
+
+    def _render_truecolor_bg(self, t: TrueColorBGToken, tNext: ANSIToken) -> None:
+        self._currLine.append(t)
+        self._currBG = t
+
+    def _render_control(self, t: ControlToken, tNext: ANSIToken) -> list[list[ANSIToken]] | None:
+        if t.subtype in ('H', 's'):
+            self._newLine = []
+        if t.subtype != 'A':
+            return self._render_text(t, tNext)
+        if isinstance(tNext, C0Token) and tNext.value_name == 'CR':
+            self._skips = 2
+        elif isinstance(tNext, ControlToken) and tNext.value_name == 'CursorForward':
+            self._skips = 1
+        return None
+
+    def _render_text(self, t: ANSIToken, tNext: ANSIToken) -> list[list[ANSIToken]] | None:
+        'Text, CP437 and (non cursor-up) control tokens, wrapped at width. C0Token is a TextToken, so ends up here too.'
+        if log.DEBUG:
+            dprint(f'Text/Control token: {t!r}, current line length: {self._currLength}, width: {self.width}')
+        width = t.cell_width
+        if self._currLength + width < self.width:
+            if log.DEBUG:
+                dprint(f'Adding token to current line: {t!r}, new line length would be: {self._currLength + width}')
+            self._currLine.append(t)
+            self._currLength += width
+            return None
+
+        if self._currLength + width == self.width:
+            if log.DEBUG:
+                dprint(f'Exact fit for token: {t!r}, yielding line with reset and newline')
+            return [self._end_line(t)]
+
+        if log.DEBUG:
+            dprint(
+                f'>> Token exceeds line width, splitting needed for token: {t!r}, current line length: {self._currLength}, token length: {width}'
+            )
+        if not isinstance(t, (TextToken, CP437Token)):
+            return None
+        lines = []
+        for chunk in self.split_text_token(t, self.width - self._currLength):
+            if log.DEBUG:
                 dprint(
-                    f'>> Token exceeds line width, splitting needed for token: {t!r}, current line length: {self._currLength}, token length: {len(str(t))}'
+                    f'>> Adding chunk to current line: {chunk}, chunk length: {chunk.cell_width}, new line length would be: {self._currLength + chunk.cell_width}'
                 )
-                if not isinstance(t, (TextToken, CP437Token)):
-                    continue
-                for chunk in self.split_text_token(t, self.width - self._currLength):
-                    dprint(
-                        f'>> Adding chunk to current line: {chunk}, chunk length: {len(str(chunk))}, new line length would be: {self._currLength + len(str(chunk))}'
-                    )
-                    self._currLine.append(chunk)
-                    self._currLength += len(str(chunk))
-
-                    if self._currLength == self.width:
-                        yield self._currLine + [SGRToken(value='0')] + newLine
+            self._currLine.append(chunk)
+            self._currLength += chunk.cell_width
 
-                        self._currLine, self._currLength = [], 0
-                        self._add_current_colors()
-
-                    elif self._currLength > self.width:
-                        raise ValueError(f'Logic error in line splitting, {self._currLength} > {self.width}')
-
-            elif isinstance(t, C0Token):
-                dprint(f'C0 Newline token: {t!r}, current line length: {self._currLength}, width: {self.width}')
-                if t.value_name == 'CR':
-                    continue
-
-            elif isinstance(t, NewLineToken):
-                dprint(f'NewLineToken: current line length: {self._currLength}, width: {self.width}')
-                if (isinstance(tNext, ControlToken) and tNext.value_name == 'CursorUp') and len(
-                    self._currLine
-                ) < self.width:
-                    continue
-                yield self._currLine + [SGRToken(value='0')] + newLine
-                self._currLine, self._currLength = [], 0
-                self._add_current_colors()
+            if self._currLength == self.width:
+                lines.append(self._end_line())
+            elif self._currLength > self.width:
+                raise ValueError(f'Logic error in line splitting, {self._currLength} > {self.width}')
+        return lines
 
+    def _render_newline(self, t: NewLineToken, tNext: ANSIToken) -> list[list[ANSIToken]] | None:
+        if log.DEBUG:
+            dprint(f'NewLineToken: current line length: {self._currLength}, width: {self.width}')
+        if (isinstance(tNext, ControlToken) and tNext.value_name == 'CursorUp') and len(self._currLine) < self.width:
+            return None
+        return [self._end_line()]
+
+    def _render_other(self, t: ANSIToken, tNext: ANSIToken) -> None:
+        if log.DEBUG:
+            dprint(f'Other token: {t!r}')
+        self._currLine.append(t)
+        if isinstance(t, SGRToken):
+            if t.value_name == 'Reset':
+                self._currFG, self._currBG, self._currSGR = None, None, None
             else:
-                dprint(f'Other token: {t!r}')
-                self._currLine.append(t)
-                if isinstance(t, SGRToken):
-                    if t.value_name == 'Reset':
-                        self._currFG, self._currBG, self._currSGR = None, None, None
-                    else:
-                        self._currSGR = t
-        if self._currLine:
-            yield self._currLine + [SGRToken(value='0'), EOFToken(value='')]
+                self._currSGR = t
 
     def iter_lines(self) -> Iterator[str]:
+        'Rendered lines (only those in line_range, if set), rewritten by the SGR optimiser if there is one.'
+        lines = self._iter_lines() if self.line_range is None else self.iter_line_range(*self.line_range)
+        if self.optimiser is None:
+            return lines
+        return self.optimiser.optimise(lines)
+
+    def iter_line_range(self, start: int, stop: int | None = None) -> Iterator[str]:
+        '''
+        Rendered output lines start:stop, tokenising and rendering only from the nearest checkpoint before start
+        (any new checkpoints passed on the way are recorded).
+        The screen engine, streams and other token sources can't resume, so always start from the beginning.
+        '''
+        resumable = (
+            self.engine == RenderEngine.LINES
+            and self.tokens is None
+            and isinstance(self.tokeniser.data, (str, bytes, bytearray, memoryview))
+        )
+        self._resume = self.nearest_checkpoint(start) if resumable else None
+        first = self._resume.line if self._resume else 0
+        lines = self._iter_lines()
+        return islice(lines, start - first, None if stop is None else max(stop - first, start - first))
+
+    def iter_parallel(self) -> Iterator[str]:
+        '''
+        Rendered lines, from segments of the data (split by scan_splits) rendered in jobs worker processes
+        and stitched back together in order, exactly the same as rendering serially.
+        '''
+        data = self.tokeniser.data
+        assert isinstance(data, (str, bytes, bytearray, memoryview))
+        splits = Renderer(fpath=self.fpath, tokeniser=self.tokeniser).scan_splits(self.jobs)
+        dprint(f'Rendering {len(splits) + 1} segments in {self.jobs} processes')
+        starts = [RenderCheckpoint(0, 0), *splits]
+        ends = [c.offset for c in splits] + [len(data)]
+        with ProcessPoolExecutor(self.jobs) as pool:
+            segments = [
+                pool.submit(
+                    render_segment,
+                    replace(
+                        self.tokeniser,
+                        data=data[c.offset : end] if isinstance(data, str) else bytes(data[c.offset : end]),
+                    ),
+                    replace(c, offset=0).asdict(),
+                    self.coalesce,
+                    i == len(splits),
+                )
+                for i, (c, end) in enumerate(zip(starts, ends))
+            ]
+            for segment in segments:
+                yield from segment.result()
+
+    def _iter_lines(self) -> Iterator[str]:
+        parallel = (
+            self.jobs > 1
+            and self.engine == RenderEngine.LINES
+            and self.tokens is None
+            and self._resume is None
+            and isinstance(self.tokeniser.data, (str, bytes, bytearray, memoryview))
+        )
+        if parallel:
+            yield from self.iter_parallel()
+            return
+        if self.engine == RenderEngine.SCREEN:
+            screen = Screen(width=self.width)
+            screen.feed(self.tokeniser.tokenise() if self.tokens is None else self.tokens)
+            yield from screen.iter_lines()
+            return
+        serialise = coalesce_line if self.coalesce else lambda line: ''.join(map(str, line))
         for i, line in enumerate(self.gen_lines()):
-            if DEBUG:
+            if log.DEBUG:
                 print(f'\n\x1b[30;103m[{i + 1}]:\x1b[0m\n{"\n".join([el.repr() for el in line])}')
-            yield ''.join(map(str, line))
+            yield serialise(line)
 
     def render(self) -> str:
         'Render tokens into a string with proper line wrapping.'
         return ''.join(list(self.iter_lines()))
 
+    def write(
+        self,
+        out: BinaryIO,
+        flush_bytes: int = WRITE_FLUSH_BYTES,
+        flush_lines: int = 0,
+        encoding: str = 'utf-8',
+    ) -> int:
+        '''
+        Render lines straight into a binary writer (e.g. sys.stdout.buffer) instead of one string.
+        Encoded lines are buffered, and written + flushed whenever flush_bytes or (if set) flush_lines is reached.
+        Returns the number of bytes written.
+        '''
+        pending: list[bytes] = []
+        n_pending = n_written = 0
+
+        def flush() -> None:
+            nonlocal n_pending, n_written
+            if log.DEBUG:
+                sys.stdout.flush()  # keep iter_lines' debug output in order
+            out.write(b''.join(pending))
+            out.flush()
+            n_written += n_pending
+            pending.clear()
+            n_pending = 0
+
+        for line in self.iter_lines():
+            b = line.encode(encoding)
+            pending.append(b)
+            n_pending += len(b)
+            if n_pending >= flush_bytes or len(pending) == flush_lines:
+                flush()
+        if pending:
+            flush()
+        return n_written
+
+    def checkpoint_key(self) -> dict:
+        'What the checkpoints depend on, a saved checkpoint file is only used if this matches.'
+        stat = os.stat(self.fpath)
+        t = self.tokeniser
+        return {
+            'version': CHECKPOINT_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'width': self.width,
+            'font_name': t.font_name,
+            'ice_colours': t.ice_colours,
+            'encoding': t.encoding.value,
+            # offsets index whatever the tokeniser scans, the decoded text or the raw bytes
+            'unit': 'chars' if isinstance(t.data, str) else 'bytes',
+            'every': self.checkpoint_every,
+        }
+
+    def load_checkpoints(self, fpath: str) -> None:
+        'Load checkpoints saved by save_checkpoints, unless the file is missing, unreadable or out of date.'
+        try:
+            with open(fpath) as f:
+                state = json.load(f)
+            if state['key'] != self.checkpoint_key():
+                dprint(f'Ignoring out of date checkpoints: {fpath}')
+                return
+            self.checkpoints = [RenderCheckpoint.from_dict(c) for c in state['checkpoints']]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            dprint(f'Not using checkpoints from {fpath}: {e!r}')
+
+    def save_checkpoints(self, fpath: str) -> None:
+        'Save the checkpoints as JSON, so that later line ranges of the same file can resume from them.'
+        try:
+            state = {'key': self.checkpoint_key(), 'checkpoints': [c.asdict() for c in self.checkpoints]}
+            with open(fpath, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+        except OSError as e:
+            dprint(f'Could not save checkpoints to {fpath}: {e!r}')
+
+
+# escape sequences that could be a cursor up, or a cursor position/save (ending in an ASCII letter, so a superset)
+CURSOR_UP_PATTERN = re.compile(r'\x1b[^A-Za-z]*A')
+CURSOR_UP_BYTES_PATTERN = re.compile(rb'\x1b[^A-Za-z]*A')
+CURSOR_SAVE_PATTERN = re.compile(r'\x1b[^A-Za-z]*[Hs]')
+CURSOR_SAVE_BYTES_PATTERN = re.compile(rb'\x1b[^A-Za-z]*[Hs]')
+# data scanned before a split for its renderer state, grown until the state is known
+SPLIT_SCAN_WINDOW = 16 * 1024
+
+
+def is_split_newline(data: str | bytes, p: int, encoding: str) -> bool:
+    '''
+    Whether the newline char at p is one that the line renderer always ends a line at, judged from the data around it
+    (conservatively, it may reject some that are): not inside an escape sequence, not skipped after a cursor up + CR,
+    and followed by something other than a cursor up.
+    '''
+    if p + 1 >= len(data):
+        return False
+    if isinstance(data, str):
+        if data[p - 2 : p] == 'A\r' or CURSOR_UP_PATTERN.match(data, p + 1):
+            return False
+        esc = data.rfind('\x1b', 0, p)
+        code = data[esc + 1 : p]
+    else:
+        if data[p - 2 : p] == b'A\r' or CURSOR_UP_BYTES_PATTERN.match(data, p + 1):
+            return False
+        esc = data.rfind(b'\x1b', 0, p)
+        code = data[esc + 1 : p].decode(encoding, errors='replace')
+    # an escape sequence runs to the first alpha char, so the newline is in one if there's none since the last ESC
+    return esc == -1 or any(map(str.isalpha, code))
+
+
+def render_segment(tokeniser: Tokeniser, checkpoint: list, coalesce: bool, last: bool) -> list[str]:
+    'Render the lines of one segment of the data (in a worker process), starting from the renderer state in checkpoint.'
+    r = Renderer(fpath=tokeniser.fpath, tokeniser=tokeniser, coalesce=coalesce)
+    r._resume = RenderCheckpoint.from_dict(checkpoint)
+    lines = list(r._iter_lines())
+    if r._currLine and not last:
+        lines.pop()  # the partial line at the end of the data, which the next segment starts from instead
+    return lines
+
+
+SESSION_VERSION = 1
+
+
+@dataclass
+class RenderSession:
+    '''
+    Incremental rendering of undecoded data that keeps growing, e.g. a capture that is still being written.
+    Each feed only renders from the last committed checkpoint (a newline whose line is final), and returns just the
+    lines that became final, so re-rendering a growing file is linear rather than quadratic.
+    The concatenation of every feed's lines plus tail() is exactly the renderer's full render of the data.
+    State is the checkpoint plus the uncommitted bytes after it (a partial line, text run or escape sequence),
+    which asdict/from_dict save and restore between runs.
+    '''
+
+    renderer: Renderer
+    checkpoint: RenderCheckpoint = field(default_factory=lambda: RenderCheckpoint(line=0, offset=0))
+    # undecoded data after checkpoint.offset, not rendered into final lines yet
+    pending: bytes = b''
+
+    def __post_init__(self) -> None:
+        if self.renderer.engine != RenderEngine.LINES:
+            raise ValueError('Only the lines render engine can render incrementally')
+
+    @property
+    def offset(self) -> int:
+        'Bytes of data seen so far, where the next feed continues from.'
+        return self.checkpoint.offset + len(self.pending)
+
+    def _render(self, final: bool) -> tuple[list[str], list[RenderCheckpoint]]:
+        r = self.renderer
+        r._resume, r.checkpoints, r.checkpoint_every = self.checkpoint, [], 1
+        r.tokens = r.tokeniser._scan_bytes(self.pending, final=final, base=self.checkpoint.offset)
+        try:
+            return list(r._iter_lines()), r.checkpoints
+        finally:
+            r._resume, r.tokens = None, None
+
+    def feed(self, data: bytes) -> list[str]:
+        'Add newly appended data, returning the lines that it completes.'
+        self.pending += data
+        lines, checkpoints = self._render(final=False)
+        if not checkpoints:
+            return []
+        c = checkpoints[-1]
+        self.pending = self.pending[c.offset - self.checkpoint.offset :]
+        lines, self.checkpoint = lines[: c.line - self.checkpoint.line], c
+        return lines
+
+    def tail(self) -> list[str]:
+        'The lines still pending, rendered as if the data ended here (without committing them).'
+        return self._render(final=True)[0]
+
+    def feed_file(self, fpath: str) -> list[str]:
+        'Feed whatever has been appended to a file since the last feed.'
+        with open(fpath, 'rb') as f:
+            f.seek(self.offset)
+            return self.feed(f.read())
+
+    def key(self) -> dict:
+        'The render settings the state depends on, saved state is only resumed if these match.'
+        t = self.renderer.tokeniser
+        return {
+            'version': SESSION_VERSION,
+            'width': self.renderer.width,
+            'font_name': t.font_name,
+            'ice_colours': t.ice_colours,
+            'encoding': t.encoding.value,
+            'coalesce': self.renderer.coalesce,
+        }
+
+    def asdict(self) -> dict:
+        return {
+            'key': self.key(),
+            'checkpoint': self.checkpoint.asdict(),
+            # any bytes, losslessly as a JSON string
+            'pending': self.pending.decode('latin-1'),
+        }
+
+    @staticmethod
+    def from_dict(renderer: Renderer, state: dict) -> RenderSession:
+        'Resume a session from asdict() state, or start a new one if it was saved with different render settings.'
+        session = RenderSession(renderer)
+        if state.get('key') != session.key():
+            dprint('Render settings changed, starting a new session')
+            return session
+        session.checkpoint = RenderCheckpoint.from_dict(state['checkpoint'])
+        session.pending = state['pending'].encode('latin-1')
+        return session
+
 
 def parse_args() -> dict:
     parser = ArgumentParser()
@@ -827,6 +2136,15 @@ def parse_args() -> dict:
         type=str,
         help='Specify the file encoding (cp437, iso-8859-1, ascii, utf-8) if the auto-detection was incorrect.',
     )
+    parser.add_argument(
+        '--detect-confidence',
+        type=int,
+        metavar='POINTS',
+        help=(
+            'Detect the encoding from sampled windows of the file (head, tail, middle, ...), stopping once one encoding '
+            'leads by POINTS, instead of reading every byte.'
+        ),
+    )
     parser.add_argument(
         '--sauce-only',
         '-s',
@@ -860,8 +2178,235 @@ def parse_args() -> dict:
         type=int,
         help='Specify the output width (overrides SAUCE tinfo1).',
     )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        default=False,
+        help=(
+            'Read and render the file in chunks with constant memory (use --fpath - to read from stdin, where a SAUCE'
+            ' record is stripped but not used, so its font and ice colours are ignored).'
+        ),
+    )
+    parser.add_argument(
+        '--optimise-sgr',
+        action='store_true',
+        default=False,
+        help='Only emit the colour/attribute changes needed, as single combined escape sequences.',
+    )
+    parser.add_argument(
+        '--coalesce',
+        action='store_true',
+        default=False,
+        help='Emit each colour/attribute change once per run of text, instead of with every token.',
+    )
+    parser.add_argument(
+        '--engine',
+        type=str,
+        choices=[e.value for e in RenderEngine],
+        default=RenderEngine.LINES.value,
+        help='Render engine, "screen" draws onto a virtual screen first, for art that moves the cursor around.',
+    )
+    parser.add_argument(
+        '--lines',
+        type=parse_line_range,
+        metavar='START:STOP',
+        help=(
+            'Only output lines START:STOP (0-based, STOP excluded, either can be omitted). '
+            f'Renderer state is checkpointed every {CHECKPOINT_EVERY} lines into FPATH{CHECKPOINT_SUFFIX}, '
+            'so later ranges skip straight to the nearest checkpoint.'
+        ),
+    )
+    parser.add_argument(
+        '--session',
+        type=str,
+        metavar='STATE',
+        help=(
+            'Render only what was appended to FPATH since the last run with the same STATE file (a JSON file, created '
+            'if missing). The unfinished last line is held back until it is complete. '
+            'Not with --stream, --sauce-only, --engine screen, --optimise-sgr, --lines or --jobs.'
+        ),
+    )
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        default=1,
+        help='Render segments of the file in this many processes (not with --stream or the screen engine).',
+    )
+    parser.add_argument(
+        '--scanner',
+        type=str,
+        choices=[e.value for e in ScannerEngine],
+        default=ScannerEngine.CHAR.value,
+        help='Tokeniser scanner engine, "regex" is faster on large files, "bytes" also skips decoding the whole file.',
+    )
 
-    return parser.parse_args().__dict__
+    args = parser.parse_args()
+    if args.session:
+        # a session renders lines as they are appended, which these need the whole file (or all lines) for, and
+        # --stream/--sauce-only are other modes of reading the file
+        unsupported = [
+            flag
+            for flag, is_set in (
+                ('--stream', args.stream),
+                ('--sauce-only', args.sauce_only),
+                ('--engine screen', args.engine == RenderEngine.SCREEN.value),
+                ('--optimise-sgr', args.optimise_sgr),
+                ('--lines', args.lines is not None),
+                ('--jobs', args.jobs != 1),
+            )
+            if is_set
+        ]
+        if unsupported:
+            parser.error(f'--session can\'t be combined with {", ".join(unsupported)}')
+    return args.__dict__
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# the most a SAUCE record and its comment block (up to 255 lines) take at the end of a file
+SAUCE_TAIL_SIZE = 128 + 5 + 255 * 64
+
+
+def read_chunks(f: BinaryIO, size: int = -1, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    'Read up to size bytes from f (or until EOF if size < 0) in chunks.'
+    while size != 0:
+        chunk = f.read(chunk_size if size < 0 else min(chunk_size, size))
+        if not chunk:
+            return
+        if size > 0:
+            size -= len(chunk)
+        yield chunk
+
+
+def strip_sauce_tail(chunks: Iterable[bytes], fpath: str, encoding: SupportedEncoding) -> Iterator[bytes]:
+    '''
+    The chunks without a trailing SAUCE record and comments, for input that can't be seeked to its end.
+    Only the last SAUCE_TAIL_SIZE bytes are held back, and the record is found too late to render with.
+    '''
+    tail = b''
+    for chunk in chunks:
+        tail += chunk
+        if len(tail) > 2 * SAUCE_TAIL_SIZE:
+            yield tail[:-SAUCE_TAIL_SIZE]
+            tail = tail[-SAUCE_TAIL_SIZE:]
+    sauce, data = SauceRecord.parse_record_bytes(tail, encoding.value)
+    if not sauce.is_empty():
+        dprint(f'Ignoring the SAUCE record at the end of the stream: {sauce}')
+        _, data = SauceRecordExtended.parse(sauce, data, fpath, encoding)
+    if data:
+        yield bytes(data)
+
+
+def resolve_encoding(args: dict, data: bytes, confidence: int | None = None) -> SupportedEncoding:
+    '''
+    The --encoding override, or else the encoding detected from data (sampled when a confidence is given).
+    When verbose, an override that disagrees with the detection is logged, with the rules behind it.
+    '''
+    detect_data = partial(detect, data) if confidence is None else partial(detect_sampled, data, confidence)
+    if args.get('encoding'):
+        encoding = SupportedEncoding.from_value(args['encoding'])
+        # only detected to explain a disagreement, when verbose
+        if log.DEBUG and (result := detect_data()).encoding != encoding:
+            dprint(f'Overriding detected encoding {result.encoding} with {encoding}:')
+            dprint(pprint.pformat(result.asdict()))
+        return encoding
+    result = detect_data()
+    dprint(f'Detected encoding: {result.encoding} (leading by {result.confidence} points)')
+    return result.encoding
+
+
+def main_stream(args: dict, renderer_kwargs: dict) -> None:
+    '''
+    Render a file (or stdin, when fpath is '-') chunk by chunk.
+    The encoding is detected from the first chunk, and for files the SAUCE record is read by seeking to the end.
+    Stdin can't be seeked, so its SAUCE record is only stripped from the art (see strip_sauce_tail).
+    '''
+    fpath = args['fpath']
+    with nullcontext(sys.stdin.buffer) if fpath == '-' else open(fpath, 'rb') as f:
+        first = f.read(STREAM_CHUNK_SIZE)
+        encoding = resolve_encoding(args, first)
+
+        chunks: Iterator[bytes]
+        if f.seekable():
+            sauce_extended, size = SauceRecordExtended.parse_file_tail(f, fpath, encoding)
+            f.seek(0)
+            chunks = read_chunks(f, size)
+        else:
+            sauce_extended, _ = SauceRecordExtended.parse(SauceRecord(), memoryview(b''), fpath, encoding)
+            chunks = strip_sauce_tail(chain([first], read_chunks(f)), fpath, encoding)
+
+        if args.pop('sauce_only'):
+            pp.enabled = True
+            pp.ppd(sauce_extended.asdict(), indent=2)
+            return
+
+        t = Tokeniser(**(args | {'encoding': encoding, 'sauce': sauce_extended, 'data': chunks}))
+        r = Renderer(fpath=fpath, tokeniser=t, **renderer_kwargs)
+        try:
+            if AlacrittyClient.session_is_custom_alacritty():
+                AlacrittyClient().with_font(t.font_name).update_config()
+            r.write(sys.stdout.buffer)
+        except BrokenPipeError as e:
+            dprint(f'BrokenPipeError: {e}')
+            sys.exit(1)
+
+        dprint(lambda: f'Escape sequence cache: {parse_escape_sequence.cache_info()}')
+        if r.optimiser:
+            dprint(r.optimiser.summary())
+
+
+def main_sauce(args: dict) -> None:
+    '''
+    Output the SAUCE record as JSON, reading it from the end of the file without reading the art data.
+    Only the first chunk is read to detect the encoding, when it isn't given, and a tied detection goes to the encoding
+    the record's font name implies (see SauceRecordExtended.font_encoding).
+    '''
+    fpath = args['fpath']
+    first = b''
+    if not args.get('encoding') or log.DEBUG:
+        with open(fpath, 'rb') as f:
+            first = f.read(STREAM_CHUNK_SIZE)
+    encoding = resolve_encoding(args, first)
+    if not args.get('encoding') and (result := detect(first)).confidence == 0:
+        # the font name is ASCII, and any byte decodes as CP437
+        sauce_extended, _ = SauceRecordExtended.read_file(fpath, SupportedEncoding.CP437)
+        font_encoding = SauceRecordExtended.font_encoding(sauce_extended.sauce.tinfo_s)
+        if font_encoding is not None and result.scores[font_encoding] == result.scores[encoding]:
+            dprint(f'Detection tied, font {sauce_extended.sauce.tinfo_s!r} -> encoding {font_encoding}')
+            encoding = font_encoding
+    sauce_extended, _ = SauceRecordExtended.read_file(fpath, encoding)
+    pp.enabled = True
+    pp.ppd(sauce_extended.asdict(), indent=2)
+
+
+def main_session(args: dict, renderer_kwargs: dict) -> None:
+    'Render the lines appended to a growing file since the last run, saving the session state for the next one.'
+    fpath, state_fpath = args['fpath'], args.pop('session')
+    with open(fpath, 'rb') as f:
+        first = f.read(STREAM_CHUNK_SIZE)
+    encoding = resolve_encoding(args, first)
+    args.pop('sauce_only')
+    args.pop('stream')
+
+    # a file that is still being written has no SAUCE record yet
+    sauce_extended, _ = SauceRecordExtended.parse(SauceRecord(), memoryview(b''), fpath, encoding)
+    t = Tokeniser(**(args | {'encoding': encoding, 'sauce': sauce_extended, 'data': b''}))
+    r = Renderer(fpath=fpath, tokeniser=t, **renderer_kwargs)
+    try:
+        with open(state_fpath) as f:
+            session = RenderSession.from_dict(r, json.load(f))
+    except FileNotFoundError:
+        session = RenderSession(r)
+    if os.path.getsize(fpath) < session.offset:
+        dprint('File is smaller than when last rendered, starting a new session')
+        session = RenderSession(r)
+
+    out = sys.stdout.buffer
+    for line in session.feed_file(fpath):
+        out.write(line.encode('utf-8'))
+    out.flush()
+    with open(state_fpath, 'w') as f:
+        json.dump(session.asdict(), f, separators=(',', ':'))
 
 
 def main() -> None:
@@ -873,42 +2418,64 @@ def main() -> None:
 
     if 'font_name' in args and args['font_name']:
         args['font_name'] = FONT_ALIASES[args['font_name']]
-    global DEBUG
-    DEBUG = args.pop('verbose')
-    pp.enabled = not DEBUG
+    args['scanner'] = ScannerEngine(args['scanner'])
+    log.set_debug(args.pop('verbose'))
+    pp.enabled = not log.DEBUG
+
+    optimiser = SGROptimiser() if args.pop('optimise_sgr') else None
+    renderer_kwargs = {
+        'optimiser': optimiser,
+        'engine': RenderEngine(args.pop('engine')),
+        'coalesce': args.pop('coalesce'),
+        'line_range': args.pop('lines'),
+        'jobs': args.pop('jobs'),
+    }
+    # stream and session detection only read the first chunk already
+    detect_confidence = args.pop('detect_confidence')
+    if args['session']:
+        return main_session(args, renderer_kwargs)
+    args.pop('session')
+    if args.pop('stream'):
+        return main_stream(args, renderer_kwargs)
+    if args.pop('sauce_only'):
+        return main_sauce(args)
 
     # Read file once
     with open(args['fpath'], 'rb') as f:
         file_data = f.read()
 
-    if args.get('encoding'):
-        encoding = SupportedEncoding.from_value(args['encoding'])
-    else:
-        encoding = detect_encoding(file_data)
-        dprint(f'Detected encoding: {encoding}')
-
-    sauce_only = args.pop('sauce_only')
-    sauce_record, data = SauceRecord.parse_record(file_data, encoding.value)
-    sauce_extended, data = SauceRecordExtended.parse(sauce_record, data, args['fpath'], encoding)
+    encoding = resolve_encoding(args, file_data, detect_confidence)
 
-    if sauce_only:
-        pp.enabled = True
-        pp.ppd(sauce_extended.asdict(), indent=2)
-        return
+    data: str | memoryview
+    if args['scanner'] == ScannerEngine.BYTES:
+        sauce_record, raw_data = SauceRecord.parse_record_bytes(file_data, encoding.value)
+        sauce_extended, data = SauceRecordExtended.parse(sauce_record, raw_data, args['fpath'], encoding)
+    else:
+        sauce_record, str_data = SauceRecord.parse_record(file_data, encoding.value)
+        sauce_extended, data = SauceRecordExtended.parse(sauce_record, str_data, args['fpath'], encoding)
 
     t = Tokeniser(**(args | {'encoding': encoding, 'sauce': sauce_extended, 'data': data}))
-    r = Renderer(fpath=args['fpath'], tokeniser=t)
+    r = Renderer(fpath=args['fpath'], tokeniser=t, **renderer_kwargs)
+    checkpoints_fpath = args['fpath'] + CHECKPOINT_SUFFIX
+    if r.line_range is not None:
+        r.checkpoint_every = CHECKPOINT_EVERY
+        r.load_checkpoints(checkpoints_fpath)
+    n_checkpoints = len(r.checkpoints)
     dprint('\nRendered string:')
     try:
         if AlacrittyClient.session_is_custom_alacritty():
             AlacrittyClient().with_font(t.font_name).update_config()
-        print(r.render(), end='')
+        r.write(sys.stdout.buffer)
     except BrokenPipeError as e:
         dprint(f'BrokenPipeError: {e}')
         sys.exit(1)
+    if len(r.checkpoints) > n_checkpoints:
+        r.save_checkpoints(checkpoints_fpath)
 
-    if DEBUG:
-        dprint(pprint.pformat(t.counts.most_common()))
+    dprint(lambda: pprint.pformat(t.counts.most_common()))
+    dprint(lambda: f'Escape sequence cache: {parse_escape_sequence.cache_info()}')
+    if optimiser:
+        dprint(optimiser.summary())
 
 
 if __name__ == '__main__':
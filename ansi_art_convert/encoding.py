@@ -1,11 +1,22 @@
 from __future__ import annotations
 
-from collections import Counter
+import hashlib
+from collections import Counter, deque
+from dataclasses import dataclass
 from enum import Enum
+from operator import itemgetter
+from types import MappingProxyType
+from typing import Iterator, Mapping, Sequence
 
 from laser_prynter import pp
 
-from ansi_art_convert.log import DEBUG, dprint
+try:
+    import numpy as np
+except ImportError:  # optional (the "fast" extra), only makes the byte histograms faster
+    np = None  # type: ignore[assignment]
+
+from ansi_art_convert import log
+from ansi_art_convert.log import dprint
 
 
 class SupportedEncoding(Enum):
@@ -89,40 +100,113 @@ ODD_ONES_OUT: list[dict] = [
     }
 ]
 
+# sampled detection reads the file in windows of this many bytes, until the leading encoding is this many points
+# ahead of the next one or the byte budget is spent
+SAMPLE_WINDOW = 64 * 1024
+SAMPLE_CONFIDENCE = 3
+SAMPLE_MAX_BYTES = 1024 * 1024
+# full detections are cached by a hash of the content, least recently used dropped first
+DETECTION_CACHE_SIZE = 64
 
-def detect_encoding(data: bytes) -> SupportedEncoding:
-    'Detect file encoding based on presence of CP437 block characters.'
-    points = Counter(list(SupportedEncoding.__members__.values()))
+
+# every byte value that the detection rules read from the histogram
+DETECTION_BYTES = frozenset({
+    *(byt for version in POPULAR_CHAR_MAP.values() for byt in version.values()),
+    *(byt for odd_char in ODD_ONES_OUT for byt in (*odd_char['char'], *odd_char['regulars'])),
+    *ISO_8859_1_BOX_MAP,
+    *CP437_SHADE_BLOCK_MAP,
+    *CP437_BLOCK_MAP,
+    *CP437_BOX_MAP,
+    *CP437_DOUBLE_BOX_MAP,
+})
+
+
+def byte_histogram(data: bytes) -> list[int]:
+    '''
+    Count of each byte value in data (all 256 buckets), in one pass: with numpy's bincount when numpy is installed
+    (the "fast" extra), otherwise with a Counter.
+    '''
+    if np is not None:
+        return np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256).tolist()  # type: ignore[no-any-return]
+    counts = Counter(data)
+    return [counts[byte] for byte in range(256)]
+
+
+def detection_histogram(data: bytes) -> list[int]:
+    '''
+    The byte counts that score_encodings reads: the full byte_histogram when numpy is installed, otherwise only the
+    DETECTION_BYTES buckets are filled, with one bytes.count each (faster than counting every byte in python).
+    '''
+    if np is not None:
+        return byte_histogram(data)
+    histogram = [0] * 256
+    for byte in DETECTION_BYTES:
+        histogram[byte] = data.count(byte)
+    return histogram
+
+
+@dataclass(frozen=True)
+class DetectionResult:
+    '''
+    The points each encoding scored, the detection_histogram they came from and a description of each rule that fired.
+    Immutable, as detect() returns the same cached result to every caller.
+    '''
+
+    scores: Mapping[SupportedEncoding, int]
+    histogram: tuple[int, ...]
+    rules: tuple[str, ...] = ()
+    # bytes the histogram was built from, less than the data size when sampled
+    sampled: int = 0
+
+    def _ranked(self) -> list[tuple[SupportedEncoding, int]]:
+        'Encodings by points, ties in SupportedEncoding order (like Counter.most_common).'
+        return sorted(self.scores.items(), key=itemgetter(1), reverse=True)
+
+    @property
+    def encoding(self) -> SupportedEncoding:
+        return self._ranked()[0][0]
+
+    @property
+    def confidence(self) -> int:
+        'How many points the detected encoding leads the next one by.'
+        (_, top), (_, second) = self._ranked()[:2]
+        return top - second
+
+    def asdict(self) -> dict:
+        return {
+            'encoding': self.encoding.value,
+            'confidence': self.confidence,
+            'scores': {k.value: v for k, v in self.scores.items()},
+            'rules': list(self.rules),
+            'sampled': self.sampled,
+        }
+
+
+def score_encodings(histogram: Sequence[int], sampled: int = 0) -> DetectionResult:
+    'Points for each encoding from the detection rules, reading byte counts from a detection_histogram.'
+    scores = Counter(list(SupportedEncoding.__members__.values()))
+    rules: list[str] = []
+
+    def award(encoding: SupportedEncoding, points: int, rule: str) -> None:
+        scores[encoding] += points
+        rules.append(f'[{encoding.value} +{points}] {rule}')
+        dprint(lambda: f'> {rules[-1]}')
 
     for char, version in POPULAR_CHAR_MAP.items():
         for encoding, byt in version.items():
-            count = data.count(byt)
+            count = histogram[byt]
             if count == 0:
                 continue
-            dprint(f'> [{encoding.value} +1] Detected popular character in file: {(char, encoding.value, count)}')
-            points[encoding] += 1
+            award(encoding, 1, f'Detected popular character in file: {(char, encoding.value, count)}')
 
     for odd_char in ODD_ONES_OUT:
-        for byt, replacement in odd_char['char'].items():
-            count = data.count(byt)
-            if count == 0:
-                break
-
-        odd_counts = []
-        for byt, replacement in odd_char['regulars'].items():
-            count = data.count(byt)
-            if count == 0:
-                continue
-            odd_counts.append((replacement, count))
+        odd_counts = [
+            (replacement, histogram[byt]) for byt, replacement in odd_char['regulars'].items() if histogram[byt]
+        ]
         if len(odd_counts) > 1:
-            dprint(
-                f'> [{odd_char["points_for"].value} +{odd_char["points"]}] Detected odd-one-out characters in file: {odd_counts}'
-            )
-            points[encoding] += odd_char['points']
+            award(odd_char['points_for'], odd_char['points'], f'Detected odd-one-out characters in file: {odd_counts}')
 
-    iso_box_counts: Counter[int] = Counter()
-    for byte in ISO_8859_1_BOX_MAP:
-        iso_box_counts[byte] = data.count(byte)
+    iso_box_total = sum(histogram[byte] for byte in ISO_8859_1_BOX_MAP)
 
     cp437_shade_counts: Counter[int] = Counter()
     cp437_box_counts: Counter[int] = Counter()
@@ -137,29 +221,89 @@ def detect_encoding(data: bytes) -> SupportedEncoding:
 
     for bytes, counts in all_counts:
         for byte in bytes:
-            count = data.count(byte)
-            if count > 0:
-                counts[byte] = count
+            if histogram[byte] > 0:
+                counts[byte] = histogram[byte]
 
     for c in (cp437_shade_counts, cp437_box_counts, cp437_block_counts):
         if c.total() > 0:
-            if DEBUG:
-                dprint(f'> [CP437 +1] Detected CP437 characters in file: {c}')
-            points[SupportedEncoding.CP437] += 1
+            award(SupportedEncoding.CP437, 1, f'Detected CP437 characters in file: {c}')
 
     cp437_all_counts = cp437_shade_counts | cp437_box_counts | cp437_block_counts
     if len(cp437_all_counts) > 1:
-        if cp437_all_counts.total() < iso_box_counts.total():
-            if DEBUG:
-                dprint(
-                    f'> [ISO +1] Detected more ISO-8859-1 box characters in file than CP437: {iso_box_counts.total()} vs {cp437_all_counts.total()}'
-                )
-            points[SupportedEncoding.ISO_8859_1] += 1
+        if cp437_all_counts.total() < iso_box_total:
+            award(
+                SupportedEncoding.ISO_8859_1,
+                1,
+                'Detected more ISO-8859-1 box characters in file than CP437: '
+                f'{iso_box_total} vs {cp437_all_counts.total()}',
+            )
         else:
-            if DEBUG:
-                dprint(f'> [CP437 +1] Detected CP437 characters in file: {cp437_all_counts}')
-            points[SupportedEncoding.CP437] += 1
+            award(SupportedEncoding.CP437, 1, f'Detected CP437 characters in file: {cp437_all_counts}')
+    return DetectionResult(MappingProxyType(scores), tuple(histogram), tuple(rules), sampled)
+
+
+# detect() results by a digest of the content (the data itself isn't kept), least recently used first
+_detection_cache: dict[bytes, DetectionResult] = {}
+
+
+def detect(data: bytes) -> DetectionResult:
+    'Score every byte of data, cached by a hash of its content so that repeated detections of the same data are free.'
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    result = _detection_cache.pop(digest, None)
+    if result is None:
+        result = score_encodings(detection_histogram(data), len(data))
+        if len(_detection_cache) >= DETECTION_CACHE_SIZE:
+            del _detection_cache[next(iter(_detection_cache))]
+    # (re)inserted last, as the most recently used
+    _detection_cache[digest] = result
+    return result
+
+
+def detect_encoding(data: bytes) -> SupportedEncoding:
+    'Detect file encoding based on presence of CP437 block characters.'
+    result = detect(data)
+    if log.DEBUG:
+        pp.ppd({'points': {k.name: v for k, v in result.scores.items()}}, indent=2)
+    return result.encoding
+
+
+def sample_windows(size: int, window: int = SAMPLE_WINDOW) -> Iterator[tuple[int, int]]:
+    '''
+    (start, end) of each window of a file of this size, in sampling order: the head, the tail, the middle, then the
+    middles of each half, quarter etc. until every window has been visited once.
+    '''
+    n = -(-size // window)
+    first = [0, n - 1] if n > 1 else [0] * n
+    intervals = deque([(0, n - 1)])
+    for i in first:
+        yield i * window, min(size, (i + 1) * window)
+    while intervals:
+        lo, hi = intervals.popleft()
+        if hi - lo < 2:
+            continue
+        mid = (lo + hi) // 2
+        yield mid * window, min(size, (mid + 1) * window)
+        intervals.extend(((lo, mid), (mid, hi)))
+
 
-    if DEBUG:
-        pp.ppd({'points': {k.name: v for k, v in points.items()}}, indent=2)
-    return points.most_common(1)[0][0]
+def detect_sampled(
+    data: bytes,
+    confidence: int = SAMPLE_CONFIDENCE,
+    window: int = SAMPLE_WINDOW,
+    max_bytes: int = SAMPLE_MAX_BYTES,
+) -> DetectionResult:
+    '''
+    Score sampled windows of data, stopping once the leading encoding has `confidence` more points than the next one
+    or `max_bytes` have been read. When every window is read, this is the same as detect(data).
+    Not cached, as hashing the content would read every byte.
+    '''
+    histogram, sampled = [0] * 256, 0
+    result = score_encodings(histogram)
+    for start, end in sample_windows(len(data), window):
+        histogram = [a + b for a, b in zip(histogram, detection_histogram(data[start:end]))]
+        sampled += end - start
+        result = score_encodings(histogram, sampled)
+        if result.confidence >= confidence or sampled >= max_bytes:
+            break
+    dprint(lambda: f'Sampled {sampled}/{len(data)} bytes, {result.encoding.value} leads by {result.confidence} points')
+    return result
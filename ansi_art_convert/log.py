@@ -1,9 +1,34 @@
+import logging
 import sys
 from typing import Any
 
+# read as `log.DEBUG` (not `from log import DEBUG`) so that set_debug() is seen everywhere,
+# hot loops should copy it into a local and guard their dprint calls with it
 DEBUG = False
 
+logger = logging.getLogger('ansi_art_convert')
+logger.addHandler(logging.NullHandler())
 
-def dprint(*args: Any, **kwargs: Any) -> None:
+_handler = logging.StreamHandler(sys.stderr)
+_handler.setFormatter(logging.Formatter('%(message)s'))
+
+
+def set_debug(enabled: bool) -> None:
+    'Enable/disable debug output on stderr.'
+    global DEBUG
+    DEBUG = enabled
+    logger.setLevel(logging.DEBUG if enabled else logging.WARNING)
+    if enabled:
+        logger.addHandler(_handler)
+    else:
+        logger.removeHandler(_handler)
+
+
+def dprint(*args: Any, sep: str = ' ') -> None:
+    '''
+    Log a debug message, made from args joined like print().
+    Any callable arg is only called (and formatted) when debug output is enabled, e.g.
+    `dprint(lambda: f'{token!r}')` costs nothing unless --verbose is set.
+    '''
     if DEBUG:
-        print(*args, **kwargs, file=sys.stderr)
+        logger.debug(sep.join(str(arg() if callable(arg) else arg) for arg in args))
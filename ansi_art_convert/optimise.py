@@ -0,0 +1,185 @@
+'''
+Output optimisation for rendered lines: tracks the terminal's SGR (colour/attribute) state and only emits the
+changes, as one combined sequence right before they are needed.
+'''
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple
+
+# any escape sequence (ESC, non-alpha chars, then an alpha terminator, the same rule as the tokeniser),
+# and the SGR sequences among them
+ESCAPE_PATTERN = re.compile(r'(\x1b[^A-Za-z]*[A-Za-z])')
+SGR_PATTERN = re.compile(r'\x1b\[([0-9;]*)m')
+
+SGR_ATTRIBUTES = {'1', '2', '3', '4', '5', '6', '7', '8', '9'}
+# the code that turns off each group of attributes
+SGR_ATTRIBUTES_OFF = {
+    '22': {'1', '2'},
+    '23': {'3'},
+    '24': {'4'},
+    '25': {'5', '6'},
+    '27': {'7'},
+    '28': {'8'},
+    '29': {'9'},
+}
+FG_VALUES = {str(n) for n in (*range(30, 38), *range(90, 98))}
+BG_VALUES = {str(n) for n in (*range(40, 48), *range(100, 108))}
+# art only uses a handful of distinct states and sequences, so applying/diffing them is memoised
+SGR_CACHE_SIZE = 4096
+
+
+class SGRState(NamedTuple):
+    'Colours are the SGR params that set them (e.g. "31" or "38;2;r;g;b"), or None for the default.'
+
+    fg: str | None = None
+    bg: str | None = None
+    attributes: frozenset[str] = frozenset()
+
+    @lru_cache(maxsize=SGR_CACHE_SIZE)  # noqa: B019 (states are small immutable values)
+    def apply(self, params: str) -> SGRState | None:
+        'The state after an SGR sequence with these params, or None if any param is not understood.'
+        fg, bg, attributes = self
+        values = params.split(';')
+        i = 0
+        while i < len(values):
+            v = values[i]
+            if v in ('', '0'):
+                fg, bg, attributes = None, None, frozenset()
+            elif v in SGR_ATTRIBUTES:
+                attributes |= {v}
+            elif v in SGR_ATTRIBUTES_OFF:
+                attributes -= SGR_ATTRIBUTES_OFF[v]
+            elif v in FG_VALUES:
+                fg = v
+            elif v in BG_VALUES:
+                bg = v
+            elif v == '39':
+                fg = None
+            elif v == '49':
+                bg = None
+            elif v in ('38', '48'):
+                n = {'5': 3, '2': 5}.get(values[i + 1] if i + 1 < len(values) else '', 0)
+                if not n or i + n > len(values):
+                    return None
+                colour = ';'.join(values[i : i + n])
+                if v == '38':
+                    fg = colour
+                else:
+                    bg = colour
+                i += n - 1
+            else:
+                return None
+            i += 1
+        return SGRState(fg, bg, attributes)
+
+    def params(self) -> list[str]:
+        'Params that set this state from scratch.'
+        return [
+            '0',
+            *sorted(self.attributes, key=int),
+            *([self.fg] if self.fg else []),
+            *([self.bg] if self.bg else []),
+        ]
+
+    @lru_cache(maxsize=SGR_CACHE_SIZE)  # noqa: B019 (states are small immutable values)
+    def transition(self, target: SGRState) -> str:
+        'The shortest SGR sequence changing this state into target.'
+        if target == SGRState():
+            return '\x1b[0m'
+        params = []
+        removed = self.attributes - target.attributes
+        for off, group in SGR_ATTRIBUTES_OFF.items():
+            if removed & group:
+                # the off code also clears any attribute in the group that stays on
+                params.append(off)
+                params.extend(sorted(target.attributes & group & self.attributes, key=int))
+        params.extend(sorted(target.attributes - self.attributes, key=int))
+        if target.fg != self.fg:
+            params.append(target.fg or '39')
+        if target.bg != self.bg:
+            params.append(target.bg or '49')
+        return '\x1b[' + min(';'.join(params), ';'.join(target.params()), key=len) + 'm'
+
+
+@dataclass
+class SGROptimiser:
+    '''
+    Rewrites rendered lines so that SGR sequences are only emitted right before printable output (text, spaces,
+    newlines or any non-SGR escape sequence), combined into one sequence holding only what changed.
+    Consecutive/redundant SGR sequences (e.g. a reset straight after a reset) disappear.
+    State is carried across lines, so one optimiser must see all lines of the output, in order.
+    '''
+
+    # None when the terminal state is unknown, after an SGR sequence that wasn't understood
+    current: SGRState | None = field(default_factory=SGRState)
+    desired: SGRState | None = field(default_factory=SGRState)
+    chars_in: int = 0
+    chars_out: int = 0
+
+    @property
+    def saved(self) -> int:
+        'Bytes saved so far (only ASCII escape sequences are ever dropped, so chars == bytes).'
+        return self.chars_in - self.chars_out
+
+    def summary(self) -> str:
+        return f'SGR optimiser saved {self.saved} bytes ({self.saved / (self.chars_in or 1):.1%} of the output)'
+
+    def optimise_line(self, line: str) -> str:
+        out: list[str] = []
+        for i, part in enumerate(ESCAPE_PATTERN.split(line)):
+            if not part:
+                continue
+            m = SGR_PATTERN.fullmatch(part) if i % 2 else None
+            if m is None:
+                self._flush(out)
+                out.append(part)
+                continue
+
+            params, state = m.group(1), self.desired
+            if state is None and params.split(';')[0] in ('', '0'):
+                state = SGRState()  # a leading reset makes the state known again
+            desired = state.apply(params) if state is not None else None
+            if desired is None:
+                # not understood, pass it through as-is and stop tracking until the next reset
+                self._flush(out)
+                out.append(part)
+                self.current = self.desired = None
+            else:
+                self.desired = desired
+
+        result = ''.join(out)
+        self.chars_in += len(line)
+        self.chars_out += len(result)
+        return result
+
+    def _flush(self, out: list[str]) -> None:
+        'Emit any pending change, before printable output.'
+        if self.desired is None or self.desired == self.current:
+            return
+        if self.current is None:
+            out.append('\x1b[' + ';'.join(self.desired.params()) + 'm')
+        else:
+            out.append(self.current.transition(self.desired))
+        self.current = self.desired
+
+    def finish(self) -> str:
+        'Output that leaves the terminal reset (as the unoptimised output always ends with a reset).'
+        if self.current == SGRState():
+            return ''
+        self.current = self.desired = SGRState()
+        self.chars_out += len('\x1b[0m')
+        return '\x1b[0m'
+
+    def optimise(self, lines: Iterable[str]) -> Iterator[str]:
+        'Optimise each line, with any final reset added to the last line.'
+        prev = None
+        for line in lines:
+            if prev is not None:
+                yield prev
+            prev = self.optimise_line(line)
+        if prev is not None:
+            yield prev + self.finish()
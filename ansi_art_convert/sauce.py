@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import os
+import struct
 from itertools import batched
-from typing import Any, NamedTuple, Tuple
+from typing import BinaryIO, Iterator, NamedTuple, Tuple, TypeVar
 
 from ansi_art_convert.encoding import SupportedEncoding
 from ansi_art_convert.font_data import FILE_DATA_TYPES, FONT_DATA
@@ -27,6 +28,11 @@ LETTER_SPACING_MAP = {
     (1, 1): 'Not currently a valid value.',
 }
 TINFO_NAMES = ['tinfo1', 'tinfo2', 'tinfo3', 'tinfo4']
+# the 128-byte SAUCE record, one item per SauceRecord field (see SauceRecord.offsets())
+SAUCE_STRUCT = struct.Struct('<5s2s35s20s20s8sIBBHHHHBB22s')
+
+# file data is either decoded up-front, or kept as raw (undecoded) bytes
+FileData = TypeVar('FileData', str, memoryview)
 
 
 class SauceRecordExtended(NamedTuple):
@@ -76,6 +82,20 @@ class SauceRecordExtended(NamedTuple):
     def parse_font(font_name: str) -> dict:
         return FONT_DATA.get(font_name, {})
 
+    @staticmethod
+    def font_encoding(font_name: str) -> SupportedEncoding | None:
+        '''
+        The encoding implied by a SAUCE font name: code page 437 for the IBM fonts (unless they name another code
+        page, as "IBM VGA ###"), ISO-8859-1 for the Amiga fonts, otherwise None.
+        '''
+        name = font_name.strip()
+        if name.startswith('IBM '):
+            code_page = name.rpartition(' ')[2]
+            return SupportedEncoding.CP437 if not code_page.isdigit() or code_page == '437' else None
+        elif name.startswith('Amiga '):
+            return SupportedEncoding.ISO_8859_1
+        return None
+
     @staticmethod
     def parse_tinfo_field(tinfo_key: str, sauce: SauceRecord) -> dict:
         if sauce.data_type == 5:
@@ -97,8 +117,8 @@ class SauceRecordExtended(NamedTuple):
 
     @staticmethod
     def parse(
-        sauce: SauceRecord, file_data: str, fpath: str, encoding: SupportedEncoding
-    ) -> Tuple[SauceRecordExtended, str]:
+        sauce: SauceRecord, file_data: FileData, fpath: str, encoding: SupportedEncoding
+    ) -> Tuple[SauceRecordExtended, FileData]:
         flags = SauceRecordExtended.parse_flags(sauce.flags)
         font = SauceRecordExtended.parse_font(sauce.tinfo_s.strip())
         tinfo = SauceRecordExtended.parse_tinfo(sauce)
@@ -121,13 +141,48 @@ class SauceRecordExtended(NamedTuple):
         data, comment_block = file_data[:blockIdx], file_data[blockIdx:]
 
         try:
-            comments_data = SauceRecordExtended.parse_comments(comment_block, sauce.comments)
+            if isinstance(comment_block, memoryview):
+                comments_data = SauceRecordExtended.parse_comments(str(comment_block, encoding.value), sauce.comments)
+            else:
+                comments_data = SauceRecordExtended.parse_comments(comment_block, sauce.comments)
 
             return SauceRecordExtended(**(kwargs | {'comments_data': comments_data})), data
         except ValueError as ve:
             dprint(f'Error parsing comments: {ve}')
             return SauceRecordExtended(**kwargs), file_data
 
+    @staticmethod
+    def parse_file_tail(f: BinaryIO, fpath: str, encoding: SupportedEncoding) -> Tuple[SauceRecordExtended, int]:
+        '''
+        Parse the SAUCE record and comments by seeking to the end of a file, without reading the art data.
+        Returns the extended record and the length of the art data (the file data that parse_record + parse return).
+        '''
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - 128, 0))
+        sauce, _ = SauceRecord.parse_record_bytes(f.read(128), encoding.value)
+        end = size if sauce.is_empty() else max(size - 128, 0)
+
+        block_size = min(sauce.comments * 64 + 5, end) if sauce.comments else 0
+        f.seek(end - block_size)
+        comment_block = memoryview(f.read(block_size))
+        sauce_extended, data = SauceRecordExtended.parse(sauce, comment_block, fpath, encoding)
+        return sauce_extended, end - len(comment_block) + len(data)
+
+    @staticmethod
+    def read_file(
+        fpath: str, encoding: SupportedEncoding, read_data: bool = False
+    ) -> Tuple[SauceRecordExtended, bytes]:
+        '''
+        Read the SAUCE record and comments from the end of a file, a few hundred bytes at most.
+        The art data is only read when asked for, otherwise b'' is returned in its place.
+        '''
+        with open(fpath, 'rb') as f:
+            sauce_extended, size = SauceRecordExtended.parse_file_tail(f, fpath, encoding)
+            if not read_data:
+                return sauce_extended, b''
+            f.seek(0)
+            return sauce_extended, f.read(size)
+
     def asdict(self) -> dict:
         return {
             'sauce': self.sauce._asdict(),
@@ -206,24 +261,35 @@ class SauceRecord(NamedTuple):
 
     @staticmethod
     def parse_record(file_data: bytes, encoding: str) -> Tuple[SauceRecord, str]:
-        data, sauce_data = file_data[:-128], file_data[-128:]
+        sauce, data = SauceRecord.parse_record_bytes(file_data, encoding)
+        return sauce, str(data, encoding)
 
-        if not (sauce_data and sauce_data.startswith(b'SAUCE')):
-            return SauceRecord(), file_data.decode(encoding)
+    @staticmethod
+    def unpack(values: tuple[bytes | int, ...], encoding: str) -> SauceRecord:
+        'A record from the values SAUCE_STRUCT unpacked, decoding the string fields.'
+        # decoding is the slow part, so the string fields are decoded in one call, joined by the NULs they can't contain
+        raw = b'\x00'.join(v.replace(b'\x00', b'').strip() for v in values if isinstance(v, bytes))
+        strings = iter(raw.decode(encoding).split('\x00'))
+        return SauceRecord._make(next(strings) if isinstance(v, bytes) else v for v in values)
+
+    @staticmethod
+    def parse_records(records: bytes | memoryview, encoding: str) -> Iterator[SauceRecord]:
+        'Decode a batch of concatenated 128-byte SAUCE records, e.g. collected from the tails of many files.'
+        for values in SAUCE_STRUCT.iter_unpack(records):
+            yield SauceRecord.unpack(values, encoding)
 
-        values: dict[str, Any] = {}
-        for key, (start, end) in SauceRecord.offsets().items():
-            values[key] = SauceRecord.parse_field(key, sauce_data[start:end], encoding)
+    @staticmethod
+    def parse_record_bytes(file_data: bytes | memoryview, encoding: str) -> Tuple[SauceRecord, memoryview]:
+        'Parse the SAUCE record, returning the rest of the file as an undecoded (zero-copy) memoryview.'
+        view = memoryview(file_data)
+        data, sauce_data = view[:-128], bytes(view[-128:])
+
+        if not (sauce_data and sauce_data.startswith(b'SAUCE')):
+            return SauceRecord(), view
 
-        return SauceRecord(**values), data.decode(encoding)
+        # a file shorter than a record gets the missing fields zeroed
+        values = SAUCE_STRUCT.unpack(sauce_data.ljust(SAUCE_STRUCT.size, b'\x00'))
+        return SauceRecord.unpack(values, encoding), data
 
     def record_bytes(self, encoding: str) -> bytes:
-        record_bytes = bytearray(128)
-        for key, (start, end) in SauceRecord.offsets().items():
-            value = getattr(self, key)
-            if isinstance(value, int):
-                value_bytes = value.to_bytes(end - start, byteorder='little', signed=False)
-            else:
-                value_bytes = value.encode(encoding)[: end - start].ljust(end - start, b'\x00')
-            record_bytes[start:end] = value_bytes
-        return bytes(record_bytes)
+        return SAUCE_STRUCT.pack(*(v.encode(encoding) if isinstance(v, str) else v for v in self))
@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+'''
+Benchmarks for the tokeniser/renderer hot paths, run against synthetic ANSI art.
+
+usage: ./ops/bin/benchmark.py <benchmark> [--size BYTES] [--repeat N]
+'''
+
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from itertools import batched
+from typing import Any, Callable, Iterator
+from unittest.mock import patch
+
+from ansi_art_convert import convert, log
+from ansi_art_convert.convert import (
+    ANSIToken,
+    C0_TOKEN_NAMES,
+    C0Token,
+    Color8BGToken,
+    Color8FGToken,
+    Color8Token,
+    ControlToken,
+    CP437Token,
+    NewLineToken,
+    Renderer,
+    RenderEngine,
+    RenderSession,
+    ScannerEngine,
+    Screen,
+    SGRToken,
+    TextToken,
+    Tokeniser,
+    TrueColorBGToken,
+    TrueColorFGToken,
+    parse_escape_sequence,
+)
+from ansi_art_convert import encoding
+from ansi_art_convert.encoding import (
+    CP437_BLOCK_MAP,
+    CP437_BOX_MAP,
+    CP437_DOUBLE_BOX_MAP,
+    CP437_SHADE_BLOCK_MAP,
+    ISO_8859_1_BOX_MAP,
+    SupportedEncoding,
+    byte_histogram,
+    detect,
+    detect_sampled,
+    detection_histogram,
+    score_encodings,
+)
+from ansi_art_convert.font_data import FONT_OFFSETS, UNICODE_TO_CP437
+from ansi_art_convert.optimise import SGROptimiser
+from ansi_art_convert.sauce import SauceRecord, SauceRecordExtended
+
+CP437_BLOCKS = '░▒▓█▄▀▌▐■ '
+
+
+def synthetic_ansi(size: int, seed: int = 0) -> str:
+    'Generate roughly `size` chars of colourful 80-column CP437 art with cursor-forwards and CRLFs.'
+    rng = random.Random(seed)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        line_len = 0
+        while line_len < 80:
+            roll = rng.random()
+            if roll < 0.25:
+                part = f'\x1b[{rng.choice(["0;", "1;", ""])}{rng.randint(30, 37)};{rng.randint(40, 47)}m'
+            elif roll < 0.35:
+                n = rng.randint(1, 8)
+                part, line_len = f'\x1b[{n}C', line_len + n
+            else:
+                n = rng.randint(1, 12)
+                part, line_len = ''.join(rng.choices(CP437_BLOCKS, k=n)), line_len + n
+            parts.append(part)
+            total += len(part)
+        parts.append('\r\n')
+        total += 2
+    return ''.join(parts)
+
+
+def cursor_forward_ansi(size: int, seed: int = 0) -> str:
+    'Generate roughly `size` chars of sparse art, mostly cursor-forwards between single coloured blocks.'
+    rng = random.Random(seed)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        line_len = 0
+        while line_len < 79:
+            n = rng.randint(1, min(12, 79 - line_len))
+            part = f'\x1b[{n}C\x1b[{rng.randint(30, 37)}m{rng.choice(CP437_BLOCKS)}'
+            line_len += n + 1
+            parts.append(part)
+            total += len(part)
+        parts.append('\r\n')
+        total += 2
+    return ''.join(parts)
+
+
+def create_tokeniser(data: str | bytes | memoryview, **kwargs) -> Tokeniser:
+    sauce, _ = SauceRecordExtended.parse(SauceRecord(), '', '/bench/file.ans', SupportedEncoding.CP437)
+    return Tokeniser(fpath='/bench/file.ans', sauce=sauce, data=data, font_name='IBM VGA', **kwargs)
+
+
+def timed(fn: Callable[[], object], repeat: int) -> float:
+    'Best-of-N wall time in seconds.'
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, size: int, results: dict[str, float]) -> None:
+    baseline = next(iter(results.values()))
+    print(f'{name} ({size / 1_000_000:.1f} MB)')
+    for label, seconds in results.items():
+        print(f'  {label:<24s} {seconds:8.3f}s  {size / seconds / 1_000_000:8.2f} MB/s  x{baseline / seconds:.2f}')
+
+
+def bench_scanner(size: int, repeat: int) -> None:
+    'Tokeniser.tokenise: char-by-char scanner vs regex scanner'
+    data = synthetic_ansi(size)
+    results = {}
+    for engine in (ScannerEngine.CHAR, ScannerEngine.REGEX):
+        t = create_tokeniser(data, scanner=engine)
+        results[engine.value] = timed(lambda: sum(1 for _ in t.tokenise()), repeat)
+    report('scanner', len(data), results)
+
+
+def bench_bytes(size: int, repeat: int) -> None:
+    'Peak traced memory and time to tokenise raw file bytes: decode-then-scan vs the bytes scanner'
+    raw = synthetic_ansi(size).encode('cp437')
+
+    def decoded() -> None:
+        sum(1 for _ in create_tokeniser(raw.decode('cp437'), scanner=ScannerEngine.REGEX).tokenise())
+
+    def undecoded() -> None:
+        sum(1 for _ in create_tokeniser(memoryview(raw), scanner=ScannerEngine.BYTES).tokenise())
+
+    report('bytes', len(raw), {'decode + regex': timed(decoded, repeat), 'bytes': timed(undecoded, repeat)})
+    for label, fn in (('decode + regex', decoded), ('bytes', undecoded)):
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'  {label:<24s} peak {peak / 1_000_000:8.2f} MB (input {len(raw) / 1_000_000:.2f} MB)')
+
+
+def bench_translate(size: int, repeat: int) -> None:
+    'CP437 glyph-offset translation: the old per-char dict/chr loop vs the cached str.translate table'
+    runs = [run for run in synthetic_ansi(size).split('\x1b') if run]
+    offset = FONT_OFFSETS['IBM VGA']
+
+    def per_char() -> None:
+        for run in runs:
+            new_values = []
+            for v in run:
+                n = UNICODE_TO_CP437.get(ord(v), ord(v))
+                new_values.append(chr(n + offset) if n <= 255 else v)
+            ''.join(new_values)
+
+    def translate() -> None:
+        for run in runs:
+            CP437Token._translate_chars(run, offset)
+
+    report('translate', sum(map(len, runs)), {'per-char': timed(per_char, repeat), 'str.translate': timed(translate, repeat)})
+
+
+def bench_dprint(size: int, repeat: int) -> None:
+    'Per-token cost of a gen_lines-style debug message with debug output disabled'
+    tokens = list(create_tokeniser(synthetic_ansi(size), scanner=ScannerEngine.REGEX).tokenise())
+    log.set_debug(False)
+
+    def eager() -> None:
+        for t in tokens:
+            log.dprint(f'Processing token: {t}, token type: {type(t).__name__}, token len: {len(str(t))}, {t!r}')
+
+    def lazy() -> None:
+        for t in tokens:
+            log.dprint(lambda: f'Processing token: {t}, token type: {type(t).__name__}, token len: {len(str(t))}, {t!r}')
+
+    def guarded() -> None:
+        debug = log.DEBUG
+        for t in tokens:
+            if debug:
+                log.dprint(f'Processing token: {t}, token type: {type(t).__name__}, token len: {len(str(t))}, {t!r}')
+
+    def render() -> None:
+        Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(synthetic_ansi(size))).render()
+
+    report(
+        f'dprint ({len(tokens)} tokens)',
+        size,
+        {'eager f-string': timed(eager, repeat), 'lazy callable': timed(lazy, repeat), 'guarded': timed(guarded, repeat)},
+    )
+    report('render (non-verbose)', size, {'render': timed(render, repeat)})
+
+
+def bench_memory(size: int, repeat: int) -> None:
+    'Traced memory held by a fully materialised token list'
+    t = create_tokeniser(synthetic_ansi(size), scanner=ScannerEngine.REGEX)
+    tracemalloc.start()
+    tokens = list(t.tokenise())
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'memory ({len(t.data) / 1_000_000:.1f} MB input, {len(tokens)} tokens)')
+    print(f'  held {held / 1_000_000:8.2f} MB  peak {peak / 1_000_000:8.2f} MB  {held / len(tokens):8.1f} bytes/token')
+
+
+def bench_flyweight(size: int, repeat: int) -> None:
+    'Token objects allocated (and still held) by rendered lines of colour-heavy art, vs token references'
+    t = create_tokeniser(synthetic_ansi(size), scanner=ScannerEngine.REGEX)
+    r = Renderer(fpath='/bench/file.ans', tokeniser=t)
+    tracemalloc.start()
+    lines = list(r.gen_lines())
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    colour = (Color8FGToken, Color8BGToken, SGRToken)
+    refs = [tok for line in lines for tok in line if isinstance(tok, colour)]
+    print(f'flyweight ({len(t.data) / 1_000_000:.1f} MB input, {len(lines)} lines)')
+    print(f'  colour/SGR token refs {len(refs):10d}  objects {len({id(tok) for tok in refs}):10d}')
+    print(f'  held {held / 1_000_000:8.2f} MB')
+
+
+def bench_columnar(size: int, repeat: int) -> None:
+    'Memory held by a whole-file token list vs a columnar TokenBuffer, and the cost of iterating each'
+    t = create_tokeniser(synthetic_ansi(size), scanner=ScannerEngine.REGEX)
+    tracemalloc.start()
+    tokens = list(t.tokenise())
+    held_list, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tokens
+    tracemalloc.start()
+    buf = t.tokenise_buffer()
+    held_buf, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'columnar ({len(t.data) / 1_000_000:.1f} MB input, {len(buf)} tokens)')
+    print(f'  token list   held {held_list / 1_000_000:8.2f} MB')
+    print(f'  TokenBuffer  held {held_buf / 1_000_000:8.2f} MB  x{held_list / held_buf:.1f} smaller')
+    tokens = list(t.tokenise())
+    report(
+        'columnar iteration',
+        len(t.data),
+        {'token list': timed(lambda: sum(1 for _ in tokens), repeat), 'TokenBuffer': timed(lambda: sum(1 for _ in buf), repeat)},
+    )
+
+
+def bench_escapes(size: int, repeat: int) -> None:
+    'Tokeniser.tokenise with escape sequences parsed every time vs memoised by parse_escape_sequence'
+    data = synthetic_ansi(size)
+    t = create_tokeniser(data, scanner=ScannerEngine.REGEX)
+
+    def uncached() -> None:
+        with patch.object(convert, 'parse_escape_sequence', parse_escape_sequence.__wrapped__):
+            sum(1 for _ in t.tokenise())
+
+    def cached() -> None:
+        parse_escape_sequence.cache_clear()
+        sum(1 for _ in t.tokenise())
+
+    report('escapes', len(data), {'uncached': timed(uncached, repeat), 'cached': timed(cached, repeat)})
+    print(f'  {parse_escape_sequence.cache_info()}')
+
+
+def bench_charclass(size: int, repeat: int) -> None:
+    'tokenise_chars: the old if/elif char loop vs searching for the char ending each run'
+    data = synthetic_ansi(size)
+    t = create_tokeniser(data)
+
+    def if_elif() -> Iterator[ANSIToken]:
+        isCode, currCode, currText = False, [], []
+        for ch in data:
+            if ch == '\x1b':
+                isCode = True
+                currCode.append(ch)
+                if currText:
+                    yield t._textTokenType(value=''.join(currText), offset=t.glyph_offset)
+                    currText = []
+            elif isCode:
+                currCode.append(ch)
+                if ch.isalpha():
+                    isCode = False
+                    yield from t.create_tokens(currCode)
+                    currCode = []
+            elif ch == '\n' or ord(ch) in C0_TOKEN_NAMES:
+                if currText:
+                    yield t._textTokenType(value=''.join(currText), offset=t.glyph_offset)
+                    currText = []
+                yield NewLineToken(value=ch) if ch == '\n' else C0Token(value=ch, offset=t.glyph_offset)
+            else:
+                currText.append(ch)
+
+    report(
+        'charclass',
+        len(data),
+        {'if/elif': timed(lambda: list(if_elif()), repeat), 'run search': timed(lambda: list(t.tokenise_chars(data)), repeat)},
+    )
+
+
+class NullWriter(io.RawIOBase):
+    'Discards writes, recording when the first one happened.'
+
+    first_write: float | None = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:  # type: ignore[no-untyped-def]
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        return len(b)
+
+
+def bench_write(size: int, repeat: int) -> None:
+    'Time to first output and peak traced memory: print(render()) vs Renderer.write() into a binary writer'
+    data = synthetic_ansi(size)
+
+    def rendered(out: NullWriter) -> None:
+        out.write(Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data)).render().encode('utf-8'))
+
+    def streamed(out: NullWriter) -> None:
+        Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data)).write(out)
+
+    print(f'write ({len(data) / 1_000_000:.1f} MB input)')
+    for label, fn in (('render + write', rendered), ('Renderer.write', streamed)):
+        out = NullWriter()
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(out)
+        end = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert out.first_write is not None
+        print(
+            f'  {label:<24s} first output {out.first_write - start:8.3f}s  total {end - start:8.3f}s'
+            f'  peak {peak / 1_000_000:8.2f} MB'
+        )
+
+
+def bench_cellwidth(size: int, repeat: int) -> None:
+    'Cursor-forward-heavy art: token widths via len(str(t)) vs the cached cell_width, and the full render'
+    data = cursor_forward_ansi(size)
+    tokens = [t for t in create_tokeniser(data, scanner=ScannerEngine.REGEX).tokenise() if t.cell_width]
+
+    report(
+        f'cellwidth ({len(tokens)} text/control tokens)',
+        len(data),
+        {
+            'len(str(t))': timed(lambda: sum(len(str(t)) for t in tokens), repeat),
+            'cell_width': timed(lambda: sum(t.cell_width for t in tokens), repeat),
+        },
+    )
+    renderer = lambda: Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data, scanner=ScannerEngine.REGEX))
+    report('render (cursor-forward heavy)', len(data), {'render': timed(lambda: renderer().render(), repeat)})
+
+
+def bench_sgr(size: int, repeat: int) -> None:
+    'Rendered output size and render time, with and without the SGROptimiser stage'
+    data = synthetic_ansi(size)
+
+    def render(optimiser: SGROptimiser | None) -> str:
+        t = create_tokeniser(data, scanner=ScannerEngine.REGEX)
+        return Renderer(fpath='/bench/file.ans', tokeniser=t, optimiser=optimiser).render()
+
+    plain, optimised = render(None), render(SGROptimiser())
+    print(f'sgr output: {len(plain)} -> {len(optimised)} chars ({1 - len(optimised) / len(plain):.1%} smaller)')
+    report(
+        'render',
+        len(data),
+        {
+            'render': timed(lambda: render(None), repeat),
+            'render + SGROptimiser': timed(lambda: render(SGROptimiser()), repeat),
+        },
+    )
+
+
+def bench_dispatch(size: int, repeat: int) -> None:
+    'Per-token cost of choosing a gen_lines branch: the old isinstance ladder vs the type -> handler table'
+    tokens = list(create_tokeniser(synthetic_ansi(size), scanner=ScannerEngine.REGEX).tokenise())
+    r = Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser('', scanner=ScannerEngine.REGEX), tokens=tokens)
+
+    def ladder() -> None:
+        for t in tokens:
+            if isinstance(t, Color8Token):
+                pass
+            elif isinstance(t, TrueColorFGToken):
+                pass
+            elif isinstance(t, TrueColorBGToken):
+                pass
+            elif isinstance(t, ControlToken) and t.subtype == 'A':
+                pass
+            elif isinstance(t, (TextToken, CP437Token, ControlToken)):
+                pass
+            elif isinstance(t, C0Token):
+                pass
+            elif isinstance(t, NewLineToken):
+                pass
+
+    def table() -> None:
+        handlers, resolve = r._handlers, r._resolve_handler
+        for t in tokens:
+            handlers.get(type(t)) or resolve(type(t))
+
+    def gen_lines() -> None:
+        r.width = 80
+        r._currLine, r._currLength, r._currFG, r._currBG, r._currSGR = [], 0, None, None, None
+        for _ in r.gen_lines():
+            pass
+
+    results = {'isinstance ladder': timed(ladder, repeat), 'handler table': timed(table, repeat)}
+    report(f'dispatch ({len(tokens)} tokens)', size, results)
+    for label, seconds in {**results, 'gen_lines': timed(gen_lines, repeat)}.items():
+        print(f'  {label:<24s} {seconds / len(tokens) * 1e9:8.1f} ns/token')
+
+
+def bench_screen(size: int, repeat: int) -> None:
+    'Render time of the line renderer vs the virtual screen engine, and the memory held by the screen grid'
+    data = synthetic_ansi(size)
+
+    def render(engine: RenderEngine) -> str:
+        t = create_tokeniser(data, scanner=ScannerEngine.REGEX)
+        return Renderer(fpath='/bench/file.ans', tokeniser=t, engine=engine).render()
+
+    report(
+        'engine',
+        len(data),
+        {'lines': timed(lambda: render(RenderEngine.LINES), repeat), 'screen': timed(lambda: render(RenderEngine.SCREEN), repeat)},
+    )
+    screen = Screen(width=80)
+    tracemalloc.start()
+    screen.feed(create_tokeniser(data, scanner=ScannerEngine.REGEX).tokenise())
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'  screen grid {screen.n_rows} rows ({screen.rows_allocated} allocated)  held {held / 1_000_000:.2f} MB  peak {peak / 1_000_000:.2f} MB')
+
+
+def bench_coalesce(size: int, repeat: int) -> None:
+    'Rendered output size and render time: token-by-token serialisation vs coalesce_line runs'
+    data = synthetic_ansi(size)
+
+    def render(coalesce: bool) -> str:
+        t = create_tokeniser(data, scanner=ScannerEngine.REGEX)
+        return Renderer(fpath='/bench/file.ans', tokeniser=t, coalesce=coalesce).render()
+
+    plain, coalesced = render(False), render(True)
+    print(f'coalesce output: {len(plain)} -> {len(coalesced)} chars ({1 - len(coalesced) / len(plain):.1%} smaller)')
+    report('render', len(data), {'per token': timed(lambda: render(False), repeat), 'coalesced': timed(lambda: render(True), repeat)})
+
+
+def single_line_ansi(size: int, seed: int = 0) -> str:
+    'Generate roughly `size` chars of art with no newlines, long coloured runs of blocks wrapped only by the width.'
+    rng = random.Random(seed)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        part = f'\x1b[{rng.randint(30, 37)};{rng.randint(40, 47)}m' + ''.join(rng.choices(CP437_BLOCKS, k=rng.randint(50, 400)))
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def bench_split(size: int, repeat: int) -> None:
+    'Wrapping long single-line art: re-joined/re-translated chunk tokens vs text_span slices'
+    data = single_line_ansi(size)
+    t = create_tokeniser(data, scanner=ScannerEngine.REGEX)
+    tokens = [tok for tok in t.tokenise() if isinstance(tok, CP437Token)]
+    r = Renderer(fpath='/bench/file.ans', tokeniser=t)
+
+    def joined() -> None:
+        for tok in tokens:
+            s = str(tok)
+            for chunk in [s[:7]] + list(map(''.join, batched(s[7:], r.width))):
+                tok.__class__(value=chunk, offset=tok.offset)
+
+    def spans() -> None:
+        for tok in tokens:
+            for _ in r.split_text_token(tok, 7):
+                pass
+
+    report(f'split ({len(tokens)} text tokens)', len(data), {'batched + join': timed(joined, repeat), 'text_span': timed(spans, repeat)})
+    renderer = lambda: Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data, scanner=ScannerEngine.REGEX))
+    report('render (single line)', len(data), {'render': timed(lambda: renderer().render(), repeat)})
+
+
+def bench_lines(size: int, repeat: int) -> None:
+    'Rendering a range of lines near the end of the art: from the start vs resuming from the nearest checkpoint'
+    data = synthetic_ansi(size)
+    renderer = lambda **kwargs: Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data), **kwargs)
+    r = renderer(checkpoint_every=1000)
+    n_lines = sum(1 for _ in r.iter_lines())
+    start = n_lines - 100
+    print(f'{n_lines} lines, {len(r.checkpoints)} checkpoints, rendering lines {start}:{n_lines}')
+    report(
+        'line range',
+        len(data),
+        {
+            'from start': timed(lambda: ''.join(renderer().iter_line_range(start)), repeat),
+            'checkpointed': timed(lambda: ''.join(renderer(checkpoints=r.checkpoints).iter_line_range(start)), repeat),
+        },
+    )
+
+
+def bench_session(size: int, repeat: int) -> None:
+    'A file growing in 20 appends, re-rendered after each: from the start every time vs a RenderSession'
+    data = synthetic_ansi(size).encode('cp437')
+    cuts = range(0, len(data), -(-len(data) // 20))
+    renderer = lambda data: Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data))
+
+    def rerender() -> None:
+        for cut in cuts:
+            renderer(data[: cut + len(data) // 20]).render()
+
+    def session() -> None:
+        s = RenderSession(renderer(b''))
+        for cut in cuts:
+            s.feed(data[cut : cut + len(data) // 20])
+        s.tail()
+
+    report('20 appends', len(data), {'re-render': timed(rerender, repeat), 'session': timed(session, repeat)})
+
+
+def bench_parallel(size: int, repeat: int) -> None:
+    'Serial render vs rendering segments in 1..N worker processes (N = CPU count), and the cost of the split pre-scan'
+    data = synthetic_ansi(size)
+    renderer = lambda **kwargs: Renderer(fpath='/bench/file.ans', tokeniser=create_tokeniser(data, scanner=ScannerEngine.REGEX), **kwargs)
+    n_cpus = os.cpu_count() or 1
+    print(f'{n_cpus} CPUs')
+    results = {'serial': timed(lambda: renderer().render(), repeat)}
+    results['pre-scan only'] = timed(lambda: renderer().scan_splits(n_cpus), repeat)
+    for jobs in sorted({2, *(2**i for i in range(1, n_cpus.bit_length())), n_cpus}):
+        results[f'{jobs} jobs'] = timed(lambda: renderer(jobs=jobs).render(), repeat)
+    report('render', len(data), results)
+
+
+def bench_encoding(size: int, repeat: int) -> None:
+    'Encoding detection: one bytes.count scan per rule byte vs a single byte histogram (with and without numpy), and sampled'
+    data = synthetic_ansi(size).encode('cp437')
+    rule_bytes = [*ISO_8859_1_BOX_MAP, *CP437_SHADE_BLOCK_MAP, *CP437_BOX_MAP, *CP437_BLOCK_MAP, *CP437_DOUBLE_BOX_MAP]
+
+    def per_rule() -> None:
+        for byte in rule_bytes:
+            data.count(byte)
+
+    results = {'count per rule byte': timed(per_rule, repeat)}
+    if encoding.np is not None:
+        results['histogram (numpy)'] = timed(lambda: byte_histogram(data), repeat)
+    with patch.object(encoding, 'np', None):
+        results['full histogram (no numpy)'] = timed(lambda: byte_histogram(data), repeat)
+        results['detection histogram (no numpy)'] = timed(lambda: detection_histogram(data), repeat)
+    results['score histogram'] = timed(lambda: score_encodings(detection_histogram(data)), repeat)
+    results['detect_sampled'] = timed(lambda: detect_sampled(data), repeat)
+    # the first repeat hashes and scores, the rest are cache hits
+    results['detect (cached)'] = timed(lambda: detect(data), repeat)
+    report('histogram', len(data), results)
+
+
+def bench_sauce(size: int, repeat: int) -> None:
+    'Reading the SAUCE record of 100 files: reading and decoding whole files vs seeking to the record at the end'
+    art = synthetic_ansi(size // 100).encode('cp437')
+    record = SauceRecord(ID='SAUCE', version='00', title='Bench', data_type=1, file_type=1, tinfo1=80, comments=1)
+    comments = SauceRecordExtended.write_comments(['benchmark']).encode('cp437')
+    enc = SupportedEncoding.CP437
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fpaths = [os.path.join(tmpdir, f'{i}.ans') for i in range(100)]
+        for fpath in fpaths:
+            with open(fpath, 'wb') as f:
+                f.write(art + comments + record.record_bytes(enc.value))
+
+        def whole() -> None:
+            for fpath in fpaths:
+                with open(fpath, 'rb') as f:
+                    sauce, data = SauceRecord.parse_record(f.read(), enc.value)
+                SauceRecordExtended.parse(sauce, data, fpath, enc)
+
+        def tail() -> None:
+            for fpath in fpaths:
+                SauceRecordExtended.read_file(fpath, enc)
+
+        report('100 files', len(art) * 100, {'whole file': timed(whole, repeat), 'tail only': timed(tail, repeat)})
+
+
+def bench_codec(size: int, repeat: int) -> None:
+    'Bulk SAUCE metadata extraction: per-field offsets/parse_field decoding vs the SAUCE_STRUCT codec'
+    n = max(1, size // 128)
+    records = [
+        SauceRecord(ID='SAUCE', version='00', title=f'Art {i}', author='Author', filesize=i, tinfo1=80, tinfo_s='IBM VGA')
+        for i in range(n)
+    ]
+    batch = b''.join(r.record_bytes('cp437') for r in records)
+    tails = [batch[i : i + 128] for i in range(0, len(batch), 128)]
+
+    def per_field() -> None:
+        for tail in tails:
+            values: dict[str, Any] = {}
+            for k, (a, b) in SauceRecord.offsets().items():
+                values[k] = SauceRecord.parse_field(k, tail[a:b], 'cp437')
+            SauceRecord(**values)
+
+    def encode_per_field() -> None:
+        for r in records:
+            out = bytearray(128)
+            for k, (a, b) in SauceRecord.offsets().items():
+                v = getattr(r, k)
+                out[a:b] = v.to_bytes(b - a, 'little') if isinstance(v, int) else v.encode('cp437')[: b - a].ljust(b - a, b'\x00')
+
+    report(
+        f'decode {n} records',
+        len(batch),
+        {
+            'offsets + parse_field': timed(per_field, repeat),
+            'parse_record_bytes': timed(lambda: [SauceRecord.parse_record_bytes(t, 'cp437') for t in tails], repeat),
+            'parse_records (batch)': timed(lambda: list(SauceRecord.parse_records(batch, 'cp437')), repeat),
+        },
+    )
+    report(
+        f'encode {n} records',
+        len(batch),
+        {'offsets': timed(encode_per_field, repeat), 'record_bytes': timed(lambda: [r.record_bytes('cp437') for r in records], repeat)},
+    )
+
+
+BENCHMARKS: dict[str, Callable[[int, int], None]] = {
+    'scanner': bench_scanner,
+    'bytes': bench_bytes,
+    'translate': bench_translate,
+    'dprint': bench_dprint,
+    'memory': bench_memory,
+    'flyweight': bench_flyweight,
+    'columnar': bench_columnar,
+    'escapes': bench_escapes,
+    'charclass': bench_charclass,
+    'write': bench_write,
+    'cellwidth': bench_cellwidth,
+    'sgr': bench_sgr,
+    'dispatch': bench_dispatch,
+    'screen': bench_screen,
+    'coalesce': bench_coalesce,
+    'split': bench_split,
+    'lines': bench_lines,
+    'session': bench_session,
+    'parallel': bench_parallel,
+    'encoding': bench_encoding,
+    'sauce': bench_sauce,
+    'codec': bench_codec,
+}
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument('benchmark', choices=[*BENCHMARKS.keys(), 'all'])
+    parser.add_argument('--size', type=int, default=4_000_000, help='Approximate input size in chars.')
+    parser.add_argument('--repeat', type=int, default=3, help='Best-of-N repeats.')
+    args = parser.parse_args()
+
+    for name, fn in BENCHMARKS.items():
+        if args.benchmark in (name, 'all'):
+            fn(args.size, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import random
+import re
 from typing import Any
 
 from ansi_art_convert.convert import Renderer, Tokeniser
@@ -61,7 +63,7 @@ DEFAULT_TOKENISER_KWARGS: dict[str, Any] = {
 
 
 def create_tokeniser(
-    data: str = '',
+    data: str | bytes = '',
     tokeniser_kwargs: dict[str, Any] = {},
     sauce_record_kwargs: dict[str, Any] = {},
     extended_kwargs: dict[str, Any] = {},
@@ -83,7 +85,7 @@ DEFAULT_RENDERER_KWARGS: dict[str, Any] = {
 
 
 def create_renderer(
-    data: str,
+    data: str | bytes,
     tokeniser_kwargs: dict[str, Any] = {},
     renderer_kwargs: dict[str, Any] = {},
     sauce_record_kwargs: dict[str, Any] = {},
@@ -98,3 +100,104 @@ def create_renderer(
         ),
         **(DEFAULT_RENDERER_KWARGS | renderer_kwargs),
     )
+
+
+SGR = re.compile(r'\x1b\[([0-9;]*)m')
+ESCAPE = re.compile(r'\x1b[^A-Za-z]*[A-Za-z]')
+
+
+def apply_sgr(state: tuple, params: str) -> tuple:
+    'A deliberately simple SGR interpreter, independent of SGRState.apply'
+    fg, bg, attrs = state
+    values = params.split(';')
+    while values:
+        v = values.pop(0)
+        n = int(v or '0')
+        if n == 0:
+            fg, bg, attrs = None, None, frozenset()
+        elif 1 <= n <= 9:
+            attrs = attrs | {n}
+        elif n == 22:
+            attrs = attrs - {1, 2}
+        elif n == 25:
+            attrs = attrs - {5, 6}
+        elif 23 <= n <= 29:
+            attrs = attrs - {n - 20}
+        elif 30 <= n <= 37 or 90 <= n <= 97:
+            fg = n
+        elif 40 <= n <= 47 or 100 <= n <= 107:
+            bg = n
+        elif n == 39:
+            fg = None
+        elif n == 49:
+            bg = None
+        elif n in (38, 48):
+            mode = values.pop(0)
+            colour = (mode, *[values.pop(0) for _ in range(3 if mode == '2' else 1)])
+            if n == 38:
+                fg = colour
+            else:
+                bg = colour
+        else:
+            raise ValueError(f'unexpected SGR param {v!r}')
+    return fg, bg, attrs
+
+
+def screen(output: str) -> tuple[list[list[tuple]], tuple]:
+    '''
+    Interpret output as a terminal would: every printed char (and every newline, which can scroll in a new line
+    painted with the current background) is recorded with the SGR state it was printed with.
+    Any other escape sequence is recorded like a printed char.
+    '''
+    rows: list[list[tuple]] = [[]]
+    state: tuple = (None, None, frozenset())
+    pos = 0
+    for m in ESCAPE.finditer(output):
+        for ch in output[pos : m.start()]:
+            rows[-1].append((ch, state))
+            if ch == '\n':
+                rows.append([])
+        sgr = SGR.fullmatch(m.group())
+        if sgr:
+            state = apply_sgr(state, sgr.group(1))
+        else:
+            rows[-1].append((m.group(), state))
+        pos = m.end()
+    for ch in output[pos:]:
+        rows[-1].append((ch, state))
+        if ch == '\n':
+            rows.append([])
+    return rows, state
+
+
+def random_art(seed: int, n_lines: int = 30) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(n_lines):
+        for _ in range(rng.randint(1, 12)):
+            roll = rng.random()
+            if roll < 0.4:
+                params = rng.sample(['0', '1', '5', '', '7'], k=rng.randint(0, 2))
+                params += rng.sample([str(rng.randint(30, 37)), str(rng.randint(40, 47))], k=rng.randint(0, 2))
+                parts.append(f'\x1b[{";".join(params)}m')
+            elif roll < 0.5:
+                parts.append(f'\x1b[{rng.choice([0, 1])};{rng.randint(0, 255)};{rng.randint(0, 255)};0t')
+            elif roll < 0.6:
+                parts.append(f'\x1b[{rng.randint(1, 30)}C')
+            else:
+                parts.append(''.join(rng.choices('░▒▓█▄▀ ab', k=rng.randint(1, 40))))
+        parts.append(rng.choice(['\r\n', '\n']))
+    return ''.join(parts)
+
+
+# art exercising colours, attributes, cursor movement and unknown sequences, for output equivalence tests
+GOLDEN_DATA = [
+    '',
+    'Hello',
+    '\x1b[31mRed\x1b[0m\nNormal\x1b[1;32mBold Green\x1b[10CSpaced',
+    '\x1b[1;33;44m' + '░' * 200 + '\x1b[0m\r\n\x1b[A\x1b[5CText',
+    '\x1b[0;37;40mWhite on black\x1b[0m default\x1b[37;40m explicit\n',
+    '\x1b[1;255;128;64t\x1b[0;0;0;0tTrue\x1b[0m\n\x1b[31mRed',
+    '\x1b[5;41mblink\x1b[0m\x1b[999Zunknown\x1b[32m',
+    *[random_art(seed) for seed in range(20)],
+]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+'Unit tests for encoding detection in encoding.py'
+
+import logging
+import random
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from ansi_art_convert import convert, encoding, log
+from ansi_art_convert.convert import resolve_encoding
+from ansi_art_convert.encoding import (
+    DETECTION_BYTES,
+    DETECTION_CACHE_SIZE,
+    SupportedEncoding,
+    byte_histogram,
+    detect,
+    detect_encoding,
+    detect_sampled,
+    detection_histogram,
+    sample_windows,
+    score_encodings,
+)
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'no-numpy'])
+def numpy(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> bool:
+    if request.param and encoding.np is None:
+        pytest.skip('numpy is not installed')
+    if not request.param:
+        monkeypatch.setattr(encoding, 'np', None)
+    encoding._detection_cache.clear()
+    return bool(request.param)
+
+
+class TestByteHistogram:
+    'Test byte_histogram counts, with and without numpy'
+
+    def test_counts(self, numpy: bool) -> None:
+        data = bytes(random.Random(0).choices(range(256), k=10_000))
+        histogram = byte_histogram(data)
+        assert len(histogram) == 256
+        assert histogram == [data.count(byte) for byte in range(256)]
+
+    def test_empty(self, numpy: bool) -> None:
+        assert byte_histogram(b'') == [0] * 256
+        assert detection_histogram(b'') == [0] * 256
+
+    def test_detection_counts(self, numpy: bool) -> None:
+        'Without numpy only the bytes the rules read are counted.'
+        data = bytes(random.Random(0).choices(range(256), k=10_000))
+        histogram = detection_histogram(data)
+        assert len(histogram) == 256
+        for byte in DETECTION_BYTES if not numpy else range(256):
+            assert histogram[byte] == data.count(byte)
+
+
+class TestDetectEncoding:
+    'Test the encoding verdicts'
+
+    @pytest.mark.parametrize(
+        'data, expected',
+        [
+            (b'', SupportedEncoding.CP437),
+            (b'plain ascii text', SupportedEncoding.CP437),
+            ('\x1b[31m░▒▓█▄▀ ┘└\r\n'.encode('cp437'), SupportedEncoding.CP437),
+            # the odd-one-out ¯ alongside - and |
+            ('|\\/¯_ -:|'.encode('iso-8859-1'), SupportedEncoding.ISO_8859_1),
+            # more ISO-8859-1 box drawing than CP437 chars, but the CP437 chars still win on points
+            (('|\\/_' * 5 + '░█').encode('cp437'), SupportedEncoding.CP437),
+            ('Ñ'.encode('iso-8859-1') + b'|-|-', SupportedEncoding.ISO_8859_1),
+        ],
+    )
+    def test_detect(self, numpy: bool, data: bytes, expected: SupportedEncoding) -> None:
+        assert detect_encoding(data) == expected
+
+    def test_score_encodings(self) -> None:
+        histogram = [0] * 256
+        histogram[0xB0] = histogram[0xDB] = 3
+        result = score_encodings(histogram)
+        # one point each for shade and block chars, one for more than one kind of CP437 char
+        assert result.scores[SupportedEncoding.CP437] == 4
+        assert result.scores[SupportedEncoding.ISO_8859_1] == 1
+        assert (result.encoding, result.confidence) == (SupportedEncoding.CP437, 3)
+        assert result.rules == (
+            '[cp437 +1] Detected CP437 characters in file: Counter({176: 3})',
+            '[cp437 +1] Detected CP437 characters in file: Counter({219: 3})',
+            '[cp437 +1] Detected CP437 characters in file: Counter({176: 3, 219: 3})',
+        )
+
+
+class TestDetectionResult:
+    'Test the detection result and its cache'
+
+    def test_asdict(self) -> None:
+        result = detect('Ñ'.encode('iso-8859-1') + b'|-|-')
+        assert result.asdict() == {
+            'encoding': 'iso-8859-1',
+            'confidence': 1,
+            'scores': {'cp437': 2, 'iso-8859-1': 3, 'ascii': 1, 'utf-8': 1},
+            'rules': [
+                "[iso-8859-1 +1] Detected popular character in file: ('Ñ', 'iso-8859-1', 1)",
+                "[iso-8859-1 +1] Detected odd-one-out characters in file: [('-', 2), ('|', 2)]",
+                '[cp437 +1] Detected CP437 characters in file: Counter({209: 1})',
+            ],
+            'sampled': 5,
+        }
+        assert result.histogram[ord('-')] == 2
+
+    def test_cached_by_content(self) -> None:
+        encoding._detection_cache.clear()
+        data = '░▒▓'.encode('cp437') * 10
+        result = detect(data)
+        assert detect(bytes(bytearray(data))) is result
+        assert detect(data + b'x') is not result
+
+        for n in range(DETECTION_CACHE_SIZE):
+            detect(n.to_bytes(2))
+        assert len(encoding._detection_cache) == DETECTION_CACHE_SIZE
+        assert detect(data) is not result
+        assert detect(data) == result
+
+    def test_least_recently_used_is_dropped(self) -> None:
+        encoding._detection_cache.clear()
+        first, second = detect(b'\xb0'), detect(b'\xdb')
+        # using the first again makes the second the least recently used
+        assert detect(b'\xb0') is first
+        for n in range(DETECTION_CACHE_SIZE - 2):
+            detect(n.to_bytes(2))
+        detect(b'new')
+        assert len(encoding._detection_cache) == DETECTION_CACHE_SIZE
+        assert detect(b'\xb0') is first
+        assert detect(b'\xdb') is not second
+
+    def test_immutable(self) -> None:
+        result = detect(b'\xb0\xdb')
+        with pytest.raises(FrozenInstanceError):
+            result.rules = ()  # type: ignore[misc]
+        with pytest.raises(TypeError):
+            result.scores[SupportedEncoding.UTF_8] = 99  # type: ignore[index]
+        assert isinstance(result.rules, tuple) and isinstance(result.histogram, tuple)
+        assert detect(b'\xb0\xdb') == result
+
+
+class TestSampledDetection:
+    'Test detecting the encoding from sampled windows'
+
+    @pytest.mark.parametrize('size', [0, 1, 6, 7, 8, 50, 99])
+    def test_windows_cover_data_once(self, size: int) -> None:
+        windows = list(sample_windows(size, 7))
+        assert sorted(windows) == [(i, min(size, i + 7)) for i in range(0, size, 7)]
+        if size > 14:
+            # head, tail, then middle
+            assert windows[:3] == [
+                (0, 7),
+                ((size - 1) // 7 * 7, size),
+                ((size - 1) // 7 // 2 * 7, (size - 1) // 7 // 2 * 7 + 7),
+            ]
+
+    def test_stops_once_confident(self, caplog: pytest.LogCaptureFixture) -> None:
+        data = '░▒▓█▄▀ ┘└'.encode('cp437') * 1000 + b'plain' * 10_000
+        log.set_debug(True)
+        try:
+            with caplog.at_level(logging.DEBUG, logger='ansi_art_convert'):
+                result = detect_sampled(data, confidence=3, window=1024)
+        finally:
+            log.set_debug(False)
+        assert (result.encoding, result.confidence, result.sampled) == (SupportedEncoding.CP437, 4, 1024)
+        assert f'Sampled 1024/{len(data)} bytes, cp437 leads by 4 points' in caplog.messages
+
+    def test_max_bytes(self) -> None:
+        data = b'plain' * 10_000 + b'-|'
+        # the tail window holding the - and | is read second, the budget stops sampling after the head
+        result = detect_sampled(data, window=1024, max_bytes=1024)
+        assert (result.encoding, result.confidence) == (SupportedEncoding.CP437, 0)
+        result = detect_sampled(data, window=1024, max_bytes=2048)
+        assert (result.encoding, result.confidence) == (SupportedEncoding.ISO_8859_1, 1)
+
+    @pytest.mark.parametrize('seed', range(20))
+    def test_matches_full_detection_when_unsure(self, numpy: bool, seed: int) -> None:
+        rng = random.Random(seed)
+        data = bytes(rng.choices([0x41, 0x7C, 0x2D, 0x3A, 0xAF, 0xB0, 0xDB, 0xC0, 0xA5, 0xD1], k=rng.randint(0, 5000)))
+        result = detect_sampled(data, confidence=99, window=256, max_bytes=len(data))
+        assert result == detect(data)
+
+
+class TestResolveEncoding:
+    'Test the CLI choice between the --encoding override and detection'
+
+    def test_override_skips_detection(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(convert, 'detect', lambda data: pytest.fail('detected'))
+        assert resolve_encoding({'encoding': 'utf-8'}, b'\xb0\xdb') == SupportedEncoding.UTF_8
+
+    def test_detects(self) -> None:
+        assert resolve_encoding({'encoding': None}, b'\xb0\xdb') == SupportedEncoding.CP437
+        assert resolve_encoding({}, b'\xb0\xdb' + b'x' * 100_000, 3) == SupportedEncoding.CP437
+
+    def test_verbose_override_logs_disagreement(self, caplog: pytest.LogCaptureFixture) -> None:
+        log.set_debug(True)
+        try:
+            with caplog.at_level(logging.DEBUG, logger='ansi_art_convert'):
+                assert resolve_encoding({'encoding': 'utf-8'}, b'\xb0\xdb') == SupportedEncoding.UTF_8
+        finally:
+            log.set_debug(False)
+        assert 'Overriding detected encoding SupportedEncoding.CP437 with SupportedEncoding.UTF_8:' in caplog.messages
+        assert "'rules': ['[cp437 +1] Detected CP437 characters in file: Counter({176: 1})'," in caplog.text
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+'Unit tests for debug logging in log.py'
+
+import logging
+
+import pytest
+
+from ansi_art_convert import log
+from ansi_art_convert.log import dprint
+
+
+class TestDprint:
+    'Test dprint() deferred formatting'
+
+    def teardown_method(self) -> None:
+        log.set_debug(False)
+
+    def test_dprint_disabled_skips_callables(self) -> None:
+        calls = []
+        log.set_debug(False)
+        dprint(lambda: calls.append('called'))
+        assert calls == []
+
+    def test_dprint_enabled_calls_callables(self, caplog: pytest.LogCaptureFixture) -> None:
+        log.set_debug(True)
+        with caplog.at_level(logging.DEBUG, logger='ansi_art_convert'):
+            dprint('token:', lambda: f'{"abc"!r}', 3)
+        assert caplog.messages == ["token: 'abc' 3"]
+
+    def test_set_debug_updates_flag(self) -> None:
+        log.set_debug(True)
+        assert log.DEBUG is True
+        log.set_debug(False)
+        assert log.DEBUG is False
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'Unit tests for the SGR output optimiser in optimise.py'
+
+import pytest
+
+from ansi_art_convert.optimise import SGROptimiser, SGRState
+from test.helper import GOLDEN_DATA, create_renderer, screen
+
+
+class TestSGRState:
+    'Test SGRState transitions'
+
+    def test_apply(self) -> None:
+        state = SGRState().apply('1;31;44')
+        assert state == SGRState(fg='31', bg='44', attributes=frozenset({'1'}))
+        assert state is not None
+        assert state.apply('0') == SGRState()
+        assert state.apply('22;39') == SGRState(bg='44')
+        assert SGRState().apply('38;2;1;2;3;48;5;200') == SGRState(fg='38;2;1;2;3', bg='48;5;200')
+
+    def test_apply_unknown_params(self) -> None:
+        assert SGRState().apply('58;5;1') is None
+        assert SGRState().apply('38;2;1') is None
+
+    @pytest.mark.parametrize(
+        'current, target, expected',
+        [
+            (SGRState(), SGRState(fg='31', bg='40'), '\x1b[31;40m'),
+            (SGRState(fg='31', bg='40'), SGRState(fg='32', bg='40'), '\x1b[32m'),
+            (SGRState(fg='31', bg='40'), SGRState(), '\x1b[0m'),
+            (SGRState(fg='31', bg='40'), SGRState(fg='31'), '\x1b[49m'),
+            # default and explicit white/black are different states
+            (SGRState(), SGRState(fg='37', bg='40'), '\x1b[37;40m'),
+            (SGRState('91', '40', frozenset({'1'})), SGRState('31', '40'), '\x1b[22;31m'),
+            # a reset is shorter than turning attributes off one by one
+            (SGRState('31', '40', frozenset({'4', '7'})), SGRState('31'), '\x1b[0;31m'),
+            (SGRState('31', '40', frozenset({'1', '2'})), SGRState('31', '40', frozenset({'2'})), '\x1b[22;2m'),
+        ],
+    )
+    def test_transition(self, current: SGRState, target: SGRState, expected: str) -> None:
+        assert current.transition(target) == expected
+
+
+class TestSGROptimiser:
+    'Test the SGR optimiser keeps the rendered screen identical'
+
+    def test_combines_and_drops_sequences(self) -> None:
+        optimiser = SGROptimiser()
+        lines = ['\x1b[0m\x1b[31m\x1b[40mA\x1b[0m\n', '\x1b[31m\x1b[40mB\x1b[0m\x1b[0m\n']
+        assert list(optimiser.optimise(lines)) == ['\x1b[31;40mA\x1b[0m\n', '\x1b[31;40mB\x1b[0m\n']
+        assert optimiser.saved == sum(map(len, lines)) - len('\x1b[31;40mA\x1b[0m\n\x1b[31;40mB\x1b[0m\n')
+
+    def test_ends_reset(self) -> None:
+        assert list(SGROptimiser().optimise(['\x1b[31mA'])) == ['\x1b[31mA\x1b[0m']
+        assert list(SGROptimiser().optimise(['A\x1b[31m'])) == ['A']
+
+    def test_unknown_sequences_pass_through(self) -> None:
+        lines = ['\x1b[31mA\x1b[58;5;1mB\x1b[32mC\x1b[0;33mD\x1b[0m']
+        assert list(SGROptimiser().optimise(lines)) == ['\x1b[31mA\x1b[58;5;1mB\x1b[32mC\x1b[0;33mD\x1b[0m']
+
+    @pytest.mark.parametrize('ice_colours', [False, True])
+    @pytest.mark.parametrize('data', GOLDEN_DATA)
+    def test_rendered_screen_is_identical(self, data: str, ice_colours: bool) -> None:
+        expected = create_renderer(data, tokeniser_kwargs={'ice_colours': ice_colours}).render()
+        renderer = create_renderer(data, tokeniser_kwargs={'ice_colours': ice_colours})
+        renderer.optimiser = SGROptimiser()
+        result = renderer.render()
+
+        assert screen(result) == screen(expected)
+        assert len(result) <= len(expected)
+        assert renderer.optimiser.saved == len(expected) - len(result)
@@ -1,17 +1,40 @@
 #!/usr/bin/env python3
 'Unit tests for Renderer class, gen_lines() and render() methods in convert.py'
 
+import io
+import json
+import random
+from argparse import ArgumentTypeError
+from dataclasses import dataclass
+from itertools import pairwise
+from pathlib import Path
+
+import pytest
+
+from ansi_art_convert import convert
 from ansi_art_convert.convert import (
+    C0Token,
     Color8BGToken,
     Color8FGToken,
     ControlToken,
+    CP437Token,
     EOFToken,
     NewLineToken,
+    RenderCheckpoint,
+    RenderEngine,
     Renderer,
+    RenderSession,
+    ScannerEngine,
     SGRToken,
     TextToken,
+    TrueColorFGToken,
+    UnknownToken,
+    coalesce_line,
+    is_split_newline,
+    parse_args,
+    parse_line_range,
 )
-from test.helper import create_renderer, create_tokeniser
+from test.helper import GOLDEN_DATA, create_renderer, create_tokeniser, random_art, screen
 
 
 class TestRenderer:
@@ -89,6 +112,17 @@ class TestSplitTextToken:
         ]
         assert result == expected
 
+    def test_split_text_token_spans_are_not_retranslated(self) -> None:
+        self.renderer.width = 4
+        token = CP437Token(value='░▒▓█' * 3, offset=0xE000)
+
+        result = list(self.renderer.split_text_token(token, remainder=2))
+
+        assert [t.value for t in result] == [token.value[:2], token.value[2:6], token.value[6:10], token.value[10:]]
+        assert [t.original_value for t in result] == ['░▒', '▓█░▒', '▓█░▒', '▓█']
+        assert [t.cell_width for t in result] == [2, 4, 4, 2]
+        assert all(type(t) is CP437Token and t.offset == 0xE000 for t in result)
+
 
 class TestGenLines:
     'Test gen_lines method - core line generation logic'
@@ -442,6 +476,19 @@ class TestRender:
         )
         assert result == expected
 
+    def test_render_negative_cursor_forward_wraps(self) -> None:
+        'A negative cursor forward renders nothing, so takes no cells from the line.'
+        self.renderer.tokeniser.data = 'A' * 50 + '\x1b[-5C' + 'A' * 50
+
+        result = self.renderer.render()
+        expected = (
+            TextToken._translate_chars('A' * 80, self.offset)
+            + '\x1b[0m\n'
+            + TextToken._translate_chars('A' * 20, self.offset)
+            + '\x1b[0m'
+        )
+        assert result == expected
+
     def test_render_empty_input(self) -> None:
         self.renderer.tokeniser.data = ''
 
@@ -639,3 +686,355 @@ class TestRendererEdgeCases:
             + '\x1b[0m\x1b[37m\x1b[40m\x1b[0m'
         )
         assert result == expected
+
+
+class TestRendererTokenSource:
+    'Test rendering from an alternative token source'
+
+    def test_render_from_token_buffer(self) -> None:
+        data = '\x1b[1;33;44m' + '░' * 100 + '\x1b[0m\r\n\x1b[A\x1b[5CText\x1b[32mGreen\n'
+        expected = create_renderer(data).render()
+        renderer = create_renderer(data)
+        renderer.tokens = renderer.tokeniser.tokenise_buffer()
+        assert renderer.render() == expected
+
+
+@dataclass(slots=True)
+class MarkedTextToken(TextToken):
+    'A TextToken subclass the renderer has no handler for'
+
+    marked: bool = True
+
+
+class TestRendererDispatch:
+    'Test the token type -> handler table used by gen_lines'
+
+    def test_handlers_resolve_by_nearest_base_class(self) -> None:
+        renderer = create_renderer('')
+        assert renderer._resolve_handler(C0Token) == renderer._render_text
+        assert renderer._resolve_handler(MarkedTextToken) == renderer._render_text
+        assert renderer._resolve_handler(UnknownToken) == renderer._render_other
+        assert renderer._handlers[MarkedTextToken] == renderer._render_text
+
+    def test_render_token_subclass(self) -> None:
+        expected = create_renderer('abc' * 30 + '\n').render()
+        renderer = create_renderer('')
+        renderer.tokens = [
+            MarkedTextToken(value='abc' * 30, offset=renderer.tokeniser.glyph_offset),
+            NewLineToken(value='\n'),
+        ]
+        assert renderer.render() == expected
+
+
+class TestCoalesceLine:
+    'Test serialising rendered lines as runs of text sharing the same attributes'
+
+    def test_unchanged_colours_are_dropped(self) -> None:
+        red, black = Color8FGToken.shared('31'), Color8BGToken.shared('40')
+        line = [
+            *[red, black, TextToken(value='a', offset=0)],
+            *[red, black, ControlToken(value='\x1b[2C')],
+            *[red, black, TextToken(value='b', offset=0)],
+            *[SGRToken.shared('0'), NewLineToken(value='\n')],
+        ]
+        assert coalesce_line(line) == '\x1b[31m\x1b[40ma  b\x1b[0m\n'
+
+    def test_changes(self) -> None:
+        line = [
+            *[SGRToken.shared('1'), Color8FGToken.shared('31'), TextToken(value='a', offset=0)],
+            # only adds/changes, so only the difference is emitted
+            *[Color8BGToken.shared('44'), Color8FGToken.shared('32'), TextToken(value='b', offset=0)],
+            # removes bold, so reset and set the rest again
+            *[SGRToken.shared('0'), Color8FGToken.shared('32'), TextToken(value='c', offset=0)],
+            *[TrueColorFGToken(value='1,2,3'), TextToken(value='d', offset=0)],
+            SGRToken.shared('0'),
+            EOFToken(value=''),
+        ]
+        assert coalesce_line(line) == ('\x1b[1m\x1b[31ma\x1b[32m\x1b[44mb\x1b[0m\x1b[32mc\x1b[38;2;1;2;3md\x1b[0m')
+
+    def test_unknown_sequences_pass_through(self) -> None:
+        red = Color8FGToken.shared('31')
+        line = [red, UnknownToken(value='\x1b[999Z'), red, TextToken(value='a', offset=0), SGRToken.shared('0')]
+        assert coalesce_line(line) == '\x1b[31m\x1b[999Za\x1b[0m'
+
+    @pytest.mark.parametrize('ice_colours', [False, True])
+    @pytest.mark.parametrize('data', GOLDEN_DATA)
+    def test_rendered_screen_is_identical(self, data: str, ice_colours: bool) -> None:
+        kwargs = {'ice_colours': ice_colours}
+        expected = create_renderer(data, tokeniser_kwargs=kwargs).render()
+        result = create_renderer(data, tokeniser_kwargs=kwargs, renderer_kwargs={'coalesce': True}).render()
+
+        assert screen(result) == screen(expected)
+        assert len(result) <= len(expected)
+
+
+class RecordingWriter(io.BytesIO):
+    'BytesIO that records the size of each write and the number of flushes.'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes: list[int] = []
+        self.flushes = 0
+
+    def write(self, b: bytes) -> int:  # type: ignore[override]
+        self.writes.append(len(b))
+        return super().write(b)
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+
+class TestRendererWrite:
+    'Test streaming rendered lines into a binary writer'
+
+    DATA = ''.join(f'\x1b[3{i % 8}mLine {i} ░▒▓\r\n' for i in range(50))
+
+    def test_write_matches_render(self) -> None:
+        expected = create_renderer(self.DATA).render().encode('utf-8')
+        out = RecordingWriter()
+        n = create_renderer(self.DATA).write(out)
+        assert out.getvalue() == expected
+        assert n == len(expected)
+        assert out.writes == [len(expected)]  # everything fits under the default flush_bytes
+
+    def test_write_flush_lines(self) -> None:
+        out = RecordingWriter()
+        create_renderer(self.DATA).write(out, flush_lines=1)
+        assert out.getvalue() == create_renderer(self.DATA).render().encode('utf-8')
+        assert len(out.writes) == out.flushes == len(list(create_renderer(self.DATA).iter_lines()))
+
+    def test_write_flush_bytes(self) -> None:
+        out = RecordingWriter()
+        create_renderer(self.DATA).write(out, flush_bytes=100)
+        assert out.getvalue() == create_renderer(self.DATA).render().encode('utf-8')
+        assert len(out.writes) > 1
+        assert all(n >= 100 for n in out.writes[:-1])
+
+
+class TestLineRange:
+    'Test rendering a range of lines, resuming from checkpoints'
+
+    DATA = random_art(7, n_lines=60)
+
+    def checkpointed(self, tokeniser_kwargs: dict) -> list[RenderCheckpoint]:
+        renderer = create_renderer(
+            self.DATA, tokeniser_kwargs=tokeniser_kwargs, renderer_kwargs={'checkpoint_every': 5}
+        )
+        list(renderer.iter_lines())
+        return renderer.checkpoints
+
+    @pytest.mark.parametrize(
+        'value, expected', [('5:10', (5, 10)), ('5:', (5, None)), (':10', (0, 10)), (':', (0, None))]
+    )
+    def test_parse_line_range(self, value: str, expected: tuple) -> None:
+        assert parse_line_range(value) == expected
+
+    @pytest.mark.parametrize('value', ['5', 'a:b', '-5:3', '5:3', '2:-1'])
+    def test_parse_line_range_invalid(self, value: str) -> None:
+        with pytest.raises(ArgumentTypeError):
+            parse_line_range(value)
+
+    def test_checkpoints_are_recorded_at_newlines(self) -> None:
+        checkpoints = self.checkpointed({})
+        assert len(checkpoints) > 5
+        assert all(b.line - a.line >= 5 for a, b in pairwise(checkpoints))
+        assert all(self.DATA[c.offset - 1] == '\n' for c in checkpoints)
+
+    @pytest.mark.parametrize('scanner', list(ScannerEngine))
+    @pytest.mark.parametrize('ice_colours', [False, True])
+    def test_resumed_range_matches_full_render(self, scanner: ScannerEngine, ice_colours: bool) -> None:
+        kwargs = {'scanner': scanner, 'ice_colours': ice_colours}
+        expected = list(create_renderer(self.DATA, tokeniser_kwargs=kwargs).iter_lines())
+        checkpoints = self.checkpointed(kwargs)
+        for start in range(0, len(expected), 3):
+            renderer = create_renderer(
+                self.DATA, tokeniser_kwargs=kwargs, renderer_kwargs={'checkpoints': list(checkpoints)}
+            )
+            assert list(renderer.iter_line_range(start, start + 4)) == expected[start : start + 4]
+        renderer = create_renderer(self.DATA, tokeniser_kwargs=kwargs, renderer_kwargs={'checkpoints': checkpoints})
+        assert list(renderer.iter_line_range(len(expected) - 2)) == expected[-2:]
+
+    def test_line_range_field(self) -> None:
+        expected = create_renderer(self.DATA).render()
+        renderer = create_renderer(self.DATA, renderer_kwargs={'line_range': (10, 20)})
+        assert renderer.render() == ''.join(expected.splitlines(keepends=True)[10:20])
+
+    def test_screen_engine_ignores_checkpoints(self) -> None:
+        kwargs = {'engine': RenderEngine.SCREEN}
+        expected = list(create_renderer(self.DATA, renderer_kwargs=kwargs).iter_lines())
+        renderer = create_renderer(self.DATA, renderer_kwargs=kwargs | {'checkpoints': self.checkpointed({})})
+        assert list(renderer.iter_line_range(30, 35)) == expected[30:35]
+
+    def test_checkpoint_round_trip(self) -> None:
+        for c in self.checkpointed({'ice_colours': True}):
+            assert RenderCheckpoint.from_dict(c.asdict()) == c
+
+    def test_save_and_load(self, tmp_path: Path) -> None:
+        fpath = str(tmp_path / 'art.ans')
+        with open(fpath, 'w') as f:
+            f.write(self.DATA)
+        renderer = create_renderer(self.DATA, renderer_kwargs={'fpath': fpath, 'checkpoint_every': 5})
+        list(renderer.iter_lines())
+        renderer.save_checkpoints(fpath + '.lines.json')
+
+        loaded = create_renderer(self.DATA, renderer_kwargs={'fpath': fpath, 'checkpoint_every': 5})
+        loaded.load_checkpoints(fpath + '.lines.json')
+        assert loaded.checkpoints == renderer.checkpoints
+
+        # checkpoints taken with different settings are ignored
+        other = create_renderer(
+            self.DATA, tokeniser_kwargs={'width': 40}, renderer_kwargs={'fpath': fpath, 'checkpoint_every': 5}
+        )
+        other.load_checkpoints(fpath + '.lines.json')
+        assert other.checkpoints == []
+
+        # as are missing or corrupt files
+        loaded.checkpoints = []
+        loaded.load_checkpoints(fpath + '.missing.json')
+        with open(fpath + '.lines.json', 'w') as f:
+            f.write('{"key":')
+        loaded.load_checkpoints(fpath + '.lines.json')
+        assert loaded.checkpoints == []
+
+
+class TestRenderSession:
+    'Test incremental rendering of growing data'
+
+    def feed_chunks(self, data: bytes, seed: int, restore: bool = False) -> str:
+        rng = random.Random(seed)
+        session, lines, pos = RenderSession(create_renderer(b'')), [], 0
+        while pos < len(data):
+            n = rng.randint(1, 20)
+            lines.extend(session.feed(data[pos : pos + n]))
+            pos += n
+            if restore:
+                session = RenderSession.from_dict(create_renderer(b''), json.loads(json.dumps(session.asdict())))
+        return ''.join(lines + session.tail())
+
+    @pytest.mark.parametrize('data', GOLDEN_DATA + ['ab\r\n\x1b[A\x1b[5Cxy\r\n' * 5])
+    def test_matches_full_render(self, data: str) -> None:
+        raw = data.encode('utf-8')
+        expected = create_renderer(raw).render()
+        assert self.feed_chunks(raw, seed=0) == expected
+        assert self.feed_chunks(raw, seed=1, restore=True) == expected
+
+    def test_only_new_complete_lines_are_returned(self) -> None:
+        session = RenderSession(create_renderer(b''))
+        assert session.feed(b'\x1b[31mabc') == []
+        # the line ending isn't final until the next token is known (it could be a cursor up)
+        assert session.feed(b'\r\n') == []
+        assert session.feed(b'\x1b[32') == []
+        # the second line ending is followed by a text run that might not be complete yet
+        expected = create_renderer(b'\x1b[31mabc\r\n\x1b[32mdef\r\ng').render().splitlines(True)
+        assert session.feed(b'mdef\r\ng') == expected[:1]
+        assert session.pending == b'\x1b[32mdef\r\ng'
+        assert session.offset == len(b'\x1b[31mabc\r\n\x1b[32mdef\r\ng')
+        assert session.tail() == session.tail() == expected[1:]
+
+    def test_state_with_different_settings_is_ignored(self) -> None:
+        session = RenderSession(create_renderer(b''))
+        session.feed(b'abc\r\ndef\r\nghi')
+        state = json.loads(json.dumps(session.asdict()))
+        restored = RenderSession.from_dict(create_renderer(b''), state)
+        assert (restored.checkpoint, restored.pending) == (session.checkpoint, session.pending)
+        restored = RenderSession.from_dict(create_renderer(b'', tokeniser_kwargs={'width': 40}), state)
+        assert restored.offset == 0
+
+    def test_feed_file(self, tmp_path: Path) -> None:
+        fpath = tmp_path / 'capture.ans'
+        fpath.write_bytes(b'abc\r\nde')
+        session = RenderSession(create_renderer(b''))
+        lines = session.feed_file(str(fpath))
+        with open(fpath, 'ab') as f:
+            f.write(b'f\r\nghi\r\njk')
+        lines += session.feed_file(str(fpath))
+        assert ''.join(lines + session.tail()) == create_renderer(fpath.read_bytes()).render()
+
+    def test_screen_engine_is_not_supported(self) -> None:
+        with pytest.raises(ValueError):
+            RenderSession(create_renderer(b'', renderer_kwargs={'engine': RenderEngine.SCREEN}))
+
+    @pytest.mark.parametrize(
+        'flags',
+        [
+            ['--stream'],
+            ['--sauce-only'],
+            ['--engine', 'screen'],
+            ['--optimise-sgr'],
+            ['--lines', '1:2'],
+            ['--jobs', '2'],
+        ],
+    )
+    def test_unsupported_flags_are_rejected(
+        self, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture, flags: list[str]
+    ) -> None:
+        monkeypatch.setattr('sys.argv', ['ansi-art-convert', '-f', 'art.ans', '--session', 'state.json', *flags])
+        with pytest.raises(SystemExit):
+            parse_args()
+        assert f"--session can't be combined with {flags[0]}" in capsys.readouterr().err
+
+
+class TestParallelRender:
+    'Test splitting the data and rendering the segments in worker processes'
+
+    DATA = random_art(11, n_lines=100)
+
+    @pytest.mark.parametrize(
+        'data, expected',
+        [
+            ('ab\r\ncd', True),
+            ('ab\n\x1b[31mcd', True),
+            # inside an escape sequence, or the end
+            ('\x1b[1\n2mcd', False),
+            ('ab\n', False),
+            # skipped after a cursor up + CR, or followed by a cursor up
+            ('ab\x1b[A\r\ncd', False),
+            ('ab\r\n\x1b[2Acd', False),
+            ('ab\r\n\x1b[2Ccd', True),
+        ],
+    )
+    def test_is_split_newline(self, data: str, expected: bool) -> None:
+        assert is_split_newline(data, data.index('\n'), 'utf-8') == expected
+        assert is_split_newline(data.encode(), data.encode().index(b'\n'), 'utf-8') == expected
+
+    @pytest.mark.parametrize('window', [64, 1024, convert.SPLIT_SCAN_WINDOW])
+    @pytest.mark.parametrize('scanner', list(ScannerEngine))
+    def test_split_states_match_full_render(
+        self, scanner: ScannerEngine, window: int, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # small windows start from unknown states, and rely on finding a full reset before the split
+        monkeypatch.setattr(convert, 'SPLIT_SCAN_WINDOW', window)
+        kwargs = {'scanner': scanner, 'ice_colours': True}
+        renderer = create_renderer(self.DATA, tokeniser_kwargs=kwargs, renderer_kwargs={'checkpoint_every': 1})
+        list(renderer.iter_lines())
+        checkpoints = {c.offset: c for c in renderer.checkpoints}
+
+        splits = create_renderer(self.DATA, tokeniser_kwargs=kwargs).scan_splits(8)
+        assert len(splits) == 7
+        for split in splits:
+            expected = checkpoints[split.offset]
+            assert (split.fg, split.bg, split.sgr, split.new_line) == (
+                expected.fg,
+                expected.bg,
+                expected.sgr,
+                expected.new_line,
+            )
+
+    @pytest.mark.parametrize('scanner', list(ScannerEngine))
+    @pytest.mark.parametrize('coalesce', [False, True])
+    def test_matches_serial_render(self, scanner: ScannerEngine, coalesce: bool) -> None:
+        data = ''.join(GOLDEN_DATA)
+        kwargs = {'scanner': scanner}
+        expected = create_renderer(data, tokeniser_kwargs=kwargs, renderer_kwargs={'coalesce': coalesce}).render()
+        renderer = create_renderer(data, tokeniser_kwargs=kwargs, renderer_kwargs={'coalesce': coalesce, 'jobs': 4})
+        assert renderer.render() == expected
+
+    def test_cursor_save_and_position(self) -> None:
+        data = self.DATA[:2000] + '\x1b[s' + self.DATA[2000:] + '\x1b[1;1H' + self.DATA
+        expected = create_renderer(data).render()
+        assert create_renderer(data, renderer_kwargs={'jobs': 3}).render() == expected
+
+    def test_no_splits(self) -> None:
+        data = '\x1b[31m' + 'x' * 500
+        assert create_renderer(data).scan_splits(4) == []
+        assert create_renderer(data, renderer_kwargs={'jobs': 4}).render() == create_renderer(data).render()
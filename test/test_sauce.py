@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 "Unit tests for SAUCE metadata parsing in sauce.py"
 
+import io
+import json
+import re
+import struct
+from pathlib import Path
+
 import pytest
 
-from ansi_art_convert.encoding import SupportedEncoding
+from ansi_art_convert import convert
+from ansi_art_convert.convert import strip_sauce_tail
+from ansi_art_convert.encoding import SupportedEncoding, detect
 from ansi_art_convert.sauce import (
     ASPECT_RATIO_MAP,
     LETTER_SPACING_MAP,
+    SAUCE_STRUCT,
     SauceRecord,
     SauceRecordExtended,
 )
@@ -240,6 +249,187 @@ class TestSauceRecordParseRecord:
         assert result == expected
 
 
+class TestSauceRecordCodec:
+    'Test the SAUCE_STRUCT record codec'
+
+    RECORD = SauceRecord(
+        ID='SAUCE',
+        version='00',
+        title='Title ░',
+        author='Author',
+        group='Group',
+        date='20240101',
+        filesize=65536,
+        data_type=1,
+        file_type=1,
+        tinfo1=80,
+        tinfo2=25,
+        tinfo3=0,
+        tinfo4=1,
+        comments=2,
+        flags=17,
+        tinfo_s='IBM VGA',
+    )
+
+    def test_struct_matches_offsets(self) -> None:
+        assert SAUCE_STRUCT.size == 128
+        sizes = [struct.calcsize('<' + f) for f in re.findall(r'\d*[sIBH]', SAUCE_STRUCT.format[1:])]
+        assert sizes == [end - start for start, end in SauceRecord.offsets().values()]
+
+    def test_round_trip(self) -> None:
+        record_bytes = self.RECORD.record_bytes('cp437')
+        assert len(record_bytes) == 128
+        assert record_bytes[:5] == b'SAUCE'
+        assert record_bytes[90:94] == (65536).to_bytes(4, 'little')
+        assert SauceRecord.parse_record_bytes(record_bytes, 'cp437') == (self.RECORD, b'')
+
+    def test_long_strings_are_truncated(self) -> None:
+        record = SauceRecord(ID='SAUCE', title='x' * 50)
+        assert SauceRecord.parse_record_bytes(record.record_bytes('cp437'), 'cp437')[0].title == 'x' * 35
+
+    def test_parse_records(self) -> None:
+        records = [self.RECORD._replace(title=f'Art {i}', tinfo1=i) for i in range(10)]
+        batch = b''.join(r.record_bytes('cp437') for r in records)
+        assert list(SauceRecord.parse_records(batch, 'cp437')) == records
+        assert list(SauceRecord.parse_records(b'', 'cp437')) == []
+        with pytest.raises(struct.error):
+            list(SauceRecord.parse_records(batch[:-1], 'cp437'))
+
+
+class TestSauceRecordParseRecordBytes:
+    'Test SauceRecord.parse_record_bytes() static method'
+
+    def test_parse_record_bytes_matches_parse_record(self) -> None:
+        full_data = 'Hello ░▒▓'.encode('cp437') + SauceRecord(ID='SAUCE', version='00', tinfo1=80).record_bytes('cp437')
+
+        record, data = SauceRecord.parse_record_bytes(full_data, 'cp437')
+        expected_record, expected_data = SauceRecord.parse_record(full_data, 'cp437')
+
+        assert isinstance(data, memoryview)
+        assert record == expected_record
+        assert str(data, 'cp437') == expected_data
+
+    def test_parse_record_bytes_no_sauce_record(self) -> None:
+        file_data = b'Just plain text data without SAUCE'
+
+        record, data = SauceRecord.parse_record_bytes(file_data, 'cp437')
+
+        assert record.is_empty() is True
+        assert data == file_data
+
+    def test_parse_record_bytes_shorter_than_record(self) -> None:
+        record, data = SauceRecord.parse_record_bytes(b'SAUCE00Title', 'cp437')
+        assert record == SauceRecord(ID='SAUCE', version='00', title='Title')
+        assert data == b''
+
+    def test_parse_extended_with_bytes_comments(self) -> None:
+        comments = ['first comment', 'second comment']
+        file_data = b'ANSI art data' + SauceRecordExtended.write_comments(comments).encode('cp437')
+        sauce = SauceRecord(ID='SAUCE', data_type=1, file_type=1, comments=2, tinfo_s='IBM VGA')
+
+        extended, data = SauceRecordExtended.parse(
+            sauce, memoryview(file_data), '/test/file.ans', SupportedEncoding.CP437
+        )
+
+        assert extended.comments_data == comments
+        assert data == b'ANSI art data'
+
+
+class TestSauceRecordExtendedParseFileTail:
+    'Test SauceRecordExtended.parse_file_tail() static method'
+
+    SAUCE = SauceRecord(ID='SAUCE', version='00', data_type=1, file_type=1, tinfo1=80, flags=1, tinfo_s='IBM VGA')
+
+    FILE_DATA = (
+        b'',
+        b'Just plain text data without SAUCE',
+        'Hello ░▒▓\x1a'.encode('cp437') + SAUCE.record_bytes('cp437'),
+        b'ANSI art data'
+        + SauceRecordExtended.write_comments(['first comment', 'second']).encode('cp437')
+        + SAUCE._replace(comments=2).record_bytes('cp437'),
+        # not enough data for the comment block
+        b'short' + SAUCE._replace(comments=3).record_bytes('cp437'),
+        # longer than the held back tail
+        b'ANSI art data' * 5000 + SAUCE.record_bytes('cp437'),
+    )
+
+    @pytest.mark.parametrize('file_data', FILE_DATA)
+    def test_parse_file_tail_matches_parse(self, file_data: bytes) -> None:
+        encoding = SupportedEncoding.CP437
+        record, data = SauceRecord.parse_record_bytes(file_data, encoding.value)
+        expected, expected_data = SauceRecordExtended.parse(record, data, '/test/file.ans', encoding)
+
+        extended, length = SauceRecordExtended.parse_file_tail(io.BytesIO(file_data), '/test/file.ans', encoding)
+
+        assert extended == expected
+        assert file_data[:length] == expected_data
+
+    @pytest.mark.parametrize('chunk_size', [1, 1000, 1 << 20])
+    @pytest.mark.parametrize('file_data', FILE_DATA)
+    def test_strip_sauce_tail_matches_parse(self, file_data: bytes, chunk_size: int) -> None:
+        encoding = SupportedEncoding.CP437
+        record, data = SauceRecord.parse_record_bytes(file_data, encoding.value)
+        _, expected_data = SauceRecordExtended.parse(record, data, '-', encoding)
+
+        chunks = (file_data[i : i + chunk_size] for i in range(0, len(file_data), chunk_size))
+        assert b''.join(strip_sauce_tail(chunks, '-', encoding)) == expected_data
+
+    def test_read_file(self, tmp_path: Path) -> None:
+        art = b'ANSI art data' * 1000
+        comments = SauceRecordExtended.write_comments(['a comment']).encode('cp437')
+        fpath = tmp_path / 'art.ans'
+        fpath.write_bytes(art + comments + self.SAUCE._replace(comments=1).record_bytes('cp437'))
+
+        extended, data = SauceRecordExtended.read_file(str(fpath), SupportedEncoding.CP437)
+        assert extended.comments_data == ['a comment']
+        assert extended.sauce.tinfo_s == 'IBM VGA'
+        assert data == b''
+        assert SauceRecordExtended.read_file(str(fpath), SupportedEncoding.CP437, read_data=True) == (extended, art)
+
+    ISO_ART = ('Ñandú |--| :: /\\__/\\ ¯¯\r\n' * 20).encode('iso-8859-1')
+
+    @pytest.mark.parametrize(
+        'art, font_name, expected',
+        [
+            # detected from the content, whatever the font says
+            (b'\xb0\xdb' * 1000, 'Amiga Topaz 1', SupportedEncoding.CP437),
+            (ISO_ART, 'IBM VGA', SupportedEncoding.ISO_8859_1),
+            # a tied detection goes to the font's encoding, when it names one
+            (b'plain text' * 100, 'Amiga Topaz 1', SupportedEncoding.ISO_8859_1),
+            (b'plain text' * 100, 'IBM VGA', SupportedEncoding.CP437),
+            (b'plain text' * 100, 'IBM VGA 850', SupportedEncoding.CP437),
+            (b'plain text' * 100, '', SupportedEncoding.CP437),
+        ],
+    )
+    def test_sauce_only_encoding(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, art: bytes, font_name: str, expected: SupportedEncoding
+    ) -> None:
+        fpath = tmp_path / 'art.ans'
+        fpath.write_bytes(art + self.SAUCE._replace(tinfo_s=font_name).record_bytes('cp437'))
+        read_encodings: list[SupportedEncoding] = []
+        read_file = SauceRecordExtended.read_file
+
+        def recording_read_file(fpath: str, encoding: SupportedEncoding) -> tuple[SauceRecordExtended, bytes]:
+            read_encodings.append(encoding)
+            return read_file(fpath, encoding)
+
+        monkeypatch.setattr(SauceRecordExtended, 'read_file', recording_read_file)
+        convert.main_sauce({'fpath': str(fpath), 'encoding': None})
+        assert read_encodings[-1] == expected
+
+    def test_sauce_only_matches_render_encoding(self, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+        'ISO-8859-1 art with an IBM font: the title decodes as it does when rendering, not as CP437.'
+        fpath = tmp_path / 'art.ans'
+        sauce = self.SAUCE._replace(title='Ñandú')
+        fpath.write_bytes(self.ISO_ART + b'\x1a' + sauce.record_bytes('iso-8859-1'))
+        assert detect(self.ISO_ART).encoding == SupportedEncoding.ISO_8859_1
+
+        convert.main_sauce({'fpath': str(fpath), 'encoding': None})
+        output = json.loads(capsys.readouterr().out)
+        assert output['sauce']['title'] == 'Ñandú'
+        assert output['extended']['encoding'] == 'iso-8859-1'
+
+
 class TestSauceRecordExtendedParseComments:
     'Test SauceRecordExtended.parse_comments() static method'
 
@@ -255,13 +445,11 @@ class TestSauceRecordExtendedParseComments:
     def test_parse_multiple_comments(self) -> None:
         'Test parsing multiple comments'
 
-        comment_block = SauceRecordExtended.write_comments(
-            [
-                'Comment line 1',
-                'Comment line 2',
-                'Comment line 3',
-            ]
-        )
+        comment_block = SauceRecordExtended.write_comments([
+            'Comment line 1',
+            'Comment line 2',
+            'Comment line 3',
+        ])
         result = SauceRecordExtended.parse_comments(comment_block, 3)
 
         expected = [
@@ -393,6 +581,21 @@ class TestSauceRecordExtendedParseFont:
         # Should not match due to trailing spaces
         assert result == {}
 
+    @pytest.mark.parametrize(
+        'font_name, expected',
+        [
+            ('IBM VGA', SupportedEncoding.CP437),
+            ('IBM EGA43', SupportedEncoding.CP437),
+            ('IBM VGA 437', SupportedEncoding.CP437),
+            ('IBM VGA 850', None),
+            ('Amiga Topaz 1+', SupportedEncoding.ISO_8859_1),
+            ('C64 PETSCII shifted', None),
+            ('', None),
+        ],
+    )
+    def test_font_encoding(self, font_name: str, expected: SupportedEncoding | None) -> None:
+        assert SauceRecordExtended.font_encoding(font_name) == expected
+
 
 class TestSauceRecordExtendedParseTinfoField:
     'Test SauceRecordExtended.parse_tinfo_field() static method'
@@ -868,11 +1071,9 @@ class TestSauceIntegration:
             flags=1,  # ICE colors enabled
             tinfo_s='IBM VGA',
         )
-        comment_block = SauceRecordExtended.write_comments(
-            [
-                'comment 1',
-            ]
-        )
+        comment_block = SauceRecordExtended.write_comments([
+            'comment 1',
+        ])
 
         sauce, data = SauceRecord.parse_record(
             file_content + comment_block.encode('cp437') + sauce_binary.record_bytes('cp437'),
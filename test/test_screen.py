@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+'Unit tests for the Screen virtual terminal render engine in convert.py'
+
+import re
+
+import pytest
+
+from ansi_art_convert.convert import SCREEN_ATTRIBUTE_BITS, SCREEN_ROW_BLOCK, SGR_CODES, RenderEngine, Screen
+from test.helper import create_renderer, create_tokeniser
+
+ESCAPE = re.compile(r'\x1b[^A-Za-z]*[A-Za-z]')
+
+
+def draw(data: str, width: int = 10, ice_colours: bool = False) -> Screen:
+    tokeniser = create_tokeniser(data, tokeniser_kwargs={'ice_colours': ice_colours})
+    screen = Screen(width=width)
+    screen.feed(tokeniser.tokenise())
+    return screen
+
+
+def plain(output: str) -> list[str]:
+    'Rendered rows without escape sequences, with glyphs mapped back to ASCII.'
+    text = ESCAPE.sub('', output)
+    offset = create_tokeniser().glyph_offset
+    return [''.join(chr(ord(c) - offset) if ord(c) >= offset else c for c in row) for row in text.split('\n')[:-1]]
+
+
+class TestScreen:
+    'Test drawing text and moving the cursor around the screen'
+
+    @pytest.mark.parametrize(
+        'data, expected',
+        [
+            ('abc', ['abc']),
+            ('abc\r\ndef\n', ['abc', 'def']),
+            # wraps at the width, a line exactly as wide as the screen is followed by a blank one before CRLF
+            ('0123456789ab', ['0123456789', 'ab']),
+            ('0123456789\r\nab', ['0123456789', '', 'ab']),
+            # cursor forward moves over cells without painting them, and stops at the right margin
+            ('a\x1b[3Cb', ['a   b']),
+            ('a\x1b[99Cb', ['a        b']),
+            ('abcd\x1b[2De', ['abed']),
+            # absolute positioning, 1-based, missing params default to 1
+            ('abc\r\ndef\x1b[1;2HX', ['aXc', 'def']),
+            ('abc\x1b[HX', ['Xbc']),
+            ('\x1b[3;4HX', ['', '', '   X']),
+            ('abc\x1b[2GX', ['aXc']),
+            # cursor up/down and next/previous line
+            ('aaaa\r\nbbbb\x1b[A\x1b[2DZ', ['aaZa', 'bbbb']),
+            ('a\x1b[2Bb', ['a', '', ' b']),
+            ('a\x1b[2Eb\x1b[Fc', ['a', 'c', 'b']),
+            ('ab\x1b[5A\x1b[Dc', ['ac']),
+            # save/restore
+            ('ab\x1b[s\r\ncd\x1b[uX', ['abX', 'cd']),
+        ],
+    )
+    def test_cursor_movement(self, data: str, expected: list[str]) -> None:
+        assert plain(draw(data).render()) == expected
+
+    @pytest.mark.parametrize(
+        'data, expected',
+        [
+            ('abcdef\x1b[3D\x1b[K', ['abc']),
+            ('abcdef\x1b[3D\x1b[0K', ['abc']),
+            ('abcdef\x1b[3D\x1b[1K', ['    ef']),
+            ('abcdef\x1b[3D\x1b[2KX', ['   X']),
+            ('abc\r\ndef\r\nghi\x1b[2;2H\x1b[J', ['abc', 'd', '']),
+            ('abc\r\ndef\r\nghi\x1b[2;2H\x1b[1J', ['', '  f', 'ghi']),
+            ('abc\r\ndef\x1b[2JX', ['X']),
+            ('a\r\nb\r\nc\x1b[S', ['b', 'c']),
+            ('a\r\nb\x1b[2T', ['', '', 'a', 'b']),
+        ],
+    )
+    def test_erase_and_scroll(self, data: str, expected: list[str]) -> None:
+        assert plain(draw(data).render()) == expected
+
+    def test_unknown_and_malformed_sequences_are_dropped(self) -> None:
+        assert plain(draw('a\x1b[?25hb\x1b[1:2Hc\x1b[999Zd').render()) == ['abcd']
+
+    def test_colours(self) -> None:
+        screen = draw('\x1b[1;31;44mab\x1b[0mc\x1b[3Cd')
+        assert screen.palette == ['', '\x1b[91m', '\x1b[44m', '\x1b[37m', '\x1b[40m']
+        offset = create_tokeniser().glyph_offset
+        a, b, c, d = (chr(offset + ord(ch)) for ch in 'abcd')
+        # the cells skipped by cursor forward are unwritten, so drawn with the default colours
+        assert screen.render() == (
+            f'\x1b[0m\x1b[1m\x1b[91m\x1b[44m{a}{b}\x1b[0m\x1b[37m\x1b[40m{c}\x1b[0m   \x1b[0m\x1b[37m\x1b[40m{d}\x1b[0m\n'
+        )
+
+    @pytest.mark.parametrize('param', [p for p in SGR_CODES if p != '0'])
+    def test_every_sgr_attribute(self, param: str) -> None:
+        screen = draw(f'\x1b[{param}ma')
+        assert screen.attributes[0] == SCREEN_ATTRIBUTE_BITS[param]
+        assert screen.render().startswith(f'\x1b[0m\x1b[{param}m')
+
+    def test_all_sgr_attributes_together(self) -> None:
+        params = [p for p in SGR_CODES if p != '0']
+        screen = draw(f'\x1b[{";".join(params)}ma')
+        assert screen.attributes[0] == sum(SCREEN_ATTRIBUTE_BITS.values())
+        assert screen.render().startswith('\x1b[0m' + ''.join(f'\x1b[{p}m' for p in params))
+
+    def test_ice_colours(self) -> None:
+        screen = draw('\x1b[5;41mab', ice_colours=True)
+        assert '\x1b[101m' in screen.palette
+        assert '\x1b[5m' not in screen.render()
+
+    def test_truecolour(self) -> None:
+        screen = draw('\x1b[1;255;0;0t\x1b[0;0;0;255tab')
+        assert screen.palette == ['', '\x1b[38;2;255;0;0m', '\x1b[48;2;0;0;255m']
+
+    def test_rows_are_allocated_in_blocks(self) -> None:
+        screen = draw('a\x1b[200;1Hb')
+        assert screen.n_rows == 200
+        assert screen.rows_allocated == -(-200 // SCREEN_ROW_BLOCK) * SCREEN_ROW_BLOCK
+
+        screen = draw('x\r\n' * 10_000, width=80)
+        assert screen.n_rows == 10_000
+        assert screen.rows_allocated < 10_000 + SCREEN_ROW_BLOCK
+        # glyph (4 bytes), fg, bg and attributes (2 bytes each) per cell
+        planes = (screen.glyphs, screen.fgs, screen.bgs, screen.attributes)
+        assert sum(len(p) * p.itemsize for p in planes) == 10 * 80 * screen.rows_allocated
+
+    def test_invalid_width(self) -> None:
+        with pytest.raises(ValueError):
+            Screen(width=0)
+
+
+class TestRendererScreenEngine:
+    'Test rendering through the screen engine'
+
+    def test_matches_line_renderer_without_cursor_movement(self) -> None:
+        data = '\x1b[1;33;44mHello\x1b[0m world\r\n\x1b[32mGreen ' + 'x' * 100 + '\r\nend\n'
+        lines = create_renderer(data).render()
+        screen = create_renderer(data, renderer_kwargs={'engine': RenderEngine.SCREEN}).render()
+        assert plain(screen) == [row.rstrip() for row in plain(lines)]
+
+    def test_cursor_up(self) -> None:
+        data = 'aaaa\r\nbbbb\r\n\x1b[2A\x1b[2CZ'
+        renderer = create_renderer(
+            data, tokeniser_kwargs={'width': 10}, renderer_kwargs={'engine': RenderEngine.SCREEN}
+        )
+        assert plain(renderer.render()) == ['aaZa', 'bbbb']
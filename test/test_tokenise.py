@@ -1,20 +1,38 @@
 #!/usr/bin/env python3
 'Unit tests for Tokeniser class and tokenise() method in convert.py'
 
+import tracemalloc
+from typing import Iterator
+
 import pytest
 
+from ansi_art_convert import log
 from ansi_art_convert.convert import (
+    C0_TOKEN_NAMES,
+    CHAR_ALPHA,
+    CHAR_C0,
+    CHAR_CR,
+    CHAR_ESC,
+    CHAR_LF,
+    CHAR_MULTIBYTE,
+    CHAR_TEXT,
+    ANSIToken,
     C0Token,
     Color8Token,
     ControlToken,
     CP437Token,
     NewLineToken,
+    ScannerEngine,
     TextToken,
+    TokenBuffer,
     Tokeniser,
     TrueColorBGToken,
     TrueColorFGToken,
     UnknownToken,
+    char_class,
+    char_class_table,
     get_glyph_offset,
+    parse_escape_sequence,
 )
 from ansi_art_convert.encoding import SupportedEncoding
 from test.helper import create_mock_sauce
@@ -76,6 +94,11 @@ class TestTokeniserCreateTokens:
             font_name='IBM VGA',
         )
 
+    def test_create_tokens_from_string(self) -> None:
+        result = self.tokeniser.create_tokens('\x1b[1;31m')
+        expected = self.tokeniser.create_tokens(list('\x1b[1;31m'))
+        assert result == expected
+
     def test_create_color_token(self) -> None:
         result = self.tokeniser.create_tokens(list('\x1b[31m'))
         expected = [
@@ -142,6 +165,35 @@ class TestTokeniserCreateTokens:
         assert result == expected
 
 
+class TestParseEscapeSequence:
+    'Test the cached escape sequence parser behind create_tokens'
+
+    def setup_method(self) -> None:
+        parse_escape_sequence.cache_clear()
+
+    def test_repeated_sequences_are_cache_hits(self) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans', sauce=create_mock_sauce(), data='\x1b[1;31mA\x1b[1;31mB\x1b[5C', font_name='IBM VGA'
+        )
+        tokens = list(tokeniser.tokenise())
+        info = parse_escape_sequence.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+        assert tokens[0] is tokens[2]
+
+    def test_cache_is_keyed_by_ice_colours(self) -> None:
+        (plain,) = parse_escape_sequence('\x1b[5;41m', False)
+        (ice,) = parse_escape_sequence('\x1b[5;41m', True)
+        assert plain is not ice
+        assert plain == Color8Token(value='5;41', params=['5', '41'], ice_colours=False)
+        assert ice == Color8Token(value='5;41', params=['5', '41'], ice_colours=True)
+
+    def test_create_tokens_returns_a_new_list(self) -> None:
+        tokeniser = Tokeniser(fpath='/test/file.ans', sauce=create_mock_sauce(), data='', font_name='IBM VGA')
+        first, second = tokeniser.create_tokens('\x1b[31m'), tokeniser.create_tokens('\x1b[31m')
+        assert first is not second
+        assert first[0] is second[0]
+
+
 class TestTokeniserTokenise:
     'Test tokenise method - main tokenization logic'
 
@@ -292,3 +344,272 @@ class TestTokeniserTokenise:
             CP437Token(value='C', offset=self.tokeniser.glyph_offset),
         ]
         assert result == expected
+
+
+SCANNER_PARITY_DATA = [
+    '',
+    'Hello',
+    'Hello\nWorld',
+    '\x1b[31mRed\x1b[0m',
+    '\x1b[31mRed\x1b[0m\nNormal\x1b[1;32mBold Green\x1b[10CSpaced',
+    'Hello\r\nWorld\t!\x07\x7f',
+    '\x1b[10;20HText\x1b[A\r\x1b[5C',
+    '\x1b[1;255;128;64t\x1b[0;0;0;0tTrue',
+    '\x1b[999ZUnknown\x1bA',
+    '░▒▓█\x1b[1;33;44m▄▀■\x1b[0m ÇüéâäàåçêëèïîìÄÅ',
+    '\x1b[5Çalpha-terminated',  # non-ASCII alpha terminator
+    '\x1b[5░▒mnon-alpha-inside',  # non-ASCII non-alpha chars inside the sequence
+    '\x1b[3\n1mnewline-inside',
+    '\x1b[\x1b[31mnested',
+    'trailing\x1b[31',  # unterminated sequence at EOF is dropped
+    'trailing\x1b[3░',
+    'Hello ♥ World\x1b[32m♥\n',
+]
+
+
+class TestTokeniserScannerParity:
+    'Test that the regex scanner yields exactly the same tokens as the char scanner'
+
+    @pytest.mark.parametrize('encoding', [SupportedEncoding.CP437, SupportedEncoding.UTF_8])
+    @pytest.mark.parametrize('data', SCANNER_PARITY_DATA)
+    def test_regex_scanner_parity(self, data: str, encoding: SupportedEncoding) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=data,
+            font_name='IBM VGA',
+            encoding=encoding,
+        )
+        expected = list(tokeniser.tokenise_chars(data))
+        result = list(tokeniser.tokenise_regex(data))
+        assert result == expected
+
+    @pytest.mark.parametrize(
+        'encoding', [SupportedEncoding.CP437, SupportedEncoding.ISO_8859_1, SupportedEncoding.UTF_8]
+    )
+    @pytest.mark.parametrize('data', SCANNER_PARITY_DATA)
+    def test_bytes_scanner_parity(self, data: str, encoding: SupportedEncoding) -> None:
+        raw = data.encode(encoding.value, errors='replace')
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=raw,
+            font_name='IBM VGA',
+            encoding=encoding,
+        )
+        expected = list(tokeniser.tokenise_chars(raw.decode(encoding.value)))
+        assert list(tokeniser.tokenise_bytes(raw)) == expected
+        assert list(tokeniser.tokenise_bytes(memoryview(raw))) == expected
+
+    def test_tokenise_bytes_data(self) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data='\x1b[31m▄▀\x1b[0m\r\n'.encode('cp437'),
+            font_name='IBM VGA',
+        )
+        expected = [
+            Color8Token(value='31', params=['31']),
+            CP437Token(value='▄▀', offset=tokeniser.glyph_offset),
+            Color8Token(value='0', params=['0']),
+            C0Token(value='\r', offset=tokeniser.glyph_offset),
+            NewLineToken(value='\n'),
+        ]
+        assert list(tokeniser.tokenise()) == expected
+
+    def test_tokenise_uses_scanner(self) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data='\x1b[31mRed\x1b[0m\n',
+            font_name='IBM VGA',
+            scanner=ScannerEngine.REGEX,
+        )
+        expected = [
+            Color8Token(value='31', params=['31']),
+            CP437Token(value='Red', offset=tokeniser.glyph_offset),
+            Color8Token(value='0', params=['0']),
+            NewLineToken(value='\n'),
+        ]
+        assert list(tokeniser.tokenise()) == expected
+
+
+def reference_tokenise_chars(tokeniser: Tokeniser, data: str) -> Iterator[ANSIToken]:
+    'The original if/elif char-by-char scanner, that the table-driven tokenise_chars must match.'
+    isCode, currCode, currText = False, [], []
+    for ch in data:
+        if ch == '\x1b':
+            isCode = True
+            currCode.append(ch)
+            if currText:
+                yield tokeniser._textTokenType(value=''.join(currText), offset=tokeniser.glyph_offset)
+                currText = []
+        elif isCode:
+            currCode.append(ch)
+            if ch.isalpha():
+                isCode = False
+                yield from tokeniser.create_tokens(currCode)
+                currCode = []
+        elif ch == '\n' or ord(ch) in C0_TOKEN_NAMES:
+            if currText:
+                yield tokeniser._textTokenType(value=''.join(currText), offset=tokeniser.glyph_offset)
+                currText = []
+            yield NewLineToken(value=ch) if ch == '\n' else C0Token(value=ch, offset=tokeniser.glyph_offset)
+        else:
+            currText.append(ch)
+    if currText:
+        yield tokeniser._textTokenType(value=''.join(currText), offset=tokeniser.glyph_offset)
+
+
+class TestCharClassTable:
+    'Test the char class table and the tokenise_chars scanner driven by it'
+
+    def test_code_point_table(self) -> None:
+        table = char_class_table()
+        assert len(table) == 256
+        assert table[0x1B] == CHAR_ESC
+        assert table[ord('\n')] == CHAR_LF
+        assert table[ord('\r')] == CHAR_CR
+        assert {table[n] for n in C0_TOKEN_NAMES} == {CHAR_ESC, CHAR_LF, CHAR_CR, CHAR_C0}
+        for n in range(0x20, 256):
+            assert table[n] == (CHAR_ALPHA if chr(n).isalpha() else CHAR_TEXT), hex(n)
+
+    @pytest.mark.parametrize(
+        'encoding', [SupportedEncoding.CP437, SupportedEncoding.ISO_8859_1, SupportedEncoding.ASCII]
+    )
+    def test_single_byte_tables(self, encoding: SupportedEncoding) -> None:
+        table = char_class_table(encoding)
+        for n in range(256):
+            assert table[n] == char_class(bytes([n]).decode(encoding.value, errors='replace')), hex(n)
+
+    def test_utf_8_table(self) -> None:
+        table = char_class_table(SupportedEncoding.UTF_8)
+        assert table[:0x80] == char_class_table()[:0x80]
+        assert set(table[0x80:]) == {CHAR_MULTIBYTE}
+
+    @pytest.mark.parametrize('encoding', [SupportedEncoding.CP437, SupportedEncoding.UTF_8])
+    @pytest.mark.parametrize('data', SCANNER_PARITY_DATA)
+    def test_tokenise_chars_parity(self, data: str, encoding: SupportedEncoding) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=data,
+            font_name='IBM VGA',
+            encoding=encoding,
+        )
+        assert list(tokeniser.tokenise_chars(data)) == list(reference_tokenise_chars(tokeniser, data))
+
+    def test_tokenise_chars_counts(self) -> None:
+        data = 'ab\x1b[31mba\r\n'
+        tokeniser = Tokeniser(fpath='/test/file.ans', sauce=create_mock_sauce(), data=data, font_name='IBM VGA')
+        log.set_debug(True)
+        try:
+            list(tokeniser.tokenise_chars(data))
+        finally:
+            log.set_debug(False)
+        assert dict(tokeniser.counts) == {
+            ('a', '0x61'): 2,
+            ('b', '0x62'): 2,
+            ('\r', '0xd'): 1,
+            ('\n', '0xa'): 1,
+        }
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestTokeniserStream:
+    'Test that tokenising a stream of byte chunks yields exactly the same tokens as the whole data'
+
+    @pytest.mark.parametrize(
+        'encoding', [SupportedEncoding.CP437, SupportedEncoding.ISO_8859_1, SupportedEncoding.UTF_8]
+    )
+    @pytest.mark.parametrize('data', SCANNER_PARITY_DATA)
+    def test_stream_parity_at_every_split(self, data: str, encoding: SupportedEncoding) -> None:
+        try:
+            raw = data.encode(encoding.value)
+        except UnicodeEncodeError:
+            pytest.skip(f'{data!r} is not encodable as {encoding.value}')
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=b'',
+            font_name='IBM VGA',
+            encoding=encoding,
+        )
+        expected = list(tokeniser.tokenise_chars(data))
+        for i in range(len(raw) + 1):
+            assert list(tokeniser.tokenise_stream([raw[:i], raw[i:]])) == expected, i
+
+    @pytest.mark.parametrize('size', [1, 2, 3, 7])
+    def test_stream_parity_small_chunks(self, size: int) -> None:
+        data = ''.join(SCANNER_PARITY_DATA)
+        raw = data.encode('utf-8')
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=iter(chunked(raw, size)),
+            font_name='IBM VGA',
+            encoding=SupportedEncoding.UTF_8,
+        )
+        assert list(tokeniser.tokenise()) == list(tokeniser.tokenise_chars(data))
+
+    def test_stream_carries_only_the_cut_token(self) -> None:
+        tokeniser = Tokeniser(fpath='/test/file.ans', sauce=create_mock_sauce(), data=b'', font_name='IBM VGA')
+        scan = tokeniser._scan_bytes(b'Hi\n\x1b[3', final=False)
+        tokens = []
+        with pytest.raises(StopIteration) as e:
+            while True:
+                tokens.append(next(scan))
+        assert e.value.value == b'\x1b[3'
+        assert tokens == [CP437Token(value='Hi', offset=tokeniser.glyph_offset), NewLineToken(value='\n')]
+
+
+class TestTokenBuffer:
+    'Test the columnar TokenBuffer made by Tokeniser.tokenise_buffer'
+
+    @pytest.mark.parametrize('ice_colours', [False, True])
+    @pytest.mark.parametrize('encoding', [SupportedEncoding.CP437, SupportedEncoding.UTF_8])
+    @pytest.mark.parametrize('data', SCANNER_PARITY_DATA)
+    def test_buffer_round_trip(self, data: str, encoding: SupportedEncoding, ice_colours: bool) -> None:
+        tokeniser = Tokeniser(
+            fpath='/test/file.ans',
+            sauce=create_mock_sauce(),
+            data=data,
+            font_name='IBM VGA',
+            encoding=encoding,
+            ice_colours=ice_colours,
+        )
+        expected = list(tokeniser.tokenise())
+        buf = tokeniser.tokenise_buffer()
+        assert len(buf) == len(expected)
+        assert list(buf) == expected
+        assert [buf[i] for i in range(len(buf))] == expected
+
+    def test_buffer_columns(self) -> None:
+        buf = TokenBuffer.from_tokens([
+            TextToken(value='Hi'),
+            Color8Token(value='31', params=['31']),
+            NewLineToken(value='\n'),
+        ])
+        assert buf.text == 'Hi31\n'
+        assert list(buf.offsets) == [0, 2, 4, 5]
+        assert list(buf.kinds) == [0, 5, 3]
+        assert buf[-1] == NewLineToken(value='\n')
+
+    def test_buffer_shares_escape_tokens(self) -> None:
+        buf = TokenBuffer.from_tokens([Color8Token(value='31', params=['31']), TextToken(value='Hi')] * 2)
+        first, text, again, _ = buf
+        assert again is first is buf[0]
+        assert text is not buf[1]
+
+    def test_buffer_is_smaller_than_token_list(self) -> None:
+        data = '\x1b[1;31;44m░▒▓█\x1b[5C▄▀■\x1b[0m text\r\n' * 200
+        tokeniser = Tokeniser(fpath='/test/file.ans', sauce=create_mock_sauce(), data=data, font_name='IBM VGA')
+        tracemalloc.start()
+        tokens = list(tokeniser.tokenise())
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        buf = tokeniser.tokenise_buffer()
+        assert buf.nbytes * 5 < held, (buf.nbytes, held, len(tokens))
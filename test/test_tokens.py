@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 'Unit tests for all Token classes in convert.py'
 
-from dataclasses import asdict
+import tracemalloc
+from copy import deepcopy
+from dataclasses import asdict, dataclass, field, fields
+from typing import Callable, ClassVar
+
+import pytest
 
 from ansi_art_convert.convert import (
     ANSI_CONTROL_CODES,
@@ -26,8 +31,28 @@ from ansi_art_convert.convert import (
     TrueColorBGToken,
     TrueColorFGToken,
     UnknownToken,
+    glyph_token_factory,
+    glyph_translation_table,
+    parse_escape_sequence,
+    text_span,
 )
-from ansi_art_convert.font_data import FONT_OFFSETS
+from ansi_art_convert.font_data import FONT_OFFSETS, UNICODE_TO_CP437
+from ansi_art_convert.optimise import SGROptimiser
+from test.helper import GOLDEN_DATA, create_renderer
+
+ALL_TEST_CHARS = ''.join(map(chr, range(0x2600)))
+
+
+def translate_text_per_char(s: str, offset: int) -> str:
+    return ''.join(chr(ord(v) + offset) if ord(v) <= 255 else v for v in s)
+
+
+def translate_cp437_per_char(s: str, offset: int) -> str:
+    new_values = []
+    for v in s:
+        n = UNICODE_TO_CP437.get(ord(v), ord(v))
+        new_values.append(chr(n + offset) if n <= 255 else v)
+    return ''.join(new_values)
 
 
 class TestANSIToken:
@@ -38,22 +63,33 @@ class TestANSIToken:
         expected = {
             'value': 'test',
             'original_value': 'test',
+            'cell_width': 0,
             'value_name': '',
-            'value_map': {},
         }
 
         assert asdict(token) == expected
 
     def test_token_with_value_map(self) -> None:
-        token = ANSIToken(value='A', value_map={'A': 'Letter A'})
+        @dataclass(slots=True)
+        class LetterToken(ANSIToken):
+            value_map: ClassVar[dict] = {'A': 'Letter A'}
+
+        token = LetterToken(value='A')
         expected = {
             'value': 'A',
             'original_value': 'A',
+            'cell_width': 0,
             'value_name': 'Letter A',
-            'value_map': {'A': 'Letter A'},
         }
         assert asdict(token) == expected
 
+    def test_value_map_is_class_level(self) -> None:
+        assert C0Token(value='\r').value_map is C0_TOKEN_NAMES
+        assert ControlToken(value='\x1b[A').value_map is ANSI_CONTROL_CODES
+        assert Color8FGToken(value='31').value_map is COLOUR_8_FG_VALUES
+        assert Color8BGToken(value='41').value_map is COLOUR_8_BG_VALUES
+        assert SGRToken(value='0').value_map is SGR_CODES
+
     def test_token_str(self) -> None:
         result = ANSIToken(value='hello').__str__()
         expected = 'hello'
@@ -70,8 +106,8 @@ class TestTextToken:
             'offset': offset,
             'value': chr(ord('A') + offset),
             'original_value': 'A',
+            'cell_width': 1,
             'value_name': '',
-            'value_map': {},
         }
         assert asdict(token) == expected
 
@@ -81,8 +117,8 @@ class TestTextToken:
             'offset': 0xE100,
             'value': ''.join(chr(ord(c) + 0xE100) for c in 'ABC'),
             'original_value': 'ABC',
+            'cell_width': 3,
             'value_name': '',
-            'value_map': {},
         }
         assert asdict(token) == expected
 
@@ -93,8 +129,8 @@ class TestTextToken:
             'offset': 0xE100,
             'value': '♥',
             'original_value': '♥',
+            'cell_width': 1,
             'value_name': '',
-            'value_map': {},
         }
         assert asdict(token) == expected
 
@@ -104,8 +140,8 @@ class TestTextToken:
             'offset': 0xE100,
             'value': chr(ord('A') + 0xE100) + '♥' + chr(ord('B') + 0xE100),
             'original_value': 'A♥B',
+            'cell_width': 3,
             'value_name': '',
-            'value_map': {},
         }
         assert asdict(token) == expected
 
@@ -115,12 +151,31 @@ class TestTextToken:
             'offset': 0,
             'value': 'ABC',
             'original_value': 'ABC',
+            'cell_width': 3,
             'value_name': '',
-            'value_map': {},
         }
         assert asdict(token) == expected
 
 
+class TestGlyphTranslationTable:
+    'Test the cached str.translate tables against the per-character translation'
+
+    def test_text_table_matches_per_char(self) -> None:
+        for offset in [0, 0xE100, *FONT_OFFSETS.values()]:
+            result = TextToken(value=ALL_TEST_CHARS, offset=offset).value
+            assert result == translate_text_per_char(ALL_TEST_CHARS, offset)
+
+    def test_cp437_table_matches_per_char(self) -> None:
+        for offset in [0, 0xE100, *FONT_OFFSETS.values()]:
+            result = CP437Token(value=ALL_TEST_CHARS, offset=offset).value
+            assert result == translate_cp437_per_char(ALL_TEST_CHARS, offset)
+
+    def test_tables_are_cached(self) -> None:
+        for offset in FONT_OFFSETS.values():
+            assert glyph_translation_table(offset) is glyph_translation_table(offset)
+            assert glyph_translation_table(offset, cp437=True) is glyph_translation_table(offset, cp437=True)
+
+
 class TestC0Token:
     'Test C0 control character tokens'
 
@@ -130,8 +185,8 @@ class TestC0Token:
             expected = {
                 'value': '',
                 'original_value': '\r',
+                'cell_width': 0,
                 'value_name': 'CR',
-                'value_map': C0_TOKEN_NAMES,
                 'offset': offset,
             }
             assert asdict(token) == expected
@@ -170,8 +225,8 @@ class TestCP437Token:
         expected = {
             'value': '☺',  # '☺' is CP437 code 1
             'original_value': '☺',
+            'cell_width': 1,
             'value_name': '',
-            'value_map': {},
             'offset': 0xE100,
         }
         assert asdict(token) == expected
@@ -192,8 +247,8 @@ class TestControlTokenCursorUp:
         expected = {
             'value': 'A',
             'original_value': '\x1b[A',
+            'cell_width': 0,
             'value_name': 'CursorUp',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'A',
         }
         assert asdict(token) == expected
@@ -205,8 +260,8 @@ class TestControlTokenCursorDown:
         expected = {
             'value': '5B',
             'original_value': '\x1b[5B',
+            'cell_width': 0,
             'value_name': 'CursorDown',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'B',
         }
         assert asdict(token) == expected
@@ -216,8 +271,8 @@ class TestControlTokenCursorDown:
         expected = {
             'value': 'C',
             'original_value': '\x1b[C',
+            'cell_width': 1,
             'value_name': 'CursorForward',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'C',
         }
         assert asdict(token) == expected
@@ -228,8 +283,8 @@ class TestControlTokenCursorDown:
         expected = {
             'value': '1C',
             'original_value': '\x1b[1C',
+            'cell_width': 1,
             'value_name': 'CursorForward',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'C',
         }
         assert asdict(token) == expected
@@ -240,8 +295,8 @@ class TestControlTokenCursorDown:
         expected = {
             'value': '10C',
             'original_value': '\x1b[10C',
+            'cell_width': 10,
             'value_name': 'CursorForward',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'C',
         }
         assert asdict(token) == expected
@@ -252,8 +307,8 @@ class TestControlTokenCursorDown:
         expected = {
             'value': '1000C',
             'original_value': '\x1b[1000C',
+            'cell_width': 1000,
             'value_name': 'CursorForward',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'C',
         }
         assert asdict(token) == expected
@@ -266,8 +321,8 @@ class TestControlTokenCursorPosition:
         expected = {
             'value': '10;20H',
             'original_value': '\x1b[10;20H',
+            'cell_width': 1,
             'value_name': 'CursorPosition',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'H',
         }
         assert asdict(token) == expected
@@ -280,8 +335,8 @@ class TestControlTokenEraseInLine:
         expected = {
             'value': 'K',
             'original_value': '\x1b[K',
+            'cell_width': 0,
             'value_name': 'EraseInLine',
-            'value_map': ANSI_CONTROL_CODES,
             'subtype': 'K',
         }
         assert asdict(token) == expected
@@ -295,8 +350,8 @@ class TestTrueColorTokens:
         expected = {
             'value': '255,128,64',
             'original_value': '255,128,64',
+            'cell_width': 0,
             'value_name': '',
-            'value_map': {},
             'colour_type': ColourType.FG,
         }
         assert asdict(token) == expected
@@ -307,8 +362,8 @@ class TestTrueColorTokens:
         expected = {
             'value': '0,128,255',
             'original_value': '0,128,255',
+            'cell_width': 0,
             'value_name': '',
-            'value_map': {},
             'colour_type': ColourType.BG,
         }
         assert asdict(token) == expected
@@ -331,8 +386,8 @@ class TestColor256Tokens:
         expected = {
             'value': '42',
             'original_value': '42',
+            'cell_width': 0,
             'value_name': '',
-            'value_map': {},
             'colour_type': ColourType.FG,
         }
         assert asdict(token) == expected
@@ -343,8 +398,8 @@ class TestColor256Tokens:
         expected = {
             'value': '196',
             'original_value': '196',
+            'cell_width': 0,
             'value_name': '',
-            'value_map': {},
             'colour_type': ColourType.BG,
         }
         assert asdict(token) == expected
@@ -367,8 +422,8 @@ class TestColor8FGToken:
         expected = {
             'value': '31',
             'original_value': '31',
+            'cell_width': 0,
             'value_name': 'red',
-            'value_map': COLOUR_8_FG_VALUES,
             'colour_type': ColourType.FG,
             'bright': False,
         }
@@ -380,8 +435,8 @@ class TestColor8FGToken:
         expected = {
             'value': '34',
             'original_value': '34',
+            'cell_width': 0,
             'value_name': 'blue',
-            'value_map': COLOUR_8_FG_VALUES,
             'colour_type': ColourType.FG,
             'bright': False,
         }
@@ -393,8 +448,8 @@ class TestColor8FGToken:
         expected = {
             'value': '91',
             'original_value': '91',
+            'cell_width': 0,
             'value_name': 'bright_red',
-            'value_map': COLOUR_8_FG_VALUES,
             'colour_type': ColourType.FG,
             'bright': False,
         }
@@ -407,8 +462,8 @@ class TestColor8FGToken:
         expected = {
             'value': '91',  # 31 + 60 = 91
             'original_value': '31',
+            'cell_width': 0,
             'value_name': 'red',  # value_name is set before transformation
-            'value_map': COLOUR_8_FG_VALUES,
             'colour_type': ColourType.FG,
             'bright': True,
         }
@@ -430,8 +485,8 @@ class TestColor8BGToken:
         expected = {
             'value': '41',
             'original_value': '41',
+            'cell_width': 0,
             'value_name': 'red',
-            'value_map': COLOUR_8_BG_VALUES,
             'colour_type': ColourType.BG,
             'ice_colours': False,
         }
@@ -443,8 +498,8 @@ class TestColor8BGToken:
         expected = {
             'value': '44',
             'original_value': '44',
+            'cell_width': 0,
             'value_name': 'blue',
-            'value_map': COLOUR_8_BG_VALUES,
             'colour_type': ColourType.BG,
             'ice_colours': False,
         }
@@ -457,8 +512,8 @@ class TestColor8BGToken:
         expected = {
             'value': '101',  # 41 + 60 = 101
             'original_value': '41',
+            'cell_width': 0,
             'value_name': 'red',  # value_name is set before transformation
-            'value_map': COLOUR_8_BG_VALUES,
             'colour_type': ColourType.BG,
             'ice_colours': True,
         }
@@ -479,8 +534,8 @@ class TestColor8Token:
             'bright': False,
             'colour_type': ColourType.FG,
             'original_value': '31',
+            'cell_width': 0,
             'value': '31',
-            'value_map': COLOUR_8_FG_VALUES,
             'value_name': 'red',
         }
         expected = {
@@ -490,11 +545,11 @@ class TestColor8Token:
             'fg_token': expected_fg,
             'ice_colours': False,
             'original_value': '31',
+            'cell_width': 0,
             'params': ['31'],
-            'sgr_tokens': [],
-            'tokens': [expected_fg],
+            'sgr_tokens': (),
+            'tokens': (expected_fg,),
             'value': '31',
-            'value_map': {},
             'value_name': '',
         }
         assert asdict(token) == expected
@@ -505,8 +560,8 @@ class TestColor8Token:
             'colour_type': ColourType.BG,
             'ice_colours': False,
             'original_value': '44',
+            'cell_width': 0,
             'value': '44',
-            'value_map': COLOUR_8_BG_VALUES,
             'value_name': 'blue',
         }
         expected = {
@@ -516,11 +571,11 @@ class TestColor8Token:
             'fg_token': None,
             'ice_colours': False,
             'original_value': '44',
+            'cell_width': 0,
             'params': ['44'],
-            'sgr_tokens': [],
-            'tokens': [expected_bg],
+            'sgr_tokens': (),
+            'tokens': (expected_bg,),
             'value': '44',
-            'value_map': {},
             'value_name': '',
         }
         assert asdict(token) == expected
@@ -531,16 +586,16 @@ class TestColor8Token:
             'colour_type': ColourType.BG,
             'ice_colours': False,
             'original_value': '44',
+            'cell_width': 0,
             'value': '44',
-            'value_map': COLOUR_8_BG_VALUES,
             'value_name': 'blue',
         }
         expected_fg = {
             'bright': False,
             'colour_type': ColourType.FG,
             'original_value': '31',
+            'cell_width': 0,
             'value': '31',
-            'value_map': COLOUR_8_FG_VALUES,
             'value_name': 'red',
         }
 
@@ -551,11 +606,11 @@ class TestColor8Token:
             'fg_token': expected_fg,
             'ice_colours': False,
             'original_value': '31;44',
+            'cell_width': 0,
             'params': ['31', '44'],
-            'sgr_tokens': [],
-            'tokens': [expected_fg, expected_bg],
+            'sgr_tokens': (),
+            'tokens': (expected_fg, expected_bg),
             'value': '31;44',
-            'value_map': {},
             'value_name': '',
         }
 
@@ -566,16 +621,16 @@ class TestColor8Token:
         expected_fg = {
             'value': '91',
             'original_value': '31',
+            'cell_width': 0,
             'value_name': 'red',
-            'value_map': COLOUR_8_FG_VALUES,
             'colour_type': ColourType.FG,
             'bright': True,
         }
         expected_sgr = {
             'value': '1',
             'original_value': '1',
+            'cell_width': 0,
             'value_name': 'Bold',
-            'value_map': SGR_CODES,
         }
         expected = {
             'bg_token': None,
@@ -584,11 +639,11 @@ class TestColor8Token:
             'fg_token': expected_fg,
             'ice_colours': False,
             'original_value': '1;31',
+            'cell_width': 0,
             'params': ['1', '31'],
-            'sgr_tokens': [expected_sgr],
-            'tokens': [expected_sgr, expected_fg],
+            'sgr_tokens': (expected_sgr,),
+            'tokens': (expected_sgr, expected_fg),
             'value': '1;31',
-            'value_map': {},
             'value_name': '',
         }
         assert asdict(token) == expected
@@ -598,8 +653,8 @@ class TestColor8Token:
         expected_sgr = {
             'value': '0',
             'original_value': '0',
+            'cell_width': 0,
             'value_name': 'Reset',
-            'value_map': SGR_CODES,
         }
         expected: dict = {
             'bg_token': None,
@@ -608,11 +663,11 @@ class TestColor8Token:
             'fg_token': None,
             'ice_colours': False,
             'original_value': '0',
+            'cell_width': 0,
             'params': ['0'],
-            'sgr_tokens': [expected_sgr],
-            'tokens': [expected_sgr],
+            'sgr_tokens': (expected_sgr,),
+            'tokens': (expected_sgr,),
             'value': '0',
-            'value_map': {},
             'value_name': '',
         }
         assert asdict(token) == expected
@@ -623,15 +678,15 @@ class TestColor8Token:
         expected_sgr = {
             'value': '1',
             'original_value': '1',
+            'cell_width': 0,
             'value_name': 'Bold',
-            'value_map': SGR_CODES,
         }
         expected_bg = {
             'colour_type': ColourType.BG,
             'ice_colours': True,
             'original_value': '44',
+            'cell_width': 0,
             'value': '104',  # 44 + 60 = 104 (ice colours bright)
-            'value_map': COLOUR_8_BG_VALUES,
             'value_name': 'blue',
         }
         expected = {
@@ -641,11 +696,11 @@ class TestColor8Token:
             'fg_token': None,
             'ice_colours': True,
             'original_value': '1;5;44',
+            'cell_width': 0,
             'params': ['1', '5', '44'],
-            'sgr_tokens': [expected_sgr],
-            'tokens': [expected_sgr, expected_bg],
+            'sgr_tokens': (expected_sgr,),
+            'tokens': (expected_sgr, expected_bg),
             'value': '1;5;44',
-            'value_map': {},
             'value_name': '',
         }
         assert asdict(token) == expected
@@ -657,14 +712,12 @@ class TestColor8Token:
             Color8FGToken(
                 value='31',
                 value_name='red',
-                value_map=COLOUR_8_FG_VALUES,
                 colour_type=ColourType.FG,
                 bright=False,
             ),
             Color8BGToken(
                 value='44',
                 value_name='blue',
-                value_map=COLOUR_8_BG_VALUES,
                 colour_type=ColourType.BG,
                 ice_colours=False,
             ),
@@ -678,19 +731,16 @@ class TestColor8Token:
             SGRToken(
                 value='0',
                 value_name='Reset',
-                value_map=SGR_CODES,
             ),
             Color8FGToken(
                 value='37',
                 value_name='white',
-                value_map=COLOUR_8_FG_VALUES,
                 colour_type=ColourType.FG,
                 bright=False,
             ),
             Color8BGToken(
                 value='40',
                 value_name='black',
-                value_map=COLOUR_8_BG_VALUES,
                 colour_type=ColourType.BG,
                 ice_colours=False,
             ),
@@ -710,8 +760,8 @@ class TestSGRToken:
         expected = {
             'value': '0',
             'original_value': '0',
+            'cell_width': 0,
             'value_name': 'Reset',
-            'value_map': SGR_CODES,
         }
         assert asdict(token) == expected
         assert str(token) == '\x1b[0m'
@@ -721,8 +771,8 @@ class TestSGRToken:
         expected = {
             'value': '1',
             'original_value': '1',
+            'cell_width': 0,
             'value_name': 'Bold',
-            'value_map': SGR_CODES,
         }
         assert asdict(token) == expected
         assert str(token) == '\x1b[1m'
@@ -770,3 +820,172 @@ class TestUnknownToken:
     def test_unknown_token(self) -> None:
         token = UnknownToken(value='\x1b[999Z')
         assert token.value == '\x1b[999Z'
+
+
+@dataclass(slots=True)
+class TaggedTextToken(TextToken):
+    'A TextToken subclass with fields of its own'
+
+    tag: str = 'plain'
+    notes: list[str] = field(default_factory=list)
+
+
+def field_values(token: ANSIToken) -> dict:
+    return {f.name: getattr(token, f.name) for f in fields(token)}
+
+
+class TestFromParts:
+    'Test tokens built by _from_parts (text_span, glyph_token_factory) set every field a constructed token has'
+
+    VALUE = 'A♥B░▒\x7f'
+
+    @pytest.mark.parametrize('cls', [TextToken, CP437Token, C0Token, TaggedTextToken])
+    def test_fields_match_constructor(self, cls: type[TextToken | CP437Token]) -> None:
+        built = cls(value=self.VALUE[:1] if cls is C0Token else self.VALUE, offset=0xE100)
+        token = cls._from_parts(built.value, built.original_value, built.offset, built.value_name)
+        assert type(token) is cls
+        assert field_values(token) == field_values(built)
+
+    @pytest.mark.parametrize('cls', [TextToken, CP437Token, TaggedTextToken])
+    def test_glyph_token_factory(self, cls: type[TextToken | CP437Token]) -> None:
+        token = glyph_token_factory(cls, 0xE100)(self.VALUE)
+        assert type(token) is cls
+        assert field_values(token) == field_values(cls(value=self.VALUE, offset=0xE100))
+
+    @pytest.mark.parametrize('cls', [TextToken, CP437Token])
+    def test_text_span(self, cls: type[TextToken | CP437Token]) -> None:
+        span = text_span(cls(value=self.VALUE, offset=0xE100), 1, 4)
+        assert field_values(span) == field_values(cls(value=self.VALUE[1:4], offset=0xE100))
+
+    def test_text_span_keeps_subclass_fields(self) -> None:
+        token = TaggedTextToken(value=self.VALUE, offset=0xE100, tag='marked', notes=['a note'])
+        span = text_span(token, 1, 4)
+        assert type(span) is TaggedTextToken
+        assert (span.tag, span.notes) == ('marked', ['a note'])
+        assert span.value == token.value[1:4]
+
+    def test_defaults_are_not_shared(self) -> None:
+        a, b = (TaggedTextToken._from_parts('x', 'x', 0xE100) for _ in range(2))
+        assert a.notes == b.notes == []
+        assert a.notes is not b.notes
+
+
+class TestCellWidth:
+    'Test the cell width cached on each token matches its rendered length'
+
+    TOKENS: ClassVar[list[ANSIToken]] = [
+        TextToken(value='ABC', offset=0xE100),
+        TextToken(value='A♥B', offset=0xE100),
+        CP437Token(value='░▒▓', offset=0xE100),
+        C0Token(value='\t', offset=0xE100),
+        C0Token(value='\r', offset=0xE100),
+        ControlToken(value='\x1b[C'),
+        ControlToken(value='\x1b[25C'),
+        ControlToken(value='\x1b[-5C'),
+        ControlToken(value='\x1b[10;20H'),
+        ControlToken(value='\x1b[5A'),
+        ControlToken(value='\x1b[s'),
+    ]
+
+    def test_cell_width_matches_str(self) -> None:
+        for token in self.TOKENS:
+            assert token.cell_width == len(str(token)), token
+
+    def test_cell_width_is_not_compared(self) -> None:
+        token = ControlToken(value='\x1b[25C')
+        other = ControlToken(value='\x1b[25C')
+        other.cell_width = 0
+        assert token == other
+
+    def test_malformed_cursor_forward(self) -> None:
+        token = ControlToken(value='\x1b[1;2C')
+        assert token.cell_width == 0
+
+    def test_negative_cursor_forward(self) -> None:
+        token = ControlToken(value='\x1b[-5C')
+        assert token.cell_width == len(str(token)) == 0
+
+
+def bytes_per_token(factory: Callable[[], object], n: int = 2000) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tokens = [factory() for _ in range(n)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(tokens) == n
+    return (after - before) / n
+
+
+class DictToken:
+    'A token as it was before slots, with its fields in an instance __dict__'
+
+
+def dict_token(token: ANSIToken) -> DictToken:
+    obj = DictToken()
+    obj.__dict__.update({f.name: getattr(token, f.name) for f in fields(token)}, value_map=token.value_map)
+    return obj
+
+
+class TestTokenMemory:
+    'Test per-token memory of the slotted token classes'
+
+    TOKEN_FACTORIES: ClassVar[dict[str, Callable[[], ANSIToken]]] = {
+        'CP437Token': lambda: CP437Token(value='AB', offset=0xE800),
+        'TextToken': lambda: TextToken(value='AB', offset=0xE800),
+        'Color8FGToken': lambda: Color8FGToken(value='31'),
+        'SGRToken': lambda: SGRToken(value='0'),
+        'NewLineToken': lambda: NewLineToken(value='\n'),
+        'ControlToken': lambda: ControlToken(value='\x1b[5C'),
+    }
+
+    def test_tokens_have_no_instance_dict(self) -> None:
+        for factory in self.TOKEN_FACTORIES.values():
+            assert not hasattr(factory(), '__dict__')
+
+    def test_bytes_per_token(self) -> None:
+        # bytes per token (including its list slot and value strings) measured with tracemalloc, against the same
+        # field values held in an instance __dict__
+        for name, factory in self.TOKEN_FACTORIES.items():
+            slotted = bytes_per_token(factory)
+            with_dict = bytes_per_token(lambda: dict_token(factory()))  # noqa: B023 (called before the next loop)
+            assert slotted < with_dict / 2, name
+
+
+class TestSharedTokens:
+    'Test the flyweight factories for 8-colour and SGR tokens'
+
+    def test_shared_tokens_are_interned(self) -> None:
+        assert Color8FGToken.shared('31', True) is Color8FGToken.shared('31', True)
+        assert Color8BGToken.shared('41', True) is Color8BGToken.shared('41', True)
+        assert SGRToken.shared('0') is SGRToken.shared('0')
+        assert Color8FGToken.shared('31', True) is not Color8FGToken.shared('31', False)
+
+    def test_shared_tokens_equal_constructed_tokens(self) -> None:
+        assert Color8FGToken.shared('31', True) == Color8FGToken(value='31', bright=True)
+        assert Color8BGToken.shared('41', True) == Color8BGToken(value='41', ice_colours=True)
+        assert SGRToken.shared('0') == SGRToken(value='0')
+
+    def test_generate_tokens_reuses_shared_tokens(self) -> None:
+        first = list(Color8Token(value='1;31;44', params=['1', '31', '44']).generate_tokens(None, None))
+        second = list(Color8Token(value='1;31;44', params=['1', '31', '44']).generate_tokens(None, None))
+        assert first == second
+        assert all(a is b for a, b in zip(first, second))
+
+    @pytest.mark.parametrize('ice_colours', [False, True])
+    def test_rendering_does_not_mutate_shared_tokens(self, ice_colours: bool) -> None:
+        # the flyweights are shared by every caller, so no render path may modify them in place
+        shared = [Color8FGToken.shared(v, b) for v in COLOUR_8_FG_VALUES for b in (False, True)]
+        shared += [Color8BGToken.shared(v, i) for v in COLOUR_8_BG_VALUES for i in (False, True)]
+        shared += [SGRToken.shared(v) for v in SGR_CODES]
+        shared += [
+            t
+            for code in ('1;31;44', '1;5;41', '0', '5;41', '1;33;44')
+            for t in parse_escape_sequence(code, ice_colours)
+        ]
+        expected = deepcopy(shared)
+        for data in GOLDEN_DATA:
+            for renderer_kwargs in ({}, {'coalesce': True}, {'optimiser': SGROptimiser()}):
+                create_renderer(
+                    data, tokeniser_kwargs={'ice_colours': ice_colours}, renderer_kwargs=renderer_kwargs
+                ).render()
+        assert shared == expected